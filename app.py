@@ -1,88 +1,205 @@
 from src.VectorsFromTabularData import PrepareVectorDBFromTabularData
 from src.AIModels import AIModels
 from src.VectorDB import VectorDB
+from src.LocalVectorDB import LocalVectorDB
 from src.RAGTabularDataAgent import RAGTabularDataAgent
 from src.SQLDBFromTabularData import PrepareSQLFromTabularData
 from src.TextToSQLAgent import TextToSQLAgent
 from src.SQLDB import SQLDB
 from src.SQLAgent import SQLAgent
 from src.LoadConfig import LoadConfig
+from src.EmbeddingEngine import EmbeddingEngine
+from src.AnswerCache import AnswerCache
+from src.IngestManifest import IngestManifest
+from src.ParquetStaging import ParquetStaging
+from src.EntityExtractor import EntityExtractor
+from src.SQLPlanCache import SQLPlanCache
+from src.ContextBuilder import ContextBuilder
 
 import os
+import asyncio
 from dotenv import load_dotenv
 
-def create_vectordb(rerank: bool= False):
+def new_vectordb(rerank: bool= False):
+    # VECTOR_STORE=local keeps the collection in process, in a local directory, instead of Milvus
+    if os.getenv("VECTOR_STORE", "milvus") == "local":
+        return LocalVectorDB(os.getenv("LOCAL_VECTORDB_DIR", "vectordb"), rerank= rerank,
+                             reranker= os.getenv("RERANKER", "cohere"),
+                             nprobe= int(os.getenv("LOCAL_VECTORDB_NPROBE", 8)),
+                             ivf_min_rows= int(os.getenv("LOCAL_VECTORDB_IVF_MIN_ROWS", 50000)),
+                             quantization= os.getenv("LOCAL_VECTORDB_QUANTIZATION") or None,
+                             rescore= int(os.getenv("LOCAL_VECTORDB_RESCORE", 4)))
+    # The quantized search, re-scored with the float32 vectors, is only available in the local store
+    if os.getenv("MILVUS_VECTOR_TYPE", "float") != "float":
+        raise ValueError("Milvus stores float32 vectors, use VECTOR_STORE=local with LOCAL_VECTORDB_QUANTIZATION=float16 "
+                         "to search quantized vectors")
+    return VectorDB(os.getenv("MILVUS_URI"), os.getenv("MILVUS_TOKEN"), rerank= rerank,
+                    insert_workers= int(os.getenv("MILVUS_INSERT_WORKERS", 4)),
+                    insert_batch_bytes= int(os.getenv("MILVUS_INSERT_BATCH_BYTES", 8 * 1024**2)),
+                    reranker= os.getenv("RERANKER", "cohere"))
+
+def create_vectordb(rerank: bool= False, drop_existing: bool= True):
     # Create the vector database
-    vectordb= VectorDB(os.getenv("MILVUS_URI"), os.getenv("MILVUS_TOKEN"), rerank= rerank)
+    vectordb= new_vectordb(rerank)
     vectordb.load_milvus_client()
-    # Create the collection
-    vectordb.prepare_vectordb(os.getenv("COLLECTION_NAME"), int(os.getenv("EMBEDDINGS_DIM")))
+    # Create the collection, keep the existing one if it is going to be synced incrementally
+    vectordb.prepare_vectordb(os.getenv("COLLECTION_NAME"), int(os.getenv("EMBEDDINGS_DIM")), drop_existing)
 
     return vectordb
 
 def load_collection_vectordb(rerank: bool= False):
     # Create the vector database
-    vectordb= VectorDB(os.getenv("MILVUS_URI"), os.getenv("MILVUS_TOKEN"), rerank= rerank)
+    vectordb= new_vectordb(rerank)
     # Load the collection
     vectordb.load_milvus_client()
     vectordb.load_milvus_collection(os.getenv("COLLECTION_NAME"))
 
     return vectordb
 
-def process_docs_to_vectordb(models: AIModels, datafiles: list, vectordb: VectorDB, limit: int= 100, batch_size: int= 25):
+def create_embedding_engine(models: AIModels):
+    # Batch the embedding requests by token budget and send several of them concurrently
+    return EmbeddingEngine(models.embeddings_model, os.getenv("EMBEDDINGS_MODEL"),
+                           max_batch_tokens= int(os.getenv("EMBEDDINGS_BATCH_TOKENS", 100000)),
+                           max_workers= int(os.getenv("EMBEDDINGS_MAX_WORKERS", 4)),
+                           max_retries= int(os.getenv("EMBEDDINGS_MAX_RETRIES", 5)),
+                           cache= models.embeddings_cache)
+
+def create_staging(datafiles: list= None):
+    # Parse every datafile once into a Parquet file shared by the SQL and the vector pipelines
+    staging_dir= os.getenv("STAGING_DIR", "staging")
+    if not staging_dir:
+        return None
+    if not ParquetStaging.is_available():
+        print("The Parquet staging is disabled, pyarrow is not installed. The datafiles are read from the CSV files")
+        return None
+    return ParquetStaging(staging_dir, os.getenv("CSV_SEP"), os.getenv("CSV_CODEC"), os.getenv("CSV_DECIMAL", ","),
+                          datafiles= datafiles)
+
+def process_docs_to_vectordb(models: AIModels, datafiles: list, vectordb: VectorDB, limit: int= 100, batch_size: int= 25,
+                             incremental: bool= False):
     prepdata= PrepareVectorDBFromTabularData(os.getenv("DATA_DIR"), os.getenv("COLLECTION_NAME"), 
-                                             os.getenv("CSV_CODEC"), os.getenv("CSV_SEP"), models.embeddings_model, vectordb)
-
-    prepdata.load_data(datafiles, limit, batch_size)
+                                             os.getenv("CSV_CODEC"), os.getenv("CSV_SEP"), models.embeddings_model, vectordb,
+                                             create_embedding_engine(models), 
+                                             os.getenv("VECTORDB_MANIFEST", "vectordb_manifest.json"),
+                                             os.getenv("ROW_TEMPLATE", "json"), int(os.getenv("CHUNK_MAX_TOKENS", 8000)),
+                                             int(os.getenv("INGEST_WORKERS", 1)), create_staging(datafiles))
+    # Pack the rows of every group into chunks by size, or in batches of batch_size rows
+    chunk_mode= os.getenv("CHUNK_MODE", "adaptive")
+
+    if incremental:
+        # Only load the partitions of the files that changed since the last sync
+        prepdata.sync_data(datafiles, batch_size, chunk_mode)
+    else:
+        prepdata.load_data(datafiles, limit, batch_size, chunk_mode)
     #prepdata.test_load()
 
 
     return vectordb
 
 def prepare_rag_db(models: AIModels, file_descriptions: list, limit: int= 100, batch_size: int= 25, 
-                   create_collection: bool=False, rerank: bool= False):
+                   create_collection: bool=False, rerank: bool= False, incremental: bool= False):
     # If we want to create a new collection
     if create_collection:
-        # Create the vector database
-        vectordb= create_vectordb(rerank= rerank)
+        # Create the vector database, an incremental sync keeps the existing collection
+        vectordb= create_vectordb(rerank= rerank, drop_existing= not incremental)
     else:
         # Load the collection
         vectordb= load_collection_vectordb(rerank= rerank)
 
     # Process the documents to the vector database
-    process_docs_to_vectordb(models, file_descriptions, vectordb, limit, batch_size)
+    process_docs_to_vectordb(models, file_descriptions, vectordb, limit, batch_size, incremental)
 
     return vectordb
     
-def question_answer(question: str, vectordb: VectorDB, models: AIModels):
+def create_answer_cache():
+    # Cache the answers of the RAG agent, cleared when the collection is ingested again
+    manifest_path= os.getenv("VECTORDB_MANIFEST", "vectordb_manifest.json")
+    collection_name= os.getenv("COLLECTION_NAME")
+    return AnswerCache(int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000)), float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+                       float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.97)),
+                       generation= IngestManifest.generation_reader(manifest_path, collection_name))
+
+def create_entity_extractor(vectordb: VectorDB):
+    # Filter the searches by the provinces, years and months named in the questions
+    if os.getenv("ENTITY_FILTER", "true").lower() != "true":
+        return None
+    return EntityExtractor.from_vectordb(vectordb, os.getenv("COLLECTION_NAME"))
+
+def create_context_builder():
+    # The retrieved documents are written in the prompt as compact tables unless RAG_CONTEXT_COMPACT is false
+    if os.getenv("RAG_CONTEXT_COMPACT", "true").lower() != "true":
+        return None
+    return ContextBuilder(int(os.getenv("RAG_CONTEXT_MAX_TOKENS", 4000)), os.getenv("OPENAI_MODEL"))
+
+def create_rag_agent(vectordb: VectorDB, models: AIModels, answer_cache: AnswerCache= None,
+                     entity_extractor: EntityExtractor= None):
+    return RAGTabularDataAgent(os.getenv("RAG_LLM_SYSTEM_ROLE"), os.getenv("COLLECTION_NAME"), 
+            models.embeddings_model, models.langchain_llm, vectordb, models.embeddings_cache, answer_cache,
+            entity_extractor, context_builder= create_context_builder())
+
+def question_answer(question: str, vectordb: VectorDB, models: AIModels, answer_cache: AnswerCache= None,
+                    entity_extractor: EntityExtractor= None):
 
     search_params = {"metric_type": "COSINE"}
-    rag_agent= RAGTabularDataAgent(os.getenv("RAG_LLM_SYSTEM_ROLE"), os.getenv("COLLECTION_NAME"), 
-            models.embeddings_model, models.langchain_llm, vectordb)
+    rag_agent= create_rag_agent(vectordb, models, answer_cache, entity_extractor)
     response,chat= rag_agent.respond(question, search_params, topk= 5)
 
     print(response)
     return response, chat
 
-def load_csv_to_sqldb():
+async def answer_many(agent, questions: list, max_concurrency: int= 8, **kwargs) -> list:
+    # Answer the questions concurrently in the event loop, with at most max_concurrency of them in flight.
+    # The agent is any of RAGTabularDataAgent, SQLAgent or TextToSQLAgent, kwargs are passed to its arespond.
+    # Every question is answered with its own chat history, the history of the agent is not changed
+    semaphore= asyncio.Semaphore(max_concurrency)
+
+    async def answer(question: str):
+        async with semaphore:
+            response, chat= await agent.arespond(question, **kwargs)
+            return response
+
+    return await asyncio.gather(*(answer(question) for question in questions))
+
+def create_sqldb():
+    # The SQL written by the agents runs with the guardrails unless SQL_GUARD is false
+    return SQLDB(os.getenv("DB_DIR"), guarded= os.getenv("SQL_GUARD", "true").lower() == "true",
+                 max_rows= int(os.getenv("SQL_MAX_ROWS", 1000)), timeout= float(os.getenv("SQL_TIMEOUT", 10)),
+                 max_scan_rows= int(os.getenv("SQL_MAX_SCAN_ROWS", 1000000)))
+
+def create_sql_plan_cache(sql_database: SQLDB):
+    # Reuse the SQL queries of the TextToSQL agent for the questions of the same shape
+    if os.getenv("SQL_PLAN_CACHE", "true").lower() != "true":
+        return None
+    return SQLPlanCache.from_engine(sql_database.engine, max_entries= int(os.getenv("SQL_PLAN_CACHE_MAX_ENTRIES", 1000)),
+                                    path= os.getenv("SQL_PLAN_CACHE_PATH", "sql_plan_cache.json"))
+
+def load_csv_to_sqldb(datafiles: list= None, incremental: bool= False):
     prepdata= PrepareSQLFromTabularData(os.getenv("DATA_DIR"), os.getenv("DB_DIR"), 
-                                            os.getenv("CSV_CODEC"), os.getenv("CSV_SEP"))
-
-    prepdata.run_pipeline(100)
+                                            os.getenv("CSV_CODEC"), os.getenv("CSV_SEP"), datafiles,
+                                            os.getenv("CSV_DECIMAL", ","), int(os.getenv("SQL_CHUNK_SIZE", 100000)),
+                                            int(os.getenv("INGEST_WORKERS", 1)), create_staging(datafiles))
+    # By default every row is loaded, the agents answer over the whole tables
+    prepdata.run_pipeline(int(os.getenv("SQL_LOAD_LIMIT", 0)), sync= incremental)
 
 def load_models():
     models= AIModels(os.getenv("OPENAI_MODEL"),os.getenv("EMBEDDINGS_MODEL"),os.getenv("TEMPERATURE"), os.getenv("MAX_TOKENS"))
     models.load_openai_models()
+    # Cache the embeddings on disk, so unchanged rows and repeated questions are not embedded again
+    models.load_embeddings_cache(os.getenv("EMBEDDINGS_CACHE_PATH", "embeddings_cache.db"), int(os.getenv("EMBEDDINGS_DIM")),
+                                 int(os.getenv("EMBEDDINGS_CACHE_MAX_ENTRIES", 1000000)))
 
     return models
 
 def run_text_to_sql_agent():
-    agent_sql= TextToSQLAgent(os.getenv("DB_DIR"), os.getenv("AGENT_LLM_SYSTEM_ROLE"), models.langchain_llm)
+    # Create a SQL Database engine, with the table info computed once
+    sql_database= create_sqldb()
+    agent_sql= TextToSQLAgent(sql_database.db, os.getenv("AGENT_LLM_SYSTEM_ROLE"), models.langchain_llm,
+                              create_sql_plan_cache(sql_database), os.getenv("SQL_PLAN_ANSWER", "llm"))
     response,chat= agent_sql.respond("¿Cuantos turistas visitaron la ciudad de A coruña en el año 2019?")
 
 def run_sql_agent():
     # Create a SQL Database engine
-    sql_database= SQLDB(os.getenv("DB_DIR"))
+    sql_database= create_sqldb()
     # Create the SQL Agent
     sql_agent= SQLAgent(sql_database.db, os.getenv("AGENT_LLM_SYSTEM_ROLE"), models.langchain_llm)
     # Query the database
@@ -99,24 +216,20 @@ if __name__ == "__main__":
     # Load the models   
     models= load_models()
 
-    # Create the vector database
-    vectordb= prepare_rag_db(models, file_descriptions, 2000, 25, True, False)
+    # Create the vector database, or sync it incrementally with the datafiles
+    incremental= os.getenv("INCREMENTAL_INGEST", "false").lower() == "true"
+    vectordb= prepare_rag_db(models, file_descriptions, 2000, 25, True, False, incremental)
+    answer_cache= create_answer_cache()
+    entity_extractor= create_entity_extractor(vectordb)
     
-    # Set the question
-    question= "¿Cuantos viviendas turísticas existían en la provincia de Albacete en Agosto del año 2020?"
-    # Get the response
-    response, chat= question_answer(question, vectordb, models)
-    print(response)
-
-    # Set the question
-    #question= "¿Cual fue el gasto medio de los turistas de tipo Internacional en A coruña en el año 2019?"
-    question= "¿Cual fue el gasto de los turistas de tipo Nacional en La Rioja en Febrero del año 2019?"
-    # Get the response
-    response, chat= question_answer(question, vectordb, models)
-    print(response)
-
-    # Set the question
-    question= "¿Cuantos turistas visitaron la ciudad de A coruña en Septiembre del año 2019?"
-    # Get the response
-    response, chat= question_answer(question, vectordb, models)
-    print(response)
+    # Answer the questions concurrently
+    questions= ["¿Cuantos viviendas turísticas existían en la provincia de Albacete en Agosto del año 2020?",
+                #"¿Cual fue el gasto medio de los turistas de tipo Internacional en A coruña en el año 2019?",
+                "¿Cual fue el gasto de los turistas de tipo Nacional en La Rioja en Febrero del año 2019?",
+                "¿Cuantos turistas visitaron la ciudad de A coruña en Septiembre del año 2019?"]
+    rag_agent= create_rag_agent(vectordb, models, answer_cache, entity_extractor)
+    responses= asyncio.run(answer_many(rag_agent, questions, int(os.getenv("MAX_CONCURRENCY", 8)),
+                                       search_params= {"metric_type": "COSINE"}, topk= 5))
+    for question, response in zip(questions, responses):
+        print(question)
+        print(response)
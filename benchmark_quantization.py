@@ -0,0 +1,74 @@
+from src.LocalVectorDB import LocalVectorDB
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+def load_vectors(collection_dir: str, rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    # The embeddings of an existing LocalVectorDB collection, or synthetic clustered embeddings
+    if collection_dir:
+        vectors = np.load(os.path.join(collection_dir, "vectors.npy"), mmap_mode="r")
+        return np.array(vectors[:rows] if rows else vectors)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, rows)] + 0.5 * rng.normal(size=(rows, dim))).astype(np.float32)
+
+def exact_topk(vectors: np.ndarray, queries: np.ndarray, topk: int) -> np.ndarray:
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = vectors @ queries.T
+    return np.argsort(-scores, axis=0)[:topk].T
+
+def run(vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, topk: int, quantization: str, rescore: int,
+        ivf_min_rows: int, nprobe: int) -> dict:
+    with tempfile.TemporaryDirectory() as uri:
+        vectordb = LocalVectorDB(uri, quantization=quantization, rescore=rescore, ivf_min_rows=ivf_min_rows,
+                                 nprobe=nprobe)
+        vectordb.load_milvus_client()
+        vectordb.prepare_vectordb("benchmark", vectors.shape[1])
+        vectordb.insert("benchmark", {"row_embedding": vectors})
+        vectordb.flush("benchmark")
+        collection = vectordb.collections["benchmark"]
+        memory = (collection["quantized"]["codes"].nbytes if quantization else collection["vectors"].nbytes)
+
+        t0 = time.time()
+        hits = vectordb.search("benchmark", queries, topk, {})
+        seconds = time.time() - t0
+    # The row ids start at 1
+    recall = np.mean([len({hit.row_id - 1 for hit in query_hits} & set(query_truth.tolist())) / topk
+                      for query_hits, query_truth in zip(hits, truth)])
+
+    return {"quantization": quantization or "float32", "rescore": rescore if quantization else "-",
+            "recall": recall, "ms_per_query": 1000 * seconds / len(queries), "search_mb": memory / 1024**2}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k and memory of the quantized search of LocalVectorDB")
+    parser.add_argument("--collection-dir", help="Directory of a LocalVectorDB collection, synthetic vectors if not set")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--topk", type=int, default=10)
+    parser.add_argument("--rescore", type=int, default=4)
+    parser.add_argument("--ivf-min-rows", type=int, default=10**9, help="Brute force search by default")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.collection_dir, args.rows, args.dim, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    # The queries are perturbed copies of stored vectors
+    queries = vectors[rng.choice(len(vectors), args.queries)]
+    queries = (queries + 0.1 * np.abs(queries).mean() * rng.normal(size=queries.shape)).astype(np.float32)
+    truth = exact_topk(vectors, queries, args.topk)
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions, {len(queries)} queries, top {args.topk}")
+
+    results = [run(vectors, queries, truth, args.topk, quantization, rescore, args.ivf_min_rows, args.nprobe)
+               for quantization, rescore in [(None, 1), ("float16", 1), ("float16", args.rescore), ("int8", 1),
+                                             ("int8", args.rescore)]]
+    print(f"{'vectors':>10} {'rescore':>8} {'recall@' + str(args.topk):>10} {'ms/query':>10} {'search MB':>10}")
+    for result in results:
+        print(f"{result['quantization']:>10} {result['rescore']:>8} {result['recall']:>10.4f} "
+              f"{result['ms_per_query']:>10.3f} {result['search_mb']:>10.1f}")
@@ -0,0 +1,51 @@
+from src.RowSerializer import RowSerializer
+
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+def baseline_docs(df: pd.DataFrame, batch_size: int, description: str) -> list:
+    # The previous serialization: to_json + eval per batch, then json.dumps and encode per row
+    docs = []
+    for i in range(0, len(df), batch_size):
+        batch = eval(df.iloc[i:i+batch_size].to_json(orient='records').replace("null", "None"))
+        docs.append('"Content Description": "' + description + '",'
+                    + ','.join([str(json.dumps(row, ensure_ascii=False).encode('latin-1', errors='replace'))
+                                for row in batch]))
+    return docs
+
+def serializer_docs(serializer: RowSerializer, df: pd.DataFrame, batch_size: int, description: str) -> list:
+    docs, _ = serializer.serialize_chunks(df, np.arange(len(df)) // batch_size, description)
+    return docs
+
+def timed(function, repeat: int) -> float:
+    # The best of several runs, in milliseconds
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t0)
+    return 1000 * best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serialization time of the rows of a datafile into chunk documents")
+    parser.add_argument("--datafile", default="data/destino_prov_mes.csv")
+    parser.add_argument("--sep", default=";")
+    parser.add_argument("--encoding", default="latin_1")
+    parser.add_argument("--decimal", default=",")
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.datafile, sep=args.sep, encoding=args.encoding, decimal=args.decimal)
+    description = "benchmark"
+    print(f"{args.datafile}: {len(df)} rows, {args.batch_size} rows per chunk")
+
+    print(f"{'serializer':>12} {'ms':>10}")
+    print(f"{'to_json+eval':>12} {timed(lambda: baseline_docs(df, args.batch_size, description), args.repeat):>10.1f}")
+    for template in RowSerializer.TEMPLATES:
+        serializer = RowSerializer(template)
+        ms = timed(lambda: serializer_docs(serializer, df, args.batch_size, description), args.repeat)
+        print(f"{template:>12} {ms:>10.1f}")
@@ -0,0 +1,138 @@
+from src.SQLAgent import SQLAgent
+from src.TextToSQLAgent import TextToSQLAgent
+from src.EmbeddingBatcher import EmbeddingBatcher
+from app import (load_models, load_collection_vectordb, create_answer_cache, create_entity_extractor, create_rag_agent,
+                 create_sqldb, create_sql_plan_cache)
+
+import os
+import json
+import time
+from collections import OrderedDict
+from aiohttp import web
+from dotenv import load_dotenv
+
+MODES = ("rag", "sql", "text2sql")
+
+async def load_agents(app: web.Application):
+    # Load the models, the Milvus client and the SQL engine once, every request reuses them
+    models= load_models()
+    # Group the embeddings of the concurrent questions into a single call
+    models.embeddings_model= EmbeddingBatcher(models.embeddings_model, int(os.getenv("QUERY_BATCH_SIZE", 64)),
+                                              float(os.getenv("QUERY_BATCH_WAIT", 0.01)))
+    vectordb= load_collection_vectordb(rerank= os.getenv("RERANK", "false").lower() == "true")
+    app["embeddings"]= models.embeddings_model
+    app["agents"]= {"rag": create_rag_agent(vectordb, models, create_answer_cache(), create_entity_extractor(vectordb))}
+
+    sql_database= create_sqldb()
+    if hasattr(sql_database, "db"):
+        app["agents"]["sql"]= SQLAgent(sql_database.db, os.getenv("AGENT_LLM_SYSTEM_ROLE"), models.langchain_llm)
+        app["agents"]["text2sql"]= TextToSQLAgent(sql_database.db, os.getenv("AGENT_LLM_SYSTEM_ROLE"), models.langchain_llm,
+                                                  create_sql_plan_cache(sql_database), os.getenv("SQL_PLAN_ANSWER", "llm"))
+    else:
+        print(f"SQL database not found: {os.getenv('DB_DIR')}, the sql modes are disabled")
+
+def session_history(app: web.Application, session: str) -> list:
+    """
+    Find the chat history of a session, the agents are shared by every client so each session keeps its own.
+    A request without session gets a new history, the least recently used sessions are forgotten.
+    """
+    if not session:
+        return []
+    histories= app["histories"]
+    chat= histories.setdefault(str(session), [])
+    histories.move_to_end(str(session))
+    while len(histories) > app["max_sessions"]:
+        histories.popitem(last=False)
+
+    return chat
+
+def trim_history(chat: list, max_history: int):
+    # The service runs for a long time, keep only the last turns of the chat history, none with 0
+    if max_history > 0:
+        del chat[:-max_history]
+    else:
+        chat.clear()
+
+async def parse_question(request: web.Request) -> tuple:
+    """
+    Read the question and the mode of a request body, and find the agent of the mode.
+    """
+    try:
+        body= await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="The body must be a JSON object")
+    question= body.get("question")
+    mode= body.get("mode", "rag")
+    if not question or mode not in MODES:
+        raise web.HTTPBadRequest(text=f"A question and a mode in {MODES} are required")
+    agent= request.app["agents"].get(mode)
+    if agent is None:
+        raise web.HTTPServiceUnavailable(text=f"The {mode} mode is not available")
+
+    return body, question, mode, agent
+
+async def ask(request: web.Request) -> web.Response:
+    body, question, mode, agent= await parse_question(request)
+
+    t0= time.time()
+    chat= session_history(request.app, body.get("session"))
+    result= {}
+    if mode == "rag":
+        stage_seconds= {}
+        response, chat= await agent.arespond(question, {"metric_type": "COSINE"}, topk= int(body.get("topk", 5)),
+                                             chat= chat, stage_seconds= stage_seconds)
+        result["stage_seconds"]= {stage: round(seconds, 4) for stage, seconds in stage_seconds.items()}
+    else:
+        response, chat= await agent.arespond(question, chat= chat)
+    trim_history(chat, request.app["max_history"])
+
+    return web.json_response({"question": question, "mode": mode, "answer": response,
+                              "seconds": round(time.time() - t0, 4), **result})
+
+async def ask_stream(request: web.Request) -> web.StreamResponse:
+    """
+    Answer a question streaming the events of the agent (see the astream method of the agents) as
+    newline-delimited JSON, the tokens are sent as soon as the LLM writes them.
+    """
+    body, question, mode, agent= await parse_question(request)
+
+    response= web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    chat= session_history(request.app, body.get("session"))
+    if mode == "rag":
+        events= agent.astream(question, {"metric_type": "COSINE"}, topk= int(body.get("topk", 5)), chat= chat)
+    else:
+        events= agent.astream(question, chat= chat)
+    async for event in events:
+        await response.write((json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+    trim_history(chat, request.app["max_history"])
+    await response.write_eof()
+
+    return response
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "modes": list(request.app["agents"]),
+                              "embeddings": getattr(request.app["embeddings"], "stats", {})})
+
+def create_app(agents: dict = None, embeddings= None) -> web.Application:
+    """
+    Create the service. The models and agents are loaded on startup, unless the agents of the modes are given.
+    """
+    app= web.Application()
+    app["max_history"]= int(os.getenv("MAX_CHAT_HISTORY", 100))
+    app["max_sessions"]= int(os.getenv("MAX_SESSIONS", 1000))
+    app["histories"]= OrderedDict()
+    if agents is None:
+        app.on_startup.append(load_agents)
+    else:
+        app["agents"]= agents
+        app["embeddings"]= embeddings
+    app.router.add_post("/ask", ask)
+    app.router.add_post("/ask/stream", ask_stream)
+    app.router.add_get("/health", health)
+
+    return app
+
+if __name__ == "__main__":
+    print("Environent variables are loaded:", load_dotenv())
+    web.run_app(create_app(), host= os.getenv("SERVER_HOST", "0.0.0.0"), port= int(os.getenv("SERVER_PORT", 8000)))
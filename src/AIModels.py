@@ -4,6 +4,8 @@ from openai import AzureOpenAI
 from langchain.chat_models import AzureChatOpenAI
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI, OpenAI
 
+from src.EmbeddingCache import EmbeddingCache
+
 class AIModels:
 
     def __init__(self, model_name:str, embedding_model_name:str, temperature: float, max_tokens: int) -> None:
@@ -17,6 +19,7 @@ class AIModels:
         self.embedding_model_name= embedding_model_name
         self.temperature = temperature
         self.max_tokens= max_tokens
+        self.embeddings_cache= None
 
     def load_azure_openai_models(self):
         azure_openai_api_key = os.environ["OPENAI_API_KEY"]
@@ -51,4 +54,7 @@ class AIModels:
         self.embeddings_model = OpenAIEmbeddings(
                                     model=self.embedding_model_name
                                 )
- 
\ No newline at end of file
+
+    def load_embeddings_cache(self, cache_path: str, dim: int, max_entries: int = 1000000):
+        # Persistent cache of the embeddings, keyed by text, embedding model and dimension
+        self.embeddings_cache = EmbeddingCache(cache_path, self.embedding_model_name, dim, max_entries)
@@ -0,0 +1,139 @@
+import re
+import time
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+
+class AnswerCache:
+    """
+    A two level cache of the answers of the RAG agent.
+
+    The first level matches the normalized text of the question (lowercase, without accents,
+    punctuation or repeated spaces). The second level reuses the answer of a cached question whose
+    embedding is within a cosine similarity threshold of the new one, as long as both questions
+    contain the same numbers (years, months...), because "2019" and "2020" are near duplicates
+    for the embedding model. The answers expire after a TTL, the least recently used ones are evicted
+    over the size cap, and the whole cache is cleared when the collection is ingested again.
+    """
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, similarity_threshold: float = 0.97,
+                 generation = None) -> None:
+        """
+        Initialize the instance with the cache parameters.
+
+        Args:
+            max_entries (int): Maximum number of cached answers.
+            ttl (float): Time to live of an answer in seconds.
+            similarity_threshold (float): Minimum cosine similarity to reuse the answer of another question.
+            generation (callable): Optional function returning the generation of the collection, the cache
+                                   is cleared when it changes (e.g. the collection was re-ingested). It is
+                                   called on every lookup, see IngestManifest.generation_reader.
+        """
+        self.max_entries= max_entries
+        self.ttl= ttl
+        self.similarity_threshold= similarity_threshold
+        self.generation= generation
+        self.current_generation= generation() if generation else None
+        self.entries= OrderedDict()
+        self.matrix= None
+        self.matrix_keys= []
+        self.lock= threading.Lock()
+        self.stats= {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize('NFKD', text.lower())
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def _numbers(text: str) -> frozenset:
+        return frozenset(re.findall(r"\d+", text))
+
+    def _check_generation(self):
+        if self.generation is None:
+            return
+        generation = self.generation()
+        if generation != self.current_generation:
+            print("The collection changed, the answer cache is cleared")
+            self.current_generation = generation
+            self._clear()
+
+    def _clear(self):
+        self.entries.clear()
+        self.matrix = None
+        self.matrix_keys = []
+
+    def _remove_expired(self):
+        now = time.time()
+        expired = [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self.matrix = None
+
+    def get(self, message: str, query_embedding: list = None):
+        """
+        Look up the answer of a question, first by its text and then by its embedding.
+
+        Args:
+            message (str): The user question.
+            query_embedding (list): The embedding of the question, if None only the text is matched.
+
+        Returns:
+            str: The cached answer, or None.
+        """
+        key = self.normalize(message)
+        with self.lock:
+            self._check_generation()
+            self._remove_expired()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry["answer"]
+            if query_embedding is None:
+                self.stats["misses"] += 1
+                return None
+
+            if self.matrix is None:
+                self.matrix_keys = list(self.entries)
+                self.matrix = (np.array([self.entries[k]["embedding"] for k in self.matrix_keys], dtype=np.float32)
+                               if self.matrix_keys else None)
+            if self.matrix is not None:
+                query = np.asarray(query_embedding, dtype=np.float32)
+                similarities = self.matrix @ (query / np.linalg.norm(query))
+                numbers = self._numbers(key)
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.similarity_threshold:
+                        break
+                    entry = self.entries[self.matrix_keys[i]]
+                    if entry["numbers"] == numbers:
+                        self.entries.move_to_end(self.matrix_keys[i])
+                        self.stats["semantic_hits"] += 1
+                        return entry["answer"]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, message: str, query_embedding: list, answer: str):
+        """
+        Store the answer of a question, evicting the least recently used answers over the size cap.
+        """
+        key = self.normalize(message)
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        with self.lock:
+            self.entries[key] = {"answer": answer, "embedding": embedding / np.linalg.norm(embedding),
+                                 "numbers": self._numbers(key), "created": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.matrix = None
+
+    def invalidate(self):
+        """
+        Remove every cached answer.
+        """
+        with self.lock:
+            self._clear()
@@ -0,0 +1,154 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+import pandas as pd
+
+class ChunkSorter:
+    """
+    Sort a stream of DataFrame chunks as a whole, without holding it in memory (an external merge sort).
+
+    The chunks are gathered into runs of up to `run_rows` rows, every run is sorted and written to a spill
+    file in blocks of rows. Then the runs are merged: a block of every run is held in a buffer and, on every
+    step, the buffered rows up to the smallest last key among the runs are sorted and emitted, since no row
+    left in any run can sort before them, and the next block of that run is read. The memory holds a run
+    while writing the runs and a block per run while merging, the sorted rows are emitted in chunks of
+    `chunk_size` rows. A stream that fits in a single run is sorted in memory.
+    """
+    _SEQ = "__sort_seq"
+    _RUN = "__sort_run"
+
+    def __init__(self, sort_by: list, chunk_size: int, run_rows: int = 1000000, block_size: int = 10000,
+                 spill_dir: str = None) -> None:
+        """
+        Initialize the instance with the sort columns and the size of the chunks.
+
+        Args:
+            sort_by (list): The columns that sort the rows, e.g. ['PROVINCIA_DESTINO', 'AÑO', 'MES'].
+            chunk_size (int): Number of rows of the emitted chunks.
+            run_rows (int): Maximum number of rows sorted in memory at once.
+            block_size (int): Number of rows of every run read at a time while merging.
+            spill_dir (str): The directory of the spill files of the runs, the temporary directory by default.
+        """
+        self.sort_by= list(sort_by)
+        self.chunk_size= chunk_size
+        self.run_rows= run_rows
+        self.block_size= block_size
+        self.spill_dir= spill_dir
+
+    def _sort(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.sort_values(by=self.sort_by, kind='stable')
+
+    def _write_run(self, df: pd.DataFrame) -> str:
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.spill_dir)
+        with os.fdopen(fd, "wb") as file:
+            for i in range(0, len(df), self.block_size):
+                pickle.dump(df.iloc[i:i+self.block_size], file, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @staticmethod
+    def _read_run(path: str):
+        with open(path, "rb") as file:
+            while True:
+                try:
+                    yield pickle.load(file)
+                except EOFError:
+                    return
+
+    def _rechunk(self, pieces):
+        """
+        Join the sorted pieces into chunks of chunk_size rows, numbering the rows in order.
+        """
+        pending = []
+        pending_rows = 0
+        rows = 0
+        for piece in pieces:
+            pending.append(piece)
+            pending_rows += len(piece)
+            while pending_rows >= self.chunk_size:
+                df = pd.concat(pending)
+                chunk, rest = df.iloc[:self.chunk_size], df.iloc[self.chunk_size:]
+                chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+                rows += len(chunk)
+                yield chunk
+                pending, pending_rows = [rest], len(rest)
+        if pending_rows:
+            chunk = pd.concat(pending)
+            chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+            yield chunk
+
+    def _merge(self, paths: list):
+        """
+        Merge the sorted runs, yielding sorted pieces of rows.
+        """
+        runs = {run: self._read_run(path) for run, path in enumerate(paths)}
+        blocks = []
+        last_rows = {}
+        seq = 0
+
+        def read_block(run):
+            nonlocal seq
+            block = next(runs[run], None)
+            if block is None:
+                del runs[run]
+                return
+            block = block.assign(**{self._SEQ: range(seq, seq + len(block))})
+            seq += len(block)
+            blocks.append(block)
+            last_rows[run] = block.iloc[[-1]]
+
+        for run in list(runs):
+            read_block(run)
+        buffer = None
+        while runs:
+            # The run whose last buffered row sorts first bounds the rows that can be emitted
+            bound_rows = pd.concat([last_rows[run].assign(**{self._RUN: run}) for run in runs])
+            bound = self._sort(bound_rows).iloc[0]
+            buffer = self._sort(pd.concat(([buffer] if buffer is not None else []) + blocks))
+            blocks = []
+            position = int((buffer[self._SEQ].values == bound[self._SEQ]).nonzero()[0][0]) + 1
+            yield buffer.iloc[:position].drop(columns=self._SEQ)
+            buffer = buffer.iloc[position:]
+            # Read the next block of every run whose buffered rows were all emitted, the rows with the
+            # same key as the bound can be emitted along with it
+            active = list(runs)
+            emitted = ~np.isin([last_rows[run][self._SEQ].iloc[0] for run in active], buffer[self._SEQ].values)
+            for run, done in zip(active, emitted):
+                if done:
+                    read_block(run)
+        rest = pd.concat(([buffer] if buffer is not None else []) + blocks)
+        if len(rest):
+            yield self._sort(rest).drop(columns=self._SEQ)
+
+    def sort(self, chunks):
+        """
+        Sort the rows of a stream of DataFrame chunks.
+
+        Args:
+            chunks (iterable): The DataFrame chunks, e.g. the chunks read from a datafile.
+
+        Yields:
+            DataFrame: The next chunk of sorted rows.
+        """
+        paths = []
+        run = []
+        run_rows = 0
+        try:
+            for df in chunks:
+                run.append(df)
+                run_rows += len(df)
+                if run_rows >= self.run_rows:
+                    paths.append(self._write_run(self._sort(pd.concat(run))))
+                    run, run_rows = [], 0
+            if not paths:
+                # The whole stream fits in a single run, there is nothing to merge
+                if run:
+                    yield from self._rechunk([self._sort(pd.concat(run))])
+                return
+            if run:
+                paths.append(self._write_run(self._sort(pd.concat(run))))
+                run = []
+            yield from self._rechunk(self._merge(paths))
+        finally:
+            for path in paths:
+                os.remove(path)
@@ -0,0 +1,127 @@
+import re
+import json
+
+from src.TokenCounter import TokenCounter
+
+class ContextBuilder:
+    """
+    Build the search results of the RAG prompt from the retrieved chunk documents within a token budget.
+
+    The chunk documents of every template of RowSerializer (json, kv and markdown) are parsed back into
+    their description, columns and rows. The rows repeated in several documents are kept once, and the
+    rows of the documents with the same description and columns are rendered as a single compact table,
+    with the description and the column names written once:
+
+        Content Description: ...
+        AÑO | MES | PROVINCIA | GASTO
+        2023 | 1 | Madrid | 1000.5
+
+    The rows are added in the order of the documents, the best ranked first, while the tokens of the
+    tables fit the budget. A document that can not be parsed (e.g. truncated) is kept as it is, if it fits.
+    """
+    DESCRIPTION_PREFIX = "Content Description: "
+
+    def __init__(self, max_tokens: int = 4000, model_name: str = None) -> None:
+        """
+        Initialize the instance with the token budget.
+
+        Args:
+            max_tokens (int): Maximum number of tokens of the search results.
+            model_name (str): The name of the LLM, used to count the tokens.
+        """
+        self.max_tokens= max_tokens
+        self.token_counter= TokenCounter(model_name)
+        # Tokens of the documents and of the built context of the last call
+        self.last_stats= {}
+
+    @staticmethod
+    def _value(value) -> str:
+        if value is None:
+            return ""
+        return str(value).replace("|", "\\|")
+
+    @classmethod
+    def parse(cls, document: str):
+        """
+        Parse a chunk document written by RowSerializer.
+
+        Returns:
+            str, list, list: The description, the columns and the rows (lists of text values), or None if
+                             the document can not be parsed.
+        """
+        if document.startswith('{"description"'):
+            try:
+                chunk = json.loads(document)
+            except json.JSONDecodeError:
+                return None
+            columns = list(dict.fromkeys(column for row in chunk["rows"] for column in row))
+            return chunk["description"], columns, [[cls._value(row.get(column)) for column in columns]
+                                                   for row in chunk["rows"]]
+        if not document.startswith(cls.DESCRIPTION_PREFIX):
+            return None
+        description, _, body = document[len(cls.DESCRIPTION_PREFIX):].partition("\n\n")
+        if body.startswith("|"):
+            # Markdown table, the values are already escaped
+            lines = [re.split(r"(?<!\\)\|", line.strip())[1:-1] for line in body.splitlines() if line.strip()]
+            if len(lines) < 2:
+                return None
+            columns = [column.strip() for column in lines[0]]
+            return description, columns, [[value.strip() for value in line] for line in lines[2:]
+                                          if len(line) == len(columns)]
+        rows = []
+        for block in body.split("\n\n"):
+            row = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+            if row:
+                rows.append(row)
+        if not rows:
+            return None
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        return description, columns, [[cls._value(row.get(column)) for column in columns] for row in rows]
+
+    def build(self, documents: list) -> str:
+        """
+        Build the search results from the retrieved documents.
+
+        Args:
+            documents (list): The chunk documents, sorted by score.
+
+        Returns:
+            str: The compact tables of the documents, within the token budget.
+        """
+        # Every entry is a table, with its header, or a raw document
+        tables = {}
+        candidates = []
+        seen = set()
+        for document in documents:
+            parsed = self.parse(document)
+            if parsed is None:
+                candidates.append((("raw", len(candidates)), document))
+                continue
+            description, columns, rows = parsed
+            key = (description, tuple(columns))
+            if key not in tables:
+                tables[key] = self.DESCRIPTION_PREFIX + description + "\n" + " | ".join(columns)
+            for row in rows:
+                line = " | ".join(row)
+                if (key, line) not in seen:
+                    seen.add((key, line))
+                    candidates.append((key, line))
+
+        costs = self.token_counter.count_many([text for _, text in candidates])
+        header_costs = dict(zip(tables, self.token_counter.count_many(list(tables.values()))))
+        selected = {}
+        tokens = 0
+        for (key, text), cost in zip(candidates, costs):
+            if key in tables and key not in selected:
+                cost += header_costs[key]
+            if tokens + cost > self.max_tokens:
+                continue
+            tokens += cost
+            selected.setdefault(key, []).append(text)
+
+        self.last_stats= {"documents_tokens": sum(self.token_counter.count_many(documents)), "context_tokens": tokens,
+                          "rows": sum(1 for key, _ in candidates if key in tables),
+                          "selected_rows": sum(len(lines) for key, lines in selected.items() if key in tables)}
+
+        return "\n\n".join("\n".join([tables[key]] + lines) if key in tables else lines[0]
+                           for key, lines in selected.items())
@@ -0,0 +1,83 @@
+import time
+import asyncio
+
+class EmbeddingBatcher:
+    """
+    Group the query embeddings requested concurrently into a single embedding call.
+
+    The queries that arrive within a short window (or until the batch is full) are embedded together
+    with `aembed_documents`, and every caller gets its own embedding back. The batcher has the embedding
+    interface used by the agents (`embed_query`, `aembed_query`, `embed_documents`, `aembed_documents`),
+    so it can replace the embedding model of an agent in a long running service.
+    """
+    def __init__(self, embedding_model, max_batch_size: int = 64, max_wait: float = 0.01) -> None:
+        """
+        Initialize the instance with the embedding model and the batching window.
+
+        Args:
+            embedding_model (Embeddings): The LangChain embedding model.
+            max_batch_size (int): Maximum number of queries embedded in a single call.
+            max_wait (float): Maximum seconds a query waits for other queries before the batch is sent.
+        """
+        self.embedding_model= embedding_model
+        self.max_batch_size= max_batch_size
+        self.max_wait= max_wait
+        self.pending= []
+        self.flush_task= None
+        self.tasks= set()
+        self.stats= {"queries": 0, "batches": 0, "seconds": 0.0}
+
+    def embed_query(self, text: str) -> list:
+        return self.embedding_model.embed_query(text)
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embedding_model.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list) -> list:
+        return await self.embedding_model.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list:
+        """
+        Embed a query, together with the other queries requested in the same window.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((text, future))
+        if len(self.pending) >= self.max_batch_size:
+            self._send()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self.flush_task = None
+        while self.pending:
+            self._send()
+
+    def _send(self):
+        batch, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+        if self.flush_task is not None and not self.pending:
+            self.flush_task.cancel()
+            self.flush_task = None
+        # Keep a reference to the task until it is done
+        task = asyncio.create_task(self._embed_batch(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _embed_batch(self, batch: list):
+        t0 = time.time()
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = dict(zip(texts, await self.embedding_model.aembed_documents(texts)))
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embeddings[text])
+        self.stats["queries"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["seconds"] += time.time() - t0
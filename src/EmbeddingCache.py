@@ -0,0 +1,115 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed cache of embeddings stored in a local SQLite file.
+
+    The embeddings are keyed by a hash of the embedded text plus the embedding model name and dimension,
+    and they are stored as float32 blobs. When the cache grows over its size cap, the least recently
+    used embeddings are evicted.
+    """
+    def __init__(self, cache_path: str, model_name: str, dim: int, max_entries: int = 1000000,
+                 max_bytes: int = 4 * 1024**3) -> None:
+        """
+        Initialize the instance and open (or create) the cache file.
+
+        Args:
+            cache_path (str): The path of the SQLite cache file.
+            model_name (str): The name of the embedding model.
+            dim (int): The dimension of the embeddings.
+            max_entries (int): Maximum number of embeddings in the cache.
+            max_bytes (int): Maximum size in bytes of the embeddings in the cache.
+        """
+        self.cache_path= cache_path
+        self.model_name= model_name
+        self.dim= dim
+        self.max_entries= max_entries
+        self.max_bytes= max_bytes
+        self.hits= 0
+        self.misses= 0
+        self.lock= threading.Lock()
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.conn= sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+                                key TEXT PRIMARY KEY,
+                                vector BLOB NOT NULL,
+                                last_access REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{self.dim}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list) -> list:
+        """
+        Look up the embeddings of a list of texts.
+
+        Returns:
+            list: The embedding of every text as a read-only float32 array over the stored blob, or None when it
+                  is not in the cache.
+        """
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self.lock:
+            # SQLite limits the number of variables per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i+500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?'*len(batch))})", batch).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                      [(now, key) for key in found])
+                self.conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+
+    def put_many(self, texts: list, embeddings: list):
+        """
+        Store the embeddings of a list of texts and evict the least recently used ones over the size cap.
+        """
+        now = time.time()
+        rows = [(self._key(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                for text, embedding in zip(texts, embeddings)]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows)
+            self._evict()
+            self.conn.commit()
+
+    def get(self, text: str) -> np.ndarray:
+        return self.get_many([text])[0]
+
+    def put(self, text: str, embedding: list):
+        self.put_many([text], [embedding])
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # All the embeddings in the cache have the same size
+        max_entries = min(self.max_entries, self.max_bytes // (4 * self.dim))
+        if count > max_entries:
+            self.conn.execute("""DELETE FROM embeddings WHERE key IN
+                                    (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)""", (count - max_entries,))
+
+    def stats(self) -> dict:
+        """
+        Return the hit/miss statistics and the size of the cache.
+        """
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "entries": entries, "bytes": entries * 4 * self.dim}
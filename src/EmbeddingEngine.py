@@ -0,0 +1,124 @@
+import time
+import random
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from src.TokenCounter import TokenCounter
+
+class EmbeddingEngine:
+    """
+    Generate embeddings for a list of texts with batched and concurrent calls to the embedding model.
+
+    The texts are grouped into `embed_documents` calls sized by a token budget, several groups are
+    sent at once through a thread pool (limiting the number of requests in flight) and failed calls
+    are retried with exponential backoff. The embeddings are returned in the same order as the texts.
+    If an embedding cache is provided, only the texts missing in the cache are sent to the model.
+    """
+    def __init__(self, embedding_model, model_name: str = None, max_batch_tokens: int = 100000,
+                 max_batch_size: int = 1000, max_workers: int = 4, max_retries: int = 5,
+                 backoff: float = 1.0, cache = None) -> None:
+        """
+        Initialize the instance with the embedding model and the batching parameters.
+
+        Args:
+            embedding_model: The langchain embedding model, it must implement `embed_documents`.
+            model_name (str): The name of the embedding model, used to count the tokens.
+            max_batch_tokens (int): Maximum number of tokens sent in a single embedding request.
+            max_batch_size (int): Maximum number of texts sent in a single embedding request.
+            max_workers (int): Maximum number of embedding requests in flight.
+            max_retries (int): Number of retries of a failed embedding request.
+            backoff (float): Initial waiting time in seconds between retries, doubled on every retry.
+            cache (EmbeddingCache): An optional cache of embeddings, consulted before calling the model.
+        """
+        self.embeddings_model= embedding_model
+        self.token_counter= TokenCounter(model_name)
+        self.max_batch_tokens= max_batch_tokens
+        self.max_batch_size= max_batch_size
+        self.max_workers= max_workers
+        self.max_retries= max_retries
+        self.backoff= backoff
+        self.cache= cache
+
+    def _make_batches(self, texts: list) -> list:
+        """
+        Group consecutive texts into batches that fit the token and size budget.
+
+        Returns:
+            list: A list of (start, end) ranges over the texts.
+        """
+        batches = []
+        start = 0
+        batch_tokens = 0
+        for i, tokens in enumerate(self.token_counter.count_many(texts)):
+            if i > start and (batch_tokens + tokens > self.max_batch_tokens or i - start >= self.max_batch_size):
+                batches.append((start, i))
+                start = i
+                batch_tokens = 0
+            batch_tokens += tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+
+        return batches
+
+    def _embed_batch(self, texts: list) -> list:
+        """
+        Embed a batch of texts, retrying with exponential backoff and jitter on errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings_model.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"Embedding request failed ({e}), retrying in {round(wait,2)} seconds")
+                time.sleep(wait)
+
+    def embed(self, texts: list) -> list:
+        """
+        Generate the embeddings of a list of texts.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: The embeddings, in the same order as the texts. The cached ones are float32 arrays and the
+                  new ones lists of floats, see embed_array for a single matrix.
+        """
+        if not texts:
+            return []
+
+        if self.cache is None:
+            return self._embed_texts(texts)
+
+        embeddings = self.cache.get_many(texts)
+        found = sum(1 for embedding in embeddings if embedding is not None)
+        # Embed every missing text only once, even if it is repeated
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = self._embed_texts(missing)
+            self.cache.put_many(missing, new_embeddings)
+            new_embeddings = dict(zip(missing, new_embeddings))
+            embeddings = [new_embeddings[text] if embedding is None else embedding 
+                          for text, embedding in zip(texts, embeddings)]
+        print(f"Embedding cache: {found} of {len(texts)} texts found")
+
+        return embeddings
+
+    def embed_array(self, texts: list) -> np.ndarray:
+        """
+        Generate the embeddings of a list of texts as a float32 matrix, one row per text.
+
+        The matrix takes a quarter of the memory of the lists of Python floats, see embed.
+        """
+        return np.asarray(self.embed(texts), dtype=np.float32)
+
+    def _embed_texts(self, texts: list) -> list:
+        batches = self._make_batches(texts)
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(self._embed_batch, [texts[start:end] for start, end in batches])
+            embeddings = [embedding for batch in results for embedding in batch]
+        print(f"Embedded {len(texts)} texts in {len(batches)} requests in {round(time.time()-t0,4)} seconds")
+
+        return embeddings
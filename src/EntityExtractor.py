@@ -0,0 +1,104 @@
+import re
+import json
+import unicodedata
+
+class EntityExtractor:
+    """
+    Find the provinces, years and months named in a question and turn them into a Milvus filter expression.
+
+    The provinces and years are a dictionary of the values in the loaded data, the provinces are matched as
+    whole words, without case or accents, by any of their names (e.g. 'Alicante/Alacant' also matches
+    'Alicante' and 'Alacant'). The months are matched by their Spanish names. The filter is applied on the
+    scalar fields of the collection (province, year_min/year_max, month_min/month_max), and keeps the
+    documents without those fields, so a filtered search never loses data loaded without metadata.
+    """
+    MONTHS = {"enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7, "agosto": 8,
+              "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12}
+    # Other common names of the provinces
+    ALIASES = {"A Coruña": ["La Coruña", "Coruña"], "Illes Balears": ["Baleares", "Islas Baleares"],
+               "Bizkaia": ["Vizcaya"], "Gipuzkoa": ["Guipúzcoa"], "Girona": ["Gerona"], "Lleida": ["Lérida"],
+               "Ourense": ["Orense"], "Santa Cruz de Tenerife": ["Tenerife"], "Las Palmas": ["Gran Canaria"]}
+
+    def __init__(self, provinces: list, years: list = None) -> None:
+        """
+        Initialize the instance with the dictionary of values.
+
+        Args:
+            provinces (list): The names of the provinces, as stored in the collection.
+            years (list): The years of the loaded data, if None any year between 1900 and 2099 is matched.
+        """
+        self.provinces= sorted(set(provinces))
+        self.years= set(years) if years else None
+        names = {}
+        for province in self.provinces:
+            for name in province.split("/") + [province] + self.ALIASES.get(province, []):
+                names[self.normalize(name)] = province
+        self.province_names= names
+        # The longest names first, so 'Santa Cruz de Tenerife' is matched before 'Tenerife'
+        self.province_pattern= (re.compile(r"\b(" + "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+                                           + r")\b") if names else None)
+        self.month_pattern= re.compile(r"\b(" + "|".join(self.MONTHS) + r")\b")
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize('NFKD', text.lower())
+        return "".join(char for char in text if not unicodedata.combining(char))
+
+    @classmethod
+    def from_vectordb(cls, vectordb, collection_name: str):
+        """
+        Build the dictionary of provinces and years from every document of the collection, read in pages.
+        """
+        provinces = set()
+        years = set()
+        for entity in vectordb.iter_fields(collection_name, ["province", "year_min", "year_max"]):
+            provinces.update(province for province in entity["province"].split("|") if province)
+            if entity["year_min"]:
+                years.update(range(entity["year_min"], entity["year_max"] + 1))
+        print(f"Entity dictionary: {len(provinces)} provinces, years {sorted(years)}")
+
+        return cls(list(provinces), list(years))
+
+    def extract(self, question: str) -> dict:
+        """
+        Find the entities named in a question.
+
+        Returns:
+            dict: The lists of 'provinces', 'years' and 'months' found, in order of appearance.
+        """
+        text = self.normalize(question)
+        provinces = []
+        if self.province_pattern is not None:
+            provinces = list(dict.fromkeys(self.province_names[name] for name in self.province_pattern.findall(text)))
+        years = [int(year) for year in dict.fromkeys(re.findall(r"\b(?:19|20)\d{2}\b", text))
+                 if self.years is None or int(year) in self.years]
+        months = list(dict.fromkeys(self.MONTHS[month] for month in self.month_pattern.findall(text)))
+
+        return {"provinces": provinces, "years": years, "months": months}
+
+    @staticmethod
+    def _range_clause(field: str, values: list) -> str:
+        ranges = " or ".join(f"({field}_min <= {value} and {field}_max >= {value})" for value in values)
+        return f"({ranges} or {field}_min == 0)"
+
+    def filter_expression(self, entities: dict) -> str:
+        """
+        Build the Milvus filter expression of some entities, an empty string if there is none.
+        """
+        clauses = []
+        if entities["provinces"]:
+            provinces = " or ".join(f"province like {json.dumps('%' + province + '%', ensure_ascii=False)}"
+                                    for province in entities["provinces"])
+            clauses.append(f'({provinces} or province == "")')
+        if entities["years"]:
+            clauses.append(self._range_clause("year", entities["years"]))
+        if entities["months"]:
+            clauses.append(self._range_clause("month", entities["months"]))
+
+        return " and ".join(clauses)
+
+    def question_filter(self, question: str) -> str:
+        """
+        Build the Milvus filter expression of the entities named in a question.
+        """
+        return self.filter_expression(self.extract(question))
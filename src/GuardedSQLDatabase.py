@@ -0,0 +1,219 @@
+import re
+import time
+import queue
+import threading
+import sqlite3
+from langchain_community.utilities import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
+
+class GuardedSQLDatabase(SQLDatabase):
+    """
+    A SQLDatabase that runs the SQL written by the agents with guardrails.
+
+    The queries run on a pool of read-only SQLite connections and must be a single SELECT statement.
+    Before running a query, its EXPLAIN QUERY PLAN is checked and a query that scans a whole table of more
+    than `max_scan_rows` rows is rejected, with an error message that tells the agent the indexed columns
+    of the table, so it can write the query again. A query without LIMIT is limited to `max_rows` + 1 rows,
+    the rows are fetched in batches and the result is truncated to `max_rows` rows, and a query that runs
+    longer than `timeout` seconds is interrupted. The errors are returned to the agents by `run_no_throw`.
+    """
+    # String literals, quoted identifiers and comments of a SQL query
+    SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?(?:\*/|$)", re.S)
+
+    def __init__(self, engine, db_path: str, max_rows: int = 1000, timeout: float = 10.0,
+                 max_scan_rows: int = 1000000, pool_size: int = 4, **kwargs) -> None:
+        """
+        Initialize the instance with the SQLite database and the guardrails.
+
+        Args:
+            engine (Engine): The SQLAlchemy engine, used to describe the tables.
+            db_path (str): The path of the SQLite database file.
+            max_rows (int): Maximum number of rows returned by a query.
+            timeout (float): Maximum seconds a query runs before it is interrupted.
+            max_scan_rows (int): Tables with more rows can not be scanned as a whole.
+            pool_size (int): Maximum number of open read-only connections.
+            kwargs: The arguments of SQLDatabase (metadata, custom_table_info, ignore_tables...).
+        """
+        super().__init__(engine, **kwargs)
+        self.db_path= db_path
+        self.max_rows= max_rows
+        self.timeout= timeout
+        self.max_scan_rows= max_scan_rows
+        self.pool_size= pool_size
+        self.pool= queue.Queue()
+        self.open_connections= 0
+        # The queries run in worker threads (asyncio.to_thread), the count of open connections is shared
+        self.lock= threading.Lock()
+        self.stats= {"queries": 0, "rejected": 0, "timeouts": 0, "truncated": 0}
+        conn = self._connect()
+        try:
+            self.table_rows= self._table_rows(conn)
+            self.indexed_columns= self._indexed_columns(conn)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            connect = self.open_connections < self.pool_size
+            if connect:
+                self.open_connections += 1
+        if not connect:
+            return self.pool.get()
+        try:
+            return self._connect()
+        except Exception:
+            with self.lock:
+                self.open_connections -= 1
+            raise
+
+    @staticmethod
+    def _table_rows(conn: sqlite3.Connection) -> dict:
+        """
+        The number of rows of every table, from the statistics of ANALYZE or counted if there are none.
+        """
+        tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        rows = {}
+        if "sqlite_stat1" in tables:
+            for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+                rows[table] = max(rows.get(table, 0), int(stat.split()[0]))
+        for table in tables:
+            if table not in rows and not table.startswith("sqlite_"):
+                rows[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        return rows
+
+    @staticmethod
+    def _indexed_columns(conn: sqlite3.Connection) -> dict:
+        """
+        The columns of every table that are the first column of an index.
+        """
+        columns = {}
+        for table, index in conn.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'"):
+            first = conn.execute(f'PRAGMA index_info("{index}")').fetchone()
+            if first is not None:
+                columns.setdefault(table, []).append(first[2])
+        return {table: list(dict.fromkeys(names)) for table, names in columns.items()}
+
+    @classmethod
+    def _split_query(cls, query: str) -> tuple:
+        """
+        Remove the comments of a query and mask its string literals and quoted identifiers.
+
+        Returns:
+            str, str: The query without comments and the same query with every literal masked, to look
+                      for the statement separators and the LIMIT clause outside of the literals.
+        """
+        def strip(match):
+            return " " if match.group().startswith(("--", "/*")) else match.group()
+
+        def mask(match):
+            return " " if match.group().startswith(("--", "/*")) else match.group()[0] + match.group()[-1]
+
+        query = cls.SQL_TOKEN.sub(strip, query).strip().rstrip(";").strip()
+        return query, cls.SQL_TOKEN.sub(mask, query)
+
+    def check_query(self, conn: sqlite3.Connection, query: str, parameters: dict = None) -> str:
+        """
+        Check a query and add a LIMIT if it has none.
+
+        Returns:
+            str: The query to run.
+
+        Raises:
+            ValueError: If the query is not a single SELECT or it scans a large table.
+        """
+        query, masked = self._split_query(query)
+        if not re.match(r"(?is)^(select|with)\b", masked) or ";" in masked:
+            raise ValueError("Only a single SELECT statement is allowed")
+        # The query plan names the tables by their alias
+        aliases = {alias: table for table, alias in
+                   re.findall(r'(?i)(?:\bfrom|\bjoin|,)\s+"?(\w+)"?\s+(?:as\s+)?"?(\w+)"?', query)
+                   if table in self.table_rows}
+        for *_, detail in conn.execute(f"EXPLAIN QUERY PLAN {query}", parameters or {}):
+            match = re.match(r"SCAN (?:TABLE )?(\S+)", detail)
+            table = match and aliases.get(match.group(1), match.group(1))
+            if table and self.table_rows.get(table, 0) > self.max_scan_rows:
+                self.stats["rejected"] += 1
+                raise ValueError(f"The query scans the whole table {table} ({self.table_rows[table]} rows). Filter "
+                                 f"it by its indexed columns {self.indexed_columns.get(table, [])} or query a rollup "
+                                 f"table with the aggregates")
+        if not re.search(r"(?is)\blimit\s+\d+(\s*(,|offset)\s*\d+)?$", masked):
+            # One more row than the maximum, to know if the result was truncated
+            query = f"SELECT * FROM ({query}\n) LIMIT {self.max_rows + 1}"
+        return query
+
+    def fetch_rows(self, query: str, parameters: dict = None, fetch: str = "all") -> tuple:
+        """
+        Run a query with the guardrails and return the rows as they come from SQLite.
+
+        Returns:
+            list, list, bool: The column names, the rows and whether the rows were truncated.
+        """
+        conn = self._acquire()
+        deadline = time.time() + self.timeout
+        # Interrupt the query when it runs over the timeout
+        conn.set_progress_handler(lambda: int(time.time() > deadline), 10000)
+        try:
+            query = self.check_query(conn, query, parameters)
+            cursor = conn.execute(query, parameters or {})
+            columns = [column[0] for column in cursor.description or []]
+            max_rows = 1 if fetch == "one" else self.max_rows
+            rows = []
+            while len(rows) <= max_rows:
+                batch = cursor.fetchmany(min(1000, max_rows + 1 - len(rows)))
+                if not batch:
+                    break
+                rows.extend(batch)
+            cursor.close()
+        except sqlite3.OperationalError as error:
+            if time.time() > deadline:
+                self.stats["timeouts"] += 1
+                raise TimeoutError(f"The query was interrupted after {self.timeout} seconds, write a more "
+                                   f"selective query") from error
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+            self.pool.put(conn)
+        self.stats["queries"] += 1
+        truncated = len(rows) > max_rows
+        if truncated and fetch != "one":
+            self.stats["truncated"] += 1
+        return columns, rows[:max_rows], truncated
+
+    def run(self, command, fetch: str = "all", include_columns: bool = False, *, parameters: dict = None,
+            execution_options: dict = None):
+        """
+        Run a SQL query with the guardrails and return a string of the result, see SQLDatabase.run.
+        The other commands (e.g. SQLAlchemy statements or fetch='cursor') run without guardrails.
+        """
+        if not isinstance(command, str) or fetch == "cursor":
+            return super().run(command, fetch, include_columns, parameters=parameters,
+                               execution_options=execution_options)
+        columns, rows, truncated = self.fetch_rows(command, parameters, fetch)
+        result = [tuple(truncate_word(value, length=self._max_string_length) for value in row) for row in rows]
+        if include_columns:
+            result = [dict(zip(columns, row)) for row in result]
+        if not result:
+            return ""
+        if truncated and fetch != "one":
+            return f"{result} (only the first {self.max_rows} rows)"
+        return str(result)
+
+    def run_no_throw(self, command: str, fetch: str = "all", include_columns: bool = False, *,
+                     parameters: dict = None, execution_options: dict = None):
+        """
+        Run a SQL query with the guardrails, any error is returned as the result, see SQLDatabase.run_no_throw.
+        """
+        try:
+            return self.run(command, fetch, include_columns, parameters=parameters,
+                            execution_options=execution_options)
+        except Exception as error:
+            return f"Error: {error}"
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+
+class IngestManifest:
+    """
+    A manifest of the datafiles loaded into a sink (a Milvus collection or a SQL database).
+
+    For every datafile it keeps the hash of the file, a fingerprint of the loading configuration and a
+    fingerprint of every partition of rows (e.g. every AÑO/MES). Comparing the fingerprints of a new version
+    of the file with the manifest tells which partitions have to be inserted, replaced or deleted.
+    The manifest also keeps a generation number, increased every time the content of the sink changes.
+    """
+    def __init__(self, manifest_path: str, sink: str) -> None:
+        """
+        Initialize the instance and load the manifest file, if it exists.
+
+        Args:
+            manifest_path (str): The path of the JSON manifest file.
+            sink (str): The name of the sink, several sinks can share a manifest file.
+        """
+        self.manifest_path= manifest_path
+        self.sink= sink
+        self.data= {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                self.data= json.load(file)
+        self.data.setdefault(sink, {"generation": 0, "files": {}})
+
+    @property
+    def generation(self) -> int:
+        return self.data[self.sink]["generation"]
+
+    @staticmethod
+    def read_generation(manifest_path: str, sink: str) -> int:
+        """
+        Read the current generation of a sink from the manifest file, e.g. to detect a new ingestion
+        done by another process.
+        """
+        if not os.path.exists(manifest_path):
+            return 0
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file).get(sink, {}).get("generation", 0)
+
+    @staticmethod
+    def generation_reader(manifest_path: str, sink: str):
+        """
+        Build a function that returns the current generation of a sink, e.g. to check it on every query.
+        The manifest file is only read again when its modification time, size or inode changed.
+        """
+        state = {"signature": None, "generation": 0}
+
+        def read() -> int:
+            try:
+                stat = os.stat(manifest_path)
+            except FileNotFoundError:
+                return 0
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if signature != state["signature"]:
+                state["generation"] = IngestManifest.read_generation(manifest_path, sink)
+                state["signature"] = signature
+            return state["generation"]
+
+        return read
+
+    @staticmethod
+    def file_fingerprint(file_path: str) -> str:
+        """
+        Compute the sha256 hash of a file, reading it in blocks.
+        """
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024*1024), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def config_fingerprint(**config) -> str:
+        """
+        Compute a fingerprint of the parameters used to load a file.
+        """
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def partition_keys(df: pd.DataFrame, partition_by: list) -> pd.Series:
+        """
+        Build the partition key of every row, joining the values of the partition columns with '|'.
+        """
+        if not partition_by:
+            return pd.Series("", index=df.index)
+        keys = df[partition_by[0]].astype(str)
+        if len(partition_by) > 1:
+            keys = keys.str.cat([df[col].astype(str) for col in partition_by[1:]], sep='|')
+        return keys
+
+    @staticmethod
+    def partition_fingerprints(chunks, partition_by: list) -> dict:
+        """
+        Compute the fingerprint of every partition of rows, reading the data in chunks.
+
+        The fingerprint of a partition is its number of rows and the sum of the hashes of its rows,
+        so it does not depend on the order of the rows or on how the file is split in chunks.
+
+        Args:
+            chunks (iterable): The DataFrame chunks of the file.
+            partition_by (list): The partition columns, if empty the whole file is a single partition.
+
+        Returns:
+            dict: For every partition key, the values of the partition columns and the fingerprint.
+        """
+        partitions = {}
+        for df in chunks:
+            hashes = pd.util.hash_pandas_object(df, index=False)
+            keys = IngestManifest.partition_keys(df, partition_by)
+            # The sums wrap around as uint64, a row of the aggregates would be cast to float and lose bits
+            grouped = hashes.groupby(keys.values, sort=False)
+            sums, counts = grouped.sum(), grouped.count()
+            first_rows = df.groupby(keys.values, sort=False).head(1)
+            values = dict(zip(keys[first_rows.index], first_rows[partition_by].values.tolist())) if partition_by else {"": []}
+            for key, hash_sum, count in zip(sums.index, sums.values, counts.values):
+                partition = partitions.setdefault(key, {"values": values[key], "sum": 0, "count": 0})
+                partition["sum"] = (partition["sum"] + int(hash_sum)) % 2**64
+                partition["count"] += int(count)
+
+        return {key: {"values": partition["values"],
+                      "fingerprint": f"{partition['count']}-{partition['sum']:016x}"}
+                for key, partition in partitions.items()}
+
+    def get(self, file_name: str) -> dict:
+        return self.data[self.sink]["files"].get(file_name)
+
+    def diff(self, file_name: str, config: str, partitions: dict) -> tuple:
+        """
+        Compare the partitions of a file with the ones loaded in the sink.
+
+        Args:
+            file_name (str): The name of the datafile.
+            config (str): The fingerprint of the loading configuration.
+            partitions (dict): The partition fingerprints of the new version of the file.
+
+        Returns:
+            list, list: The keys of the new or changed partitions and the keys of the loaded partitions
+                        that must be deleted (changed or removed from the file).
+        """
+        entry = self.get(file_name)
+        if entry is None:
+            return list(partitions), []
+        loaded = entry["partitions"]
+        # If the loading configuration changed, every partition has to be loaded again
+        if entry["config"] != config:
+            return list(partitions), list(loaded)
+        changed = [key for key in partitions
+                   if key not in loaded or loaded[key]["fingerprint"] != partitions[key]["fingerprint"]]
+        deleted = [key for key in loaded
+                   if key not in partitions or loaded[key]["fingerprint"] != partitions[key]["fingerprint"]]
+        return changed, deleted
+
+    def update(self, file_name: str, file_hash: str, config: str, partitions: dict, changed: bool = True):
+        """
+        Record the new version of a file loaded in the sink and save the manifest.
+        """
+        self.data[self.sink]["files"][file_name] = {"file_hash": file_hash, "config": config,
+                                                    "partitions": partitions, "loaded_at": time.time()}
+        if changed:
+            self.data[self.sink]["generation"] += 1
+        self.save()
+
+    def reset(self):
+        """
+        Forget every file loaded in the sink, e.g. when the sink is recreated from scratch.
+        """
+        self.data[self.sink]["files"] = {}
+        self.data[self.sink]["generation"] += 1
+        self.save()
+
+    def save(self):
+        # Write a temporary file and replace the manifest, so it is never left half written
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.data, file, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,152 @@
+import os
+import time
+import pickle
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+class IngestScheduler:
+    """
+    Run the parsing and serialization of several datafiles in a pool of processes.
+
+    Every task runs a worker function in its own process, so the CPU bound work (reading the CSV files,
+    serializing and chunking the rows) scales with the cores. The worker yields its output in chunks,
+    which are written one after another to a spill file, so neither the worker nor the main process
+    holds a whole file in memory. As soon as every task finishes, its spill file is streamed back, chunk
+    by chunk, to a single writer that runs in the main process, so a sink (the SQLite database or the
+    Milvus collection) only has one writer. The progress of the tasks is printed as they finish.
+    """
+    def __init__(self, max_workers: int = None, spill_dir: str = None) -> None:
+        """
+        Initialize the instance with the size of the pool.
+
+        Args:
+            max_workers (int): Number of worker processes, defaults to the number of CPUs.
+                               With 1 worker the tasks run one after another in the main process.
+            spill_dir (str): The directory of the spill files of the workers, the temporary directory by default.
+        """
+        self.max_workers= max_workers or os.cpu_count() or 1
+        self.spill_dir= spill_dir
+
+    def is_parallel(self, num_tasks: int) -> bool:
+        """
+        Whether the tasks run in worker processes, otherwise they run in the main process and the
+        worker does not need to be picklable.
+        """
+        return self.max_workers > 1 and num_tasks > 1
+
+    def _report(self, done: int, total: int, label: str, parse_seconds: float, write_seconds: float, t0: float):
+        elapsed = time.time() - t0
+        eta = elapsed / done * (total - done)
+        print(f"[{done}/{total}] {label}: parsed in {round(parse_seconds,4)} seconds, written in "
+              f"{round(write_seconds,4)} seconds. Elapsed {round(elapsed,2)} seconds, ETA {round(eta,2)} seconds")
+
+    @staticmethod
+    def _spill(worker, args: tuple, spill_dir: str = None) -> tuple:
+        """
+        Write the chunks yielded by the worker to a spill file, in the worker process.
+
+        Returns:
+            str, float: The path of the spill file and the seconds spent by the worker.
+        """
+        t0 = time.time()
+        fd, path = tempfile.mkstemp(suffix=".spill", dir=spill_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in worker(*args):
+                    pickle.dump(chunk, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, time.time() - t0
+
+    @staticmethod
+    def _read_spill(path: str):
+        """
+        Stream back the chunks of a spill file.
+        """
+        with open(path, "rb") as file:
+            while True:
+                try:
+                    yield pickle.load(file)
+                except EOFError:
+                    return
+
+    @staticmethod
+    def _timed_iter(chunks, timer: dict):
+        """
+        Iterate over the chunks of a worker in the main process, adding the seconds spent by the worker.
+        """
+        iterator = iter(chunks)
+        while True:
+            t0 = time.time()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                timer["seconds"] += time.time() - t0
+            yield chunk
+
+    def run(self, tasks: list, worker, writer) -> dict:
+        """
+        Run the worker over every task and stream its chunks to the writer.
+
+        Args:
+            tasks (list): A list of (label, args) tuples, the worker is called as worker(*args).
+            worker (callable): A picklable function (a module level function or a static method) that
+                               returns an iterable of chunks, e.g. a generator. Its arguments and chunks
+                               are sent between processes.
+            writer (callable): Called as writer(label, chunks) in the main process, in order of completion,
+                               chunks is an iterator over the chunks of the task.
+
+        Returns:
+            dict: For every task, the seconds spent by the worker and by the writer.
+        """
+        stats = {}
+        t0 = time.time()
+
+        def write(label, chunks, timer, inline):
+            t1 = time.time()
+            writer(label, chunks)
+            write_seconds = time.time() - t1
+            # In the main process, the worker runs while the writer consumes its chunks
+            if inline:
+                write_seconds -= timer["seconds"]
+            stats[label] = {"parse_seconds": timer["seconds"], "write_seconds": write_seconds}
+            self._report(len(stats), len(tasks), label, timer["seconds"], write_seconds, t0)
+
+        if self.is_parallel(len(tasks)):
+            # Spawn the workers, forking a process with running client threads (gRPC, HTTP) is not safe
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks)), mp_context=context) as executor:
+                futures = {executor.submit(self._spill, worker, args, self.spill_dir): label for label, args in tasks}
+                try:
+                    for future in as_completed(futures):
+                        path, parse_seconds = future.result()
+                        chunks = self._read_spill(path)
+                        try:
+                            write(futures[future], chunks, {"seconds": parse_seconds}, False)
+                        finally:
+                            chunks.close()
+                            os.remove(path)
+                except Exception:
+                    # Do not start the pending tasks if a worker or the writer failed
+                    for future in futures:
+                        future.cancel()
+                    executor.shutdown(wait=True)
+                    # Remove the spill files of the tasks that finished but were not written
+                    for future in futures:
+                        if future.done() and not future.cancelled() and future.exception() is None:
+                            path = future.result()[0]
+                            if os.path.exists(path):
+                                os.remove(path)
+                    raise
+        else:
+            for label, args in tasks:
+                timer = {"seconds": 0.0}
+                write(label, self._timed_iter(worker(*args), timer), timer, True)
+        workers = min(self.max_workers, len(tasks)) if self.is_parallel(len(tasks)) else 1
+        print(f"{len(tasks)} files ingested with {workers} workers in {round(time.time()-t0,4)} seconds")
+
+        return stats
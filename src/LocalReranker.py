@@ -0,0 +1,79 @@
+import re
+import unicodedata
+import numpy as np
+from collections import Counter
+
+class LocalReranker:
+    """
+    Rerank the candidate documents of a search in process, without a remote API.
+
+    The score of a document is its BM25 score for the terms of the query, computed over the candidate
+    documents and scaled to [0, 1], plus the fraction of the numbers of the query (years, months, amounts,
+    with the Spanish month names converted to their number) that appear in the document. The scores of
+    all the candidates are computed at once as matrix operations.
+    """
+    MONTHS = {"enero": "1", "febrero": "2", "marzo": "3", "abril": "4", "mayo": "5", "junio": "6", "julio": "7",
+              "agosto": "8", "septiembre": "9", "setiembre": "9", "octubre": "10", "noviembre": "11", "diciembre": "12"}
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, numeric_weight: float = 1.0) -> None:
+        """
+        Initialize the instance with the scoring parameters.
+
+        Args:
+            k1 (float): The BM25 term frequency saturation.
+            b (float): The BM25 length normalization.
+            numeric_weight (float): The weight of the numbers of the query found in the document.
+        """
+        self.k1= k1
+        self.b= b
+        self.numeric_weight= numeric_weight
+
+    @staticmethod
+    def tokenize(text: str) -> list:
+        text = unicodedata.normalize('NFKD', text.lower())
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        return re.findall(r"\w+", text)
+
+    def score(self, query: str, documents: list) -> np.ndarray:
+        """
+        Score the documents for the query.
+
+        Returns:
+            np.ndarray: The score of every document.
+        """
+        if not documents:
+            return np.array([], dtype=np.float64)
+        query_tokens = self.tokenize(query)
+        terms = list(dict.fromkeys(token for token in query_tokens if not token.isdigit()))
+        numbers = list(dict.fromkeys([token for token in query_tokens if token.isdigit()]
+                                     + [self.MONTHS[token] for token in query_tokens if token in self.MONTHS]))
+        counts = [Counter(self.tokenize(document)) for document in documents]
+        lengths = np.array([sum(count.values()) for count in counts], dtype=np.float64)
+
+        scores = np.zeros(len(documents), dtype=np.float64)
+        if terms:
+            # Term frequency of every query term in every document
+            tf = np.array([[count.get(term, 0) for term in terms] for count in counts], dtype=np.float64)
+            df = (tf > 0).sum(axis=0)
+            idf = np.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1))
+            bm25 = (tf * (self.k1 + 1) / (tf + norm[:, None]) * idf).sum(axis=1)
+            if bm25.max() > 0:
+                scores += bm25 / bm25.max()
+        if numbers:
+            found = np.array([[number in count for number in numbers] for count in counts], dtype=np.float64)
+            scores += self.numeric_weight * found.mean(axis=1)
+
+        return scores
+
+    def rerank(self, query: str, documents: list, top_n: int = 2) -> list:
+        """
+        Rerank the documents for the query.
+
+        Returns:
+            list: The top_n documents with the highest scores.
+        """
+        scores = self.score(query, documents)
+        # Stable sort, the ties keep the order of the vector search
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        return [documents[i] for i in order]
@@ -0,0 +1,500 @@
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import threading
+import numpy as np
+
+from src.VectorDB import VectorDB, SearchHit
+
+class LocalVectorDB(VectorDB):
+    """
+    An in-process vector store with the interface of VectorDB, for collections that fit in memory.
+
+    Every collection is a directory with the embeddings, normalized to unit length, in a float32 matrix
+    that is memory-mapped (vectors.npy), the scalar fields of the documents (fields.json) and, for large
+    collections, an IVF index (ivf.npz): the vectors are clustered with spherical k-means and a search only
+    scores the vectors of the `nprobe` clusters closest to the query. Below `ivf_min_rows` vectors, or when
+    a filter leaves fewer candidates, the search is an exact brute-force cosine top-k computed as a single
+    matrix product. The Milvus filter expressions built by the agents (==, !=, <, <=, >, >=, like, in,
+    and, or, not) are evaluated over the scalar fields. The inserts are kept in memory until `flush`
+    writes the collection to disk and rebuilds its index.
+
+    With quantization, the search scores scalar quantized codes kept in memory (float16, or int8 with a
+    scale per dimension, 2x and 4x smaller than float32), and only the `rescore` * topk best candidates
+    of every query are scored again exactly with the float32 vectors, read from the memory-mapped file.
+    """
+    # Integer scalar fields, the others are strings
+    INT_FIELDS = ["batch"] + VectorDB.RANGE_FIELDS
+    # Dtype of the quantized codes
+    QUANTIZATION_TYPES = {None: None, "float16": np.float16, "int8": np.int8}
+
+    def __init__(self, uri: str, token: str = "", rerank: bool = False, reranker: str = "cohere",
+                 nlist: int = None, nprobe: int = 8, ivf_min_rows: int = 50000, kmeans_iterations: int = 10,
+                 quantization: str = None, rescore: int = 4) -> None:
+        """
+        Initialize the instance with the directory of the collections and the index parameters.
+
+        Args:
+            uri (str): The directory of the collections.
+            token (str): Not used, kept for the interface of VectorDB.
+            rerank (bool): Rerank the search candidates, see VectorDB.
+            reranker (str): 'cohere' or 'local', see VectorDB.
+            nlist (int): Number of clusters of the IVF index, by default the square root of the number of vectors.
+            nprobe (int): Number of clusters scored per query, can be set per search with
+                          search_params={"params": {"nprobe": ...}}.
+            ivf_min_rows (int): Minimum number of vectors to build and use the IVF index.
+            kmeans_iterations (int): Number of k-means iterations to train the IVF index.
+            quantization (str): None to search the float32 vectors, 'float16' or 'int8' to search quantized codes.
+            rescore (int): With quantization, the candidates scored exactly per query, as a multiple of topk.
+        """
+        if quantization not in self.QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization {quantization}, use one of {list(self.QUANTIZATION_TYPES)}")
+        super().__init__(uri, token, rerank=rerank, reranker=reranker)
+        self.nlist= nlist
+        self.nprobe= nprobe
+        self.ivf_min_rows= ivf_min_rows
+        self.kmeans_iterations= kmeans_iterations
+        self.quantization= quantization
+        self.rescore= rescore
+        self.collections= {}
+        self.lock= threading.Lock()
+        self.reset_insert_stats()
+
+    def load_milvus_client(self):
+        os.makedirs(self.uri, exist_ok=True)
+        print(f"Using the local vector store: {self.uri}")
+
+    def _collection_dir(self, collection_name: str) -> str:
+        return os.path.join(self.uri, collection_name)
+
+    def prepare_vectordb(self, collection_name: str, dim: int, drop_existing: bool = True):
+        """
+        Create the collection, dropping the existing one unless `drop_existing` is False.
+        """
+        self.dim= dim
+        self.collection_name= collection_name
+        collection_dir = self._collection_dir(collection_name)
+        if os.path.exists(collection_dir) and not drop_existing:
+            print(f"Using the existing collection: {collection_name}")
+            self.load_milvus_collection(collection_name)
+            return
+
+        if os.path.exists(collection_dir):
+            shutil.rmtree(collection_dir)
+            print("Success to drop the existing collection %s" % collection_name)
+        os.makedirs(collection_dir)
+        print(f"Creating collection: {collection_name}")
+        self.collections[collection_name] = {"dim": dim, "next_id": 1, "vectors": np.zeros((0, dim), dtype=np.float32),
+                                             "fields": self._empty_fields(), "ivf": None, "quantized": None, "pending": [],
+                                             "dirty": True}
+        self.flush(collection_name)
+
+    @staticmethod
+    def _empty_fields() -> dict:
+        fields = {"row_id": np.zeros(0, dtype=np.int64)}
+        for field in VectorDB.OUTPUT_FIELDS:
+            fields[field] = np.zeros(0, dtype=np.int64 if field in LocalVectorDB.INT_FIELDS else object)
+        return fields
+
+    def load_milvus_collection(self, collection_name: str):
+        """
+        Load the collection from disk, the vectors are memory-mapped.
+        """
+        collection_dir = self._collection_dir(collection_name)
+        with open(os.path.join(collection_dir, "fields.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        fields = self._empty_fields()
+        for field, values in data["fields"].items():
+            fields[field] = np.array(values, dtype=fields[field].dtype)
+        ivf = None
+        if os.path.exists(os.path.join(collection_dir, "ivf.npz")):
+            with np.load(os.path.join(collection_dir, "ivf.npz")) as index:
+                ivf = {name: index[name] for name in ("centroids", "order", "offsets")}
+        quantized = None
+        if self.quantization is not None and os.path.exists(os.path.join(collection_dir, f"{self.quantization}.npz")):
+            with np.load(os.path.join(collection_dir, f"{self.quantization}.npz")) as codes:
+                quantized = {name: codes[name] for name in ("codes", "scale")}
+        self.collections[collection_name] = {"dim": data["dim"], "next_id": data["next_id"], "fields": fields,
+                                             "vectors": np.load(os.path.join(collection_dir, "vectors.npy"), mmap_mode="r"),
+                                             "ivf": ivf, "quantized": quantized, "pending": [], "dirty": False}
+        if self.quantization is not None and quantized is None:
+            # The collection was written without the codes of this quantization
+            self.collections[collection_name]["dirty"] = True
+            self.flush(collection_name)
+        print(f"Loaded Vector DB: {self.uri}/{collection_name}, {len(fields['row_id'])} vectors"
+              f"{', IVF index of ' + str(len(ivf['centroids'])) + ' clusters' if ivf else ''}")
+
+    def reset_insert_stats(self):
+        self.insert_stats= {"rows": 0, "batches": 0, "seconds": 0.0}
+
+    def insert_summary(self) -> dict:
+        return {"rows": self.insert_stats["rows"], "batches": self.insert_stats["batches"],
+                "seconds": round(self.insert_stats["seconds"], 4)}
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def insert(self, collection_name: str, columns: dict) -> dict:
+        """
+        Add columnar data to the collection, it is written to disk by `flush`.
+
+        Args:
+            collection_name (str): The name of the collection.
+            columns (dict): The values of every field of the collection, all the columns have the same length.
+
+        Returns:
+            dict: The number of rows inserted and the time in seconds.
+        """
+        t0 = time.time()
+        collection = self.collections[collection_name]
+        num_rows = len(columns["row_embedding"])
+        with self.lock:
+            row_ids = np.arange(collection["next_id"], collection["next_id"] + num_rows, dtype=np.int64)
+            collection["next_id"] += num_rows
+            collection["pending"].append((row_ids, self._normalize(columns["row_embedding"]),
+                                          {field: columns.get(field, [0 if field in self.INT_FIELDS else ""] * num_rows)
+                                           for field in self.OUTPUT_FIELDS}))
+            collection["dirty"] = True
+        seconds = time.time() - t0
+        self.insert_stats["rows"] += num_rows
+        self.insert_stats["batches"] += 1
+        self.insert_stats["seconds"] += seconds
+
+        return {"rows": num_rows, "batches": 1, "seconds": seconds}
+
+    def flush(self, collection_name: str):
+        """
+        Write the collection to disk and rebuild its IVF index, if it has changed.
+        """
+        with self.lock:
+            collection = self.collections[collection_name]
+            if not collection["dirty"]:
+                return
+            t0 = time.time()
+            fields = collection["fields"]
+            vectors = collection["vectors"]
+            pending = collection["pending"]
+            if pending:
+                vectors = np.concatenate([vectors] + [pending_vectors for _, pending_vectors, _ in pending])
+                fields["row_id"] = np.concatenate([fields["row_id"]] + [row_ids for row_ids, _, _ in pending])
+                for field in self.OUTPUT_FIELDS:
+                    fields[field] = np.concatenate([fields[field]] + [np.array(pending_fields[field], dtype=fields[field].dtype)
+                                                                      for _, _, pending_fields in pending])
+            collection_dir = self._collection_dir(collection_name)
+            # Release the memory map of the old file before replacing it
+            if isinstance(vectors, np.memmap):
+                vectors = np.array(vectors)
+            collection["vectors"] = None
+            self._write(os.path.join(collection_dir, "vectors.npy"), lambda f: np.save(f, vectors))
+            self._write(os.path.join(collection_dir, "fields.json"), lambda f: f.write(json.dumps(
+                {"dim": collection["dim"], "next_id": collection["next_id"],
+                 "fields": {field: values.tolist() for field, values in fields.items()}}, ensure_ascii=False).encode("utf-8")))
+
+            ivf = self._train_ivf(vectors) if len(vectors) >= self.ivf_min_rows else None
+            index_path = os.path.join(collection_dir, "ivf.npz")
+            if ivf is not None:
+                self._write(index_path, lambda f: np.savez(f, **ivf))
+            elif os.path.exists(index_path):
+                os.remove(index_path)
+            quantized = None
+            if self.quantization is not None:
+                quantized = self._quantize(vectors)
+                self._write(os.path.join(collection_dir, f"{self.quantization}.npz"), lambda f: np.savez(f, **quantized))
+            collection.update(vectors=np.load(os.path.join(collection_dir, "vectors.npy"), mmap_mode="r"),
+                              ivf=ivf, quantized=quantized, pending=[], dirty=False)
+        print(f"Collection {collection_name} flushed: {len(vectors)} vectors"
+              f"{', IVF index of ' + str(len(ivf['centroids'])) + ' clusters' if ivf else ''} in {round(time.time()-t0,4)} seconds")
+
+    def _quantize(self, vectors: np.ndarray) -> dict:
+        """
+        Scalar quantize the vectors, the score of a code is `codes @ (scale * query)`.
+
+        Returns:
+            dict: The quantized 'codes' and the 'scale' of every dimension.
+        """
+        if self.quantization == "float16":
+            return {"codes": vectors.astype(np.float16), "scale": np.ones(vectors.shape[1], dtype=np.float32)}
+        # Symmetric int8 quantization, every dimension is scaled by its maximum absolute value
+        scale = np.maximum(np.abs(vectors).max(axis=0) if len(vectors) else np.ones(vectors.shape[1]), 1e-12) / 127
+        scale = scale.astype(np.float32)
+        return {"codes": np.round(vectors / scale).astype(np.int8), "scale": scale}
+
+    @staticmethod
+    def _write(path: str, write):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _train_ivf(self, vectors: np.ndarray, block_size: int = 65536) -> dict:
+        """
+        Cluster the vectors with spherical k-means on a sample and assign every vector to its closest centroid.
+
+        Returns:
+            dict: The 'centroids', the positions of the vectors sorted by cluster ('order') and the start of
+                  every cluster in that order ('offsets').
+        """
+        rng = np.random.default_rng(0)
+        nlist = min(self.nlist or int(np.sqrt(len(vectors))), len(vectors))
+        sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False))]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assignments, minlength=nlist)
+            order = np.argsort(assignments, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = sample[rng.choice(len(sample), nlist)]
+            # The empty clusters are moved to random vectors of the sample
+            sums[counts > 0] = np.add.reduceat(sample[order], starts[counts > 0], axis=0)
+            centroids = self._normalize(sums)
+
+        assignments = np.concatenate([np.argmax(vectors[i:i+block_size] @ centroids.T, axis=1)
+                                      for i in range(0, len(vectors), block_size)])
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+
+        return {"centroids": centroids, "order": order, "offsets": offsets}
+
+    # Tokens of the filter expressions: strings, numbers, operators and names
+    FILTER_TOKEN = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|(-?\d+(?:\.\d+)?)|(==|!=|<=|>=|<|>|\(|\)|\[|\]|,)|(\w+))')
+    COMPARISONS = {"==": np.equal, "!=": np.not_equal, "<=": np.less_equal, ">=": np.greater_equal,
+                   "<": np.less, ">": np.greater}
+
+    def _filter_mask(self, fields: dict, expression: str) -> np.ndarray:
+        """
+        Evaluate a Milvus filter expression over the scalar fields of a collection.
+
+        Returns:
+            np.ndarray: The boolean mask of the documents that match the expression.
+        """
+        tokens = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = self.FILTER_TOKEN.match(expression, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Invalid filter expression at {position}: {expression}")
+            string, number, operator, name = match.groups()
+            if string is not None:
+                tokens.append(("value", json.loads(string)))
+            elif number is not None:
+                tokens.append(("value", float(number) if "." in number else int(number)))
+            elif operator is not None:
+                tokens.append(("op", operator))
+            else:
+                tokens.append(("op", name.lower()) if name.lower() in ("and", "or", "not", "like", "in") else ("name", name))
+            position = match.end()
+        tokens.append(("end", None))
+        position = 0
+
+        def take(kind=None, value=None):
+            nonlocal position
+            token = tokens[position]
+            if (kind and token[0] != kind) or (value and token[1] != value):
+                raise ValueError(f"Invalid filter expression, unexpected {token[1]}: {expression}")
+            position += 1
+            return token[1]
+
+        def value_list():
+            take("op", "[")
+            values = []
+            while tokens[position] != ("op", "]"):
+                values.append(take("value"))
+                if tokens[position] == ("op", ","):
+                    take()
+            take("op", "]")
+            return values
+
+        def comparison():
+            field = take("name")
+            if field not in fields:
+                raise ValueError(f"Unknown field {field} in the filter expression: {expression}")
+            values = fields[field]
+            operator = take("op")
+            if operator == "like":
+                pattern = re.compile(".*".join(".".join(re.escape(part) for part in text.split("_"))
+                                               for text in take("value").split("%")), re.DOTALL)
+                return np.fromiter((pattern.fullmatch(value) is not None for value in values), dtype=bool, count=len(values))
+            if operator == "in":
+                allowed = set(value_list())
+                return np.fromiter((value in allowed for value in values), dtype=bool, count=len(values))
+            if operator not in self.COMPARISONS:
+                raise ValueError(f"Invalid filter expression, unexpected {operator}: {expression}")
+            return np.asarray(self.COMPARISONS[operator](values, take("value")), dtype=bool)
+
+        def unary():
+            if tokens[position] == ("op", "not"):
+                take()
+                return ~unary()
+            if tokens[position] == ("op", "("):
+                take()
+                mask = disjunction()
+                take("op", ")")
+                return mask
+            return comparison()
+
+        def conjunction():
+            mask = unary()
+            while tokens[position] == ("op", "and"):
+                take()
+                mask = mask & unary()
+            return mask
+
+        def disjunction():
+            mask = conjunction()
+            while tokens[position] == ("op", "or"):
+                take()
+                mask = mask | conjunction()
+            return mask
+
+        mask = disjunction()
+        take("end")
+        return mask
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, topk: int) -> np.ndarray:
+        topk = min(topk, len(scores))
+        if topk == 0:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.argpartition(-scores, topk - 1)[:topk]
+        return positions[np.argsort(-scores[positions], kind="stable")]
+
+    def search(self, collection_name: str, query_vectors: list, topk: int, search_params: dict,
+               filter: str = "") -> list:
+        """
+        Search the documents most similar to one or more query vectors by cosine similarity, see VectorDB.search.
+
+        The search is exact over the whole collection or the documents of the filter, unless the candidates
+        are at least `ivf_min_rows` and the collection has an IVF index, then only the `nprobe` clusters
+        closest to every query are scored. With quantization the candidates are scored with the codes and
+        the best `rescore` * topk of them are scored again with the float32 vectors.
+        """
+        collection = self.collections[collection_name]
+        if collection["dirty"]:
+            self.flush(collection_name)
+        vectors = collection["vectors"]
+        fields = collection["fields"]
+        queries = self._normalize(query_vectors)
+        candidates = np.flatnonzero(self._filter_mask(fields, filter)) if filter else None
+        num_candidates = len(vectors) if candidates is None else len(candidates)
+        nprobe = (search_params or {}).get("params", {}).get("nprobe", self.nprobe)
+        ivf = collection["ivf"]
+
+        # With quantization, more candidates are kept to be scored again exactly
+        quantized = collection["quantized"]
+        k = topk * self.rescore if quantized is not None else topk
+        results = []
+        if ivf is None or num_candidates < self.ivf_min_rows or nprobe >= len(ivf["centroids"]):
+            # Brute force, all the queries are scored with a single matrix product
+            scores = self._scores(collection, queries, candidates)
+            for i in range(len(queries)):
+                positions = self._top_k(scores[:, i], k)
+                results.append((positions if candidates is None else candidates[positions], scores[positions, i]))
+        else:
+            allowed = None
+            if candidates is not None:
+                allowed = np.zeros(len(vectors), dtype=bool)
+                allowed[candidates] = True
+            probes = np.argsort(-(queries @ ivf["centroids"].T), axis=1)[:, :nprobe]
+            for query, clusters in zip(queries, probes):
+                rows = np.concatenate([ivf["order"][ivf["offsets"][c]:ivf["offsets"][c+1]] for c in clusters])
+                if allowed is not None:
+                    rows = rows[allowed[rows]]
+                rows.sort()
+                scores = self._scores(collection, query[None, :], rows)[:, 0]
+                positions = self._top_k(scores, k)
+                results.append((rows[positions], scores[positions]))
+
+        if quantized is not None:
+            # Exact re-scoring of the candidates with the float32 vectors
+            for i, (rows, _) in enumerate(results):
+                rows = np.sort(rows)
+                scores = vectors[rows] @ queries[i]
+                positions = self._top_k(scores, topk)
+                results[i] = (rows[positions], scores[positions])
+
+        return [[SearchHit(row_id=int(fields["row_id"][row]), score=float(score),
+                           **{field: fields[field][row].item() if fields[field].dtype == np.int64 else fields[field][row]
+                              for field in self.OUTPUT_FIELDS})
+                 for row, score in zip(rows, scores)] for rows, scores in results]
+
+    @staticmethod
+    def _scores(collection: dict, queries: np.ndarray, rows: np.ndarray = None, block_size: int = 65536) -> np.ndarray:
+        """
+        Score some rows of the collection, or all of them, for the queries.
+
+        Returns:
+            np.ndarray: The cosine similarity of every row (first axis) and query, estimated with the
+                        quantized codes if the collection has them.
+        """
+        quantized = collection["quantized"]
+        if quantized is None:
+            vectors = collection["vectors"]
+            return (vectors if rows is None else vectors[rows]) @ queries.T
+        codes = quantized["codes"] if rows is None else quantized["codes"][rows]
+        queries = (queries * quantized["scale"]).T
+        # The codes are converted to float32 in blocks, to bound the memory of the product
+        return np.concatenate([codes[i:i+block_size].astype(np.float32) @ queries
+                               for i in range(0, len(codes), block_size)] or [np.zeros((0, queries.shape[1]), dtype=np.float32)])
+
+    async def asearch(self, collection_name: str, query_vectors: list, topk: int, search_params: dict,
+                      filter: str = "") -> list:
+        """
+        Search without blocking the event loop, the NumPy products release the GIL.
+        """
+        return await asyncio.to_thread(self.search, collection_name, query_vectors, topk, search_params, filter)
+
+    def iter_fields(self, collection_name: str, fields: list, batch_size: int = 1000):
+        """
+        Iterate over the values of some scalar fields of every document of the collection, in pages.
+        """
+        collection = self.collections[collection_name]
+        if collection["dirty"]:
+            self.flush(collection_name)
+        columns = [collection["fields"][field] for field in fields]
+        for i in range(0, len(columns[0]) if columns else 0, batch_size):
+            for values in zip(*(column[i:i+batch_size].tolist() for column in columns)):
+                yield dict(zip(fields, values))
+
+    def _flushed_fields(self, collection_name: str) -> dict:
+        """
+        The scalar fields of the collection, flushing the pending inserts first, so they can be deleted too.
+        """
+        collection = self.collections[collection_name]
+        if collection["dirty"]:
+            self.flush(collection_name)
+        return collection["fields"]
+
+    def _delete(self, collection_name: str, mask: np.ndarray):
+        # The mask is built over the flushed fields, see _flushed_fields
+        collection = self.collections[collection_name]
+        with self.lock:
+            keep = ~mask
+            collection["vectors"] = collection["vectors"][keep]
+            collection["fields"] = {field: values[keep] for field, values in collection["fields"].items()}
+            collection["dirty"] = True
+        self.flush(collection_name)
+
+    def delete_partitions(self, collection_name: str, source: str, partitions: list):
+        """
+        Delete the documents of some partitions of a source datafile.
+        """
+        fields = self._flushed_fields(collection_name)
+        partitions = set(partitions)
+        self._delete(collection_name, (fields["source"] == source) &
+                     np.fromiter((partition in partitions for partition in fields["partition"]), dtype=bool,
+                                 count=len(fields["partition"])))
+        print(f"Deleted {len(partitions)} partitions of {source} from {collection_name}")
+
+    def delete_source(self, collection_name: str, source: str):
+        """
+        Delete all the documents of a source datafile.
+        """
+        self._delete(collection_name, np.asarray(self._flushed_fields(collection_name)["source"] == source, dtype=bool))
+        print(f"Deleted {source} from {collection_name}")
@@ -0,0 +1,121 @@
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+class MilvusBulkInserter:
+    """
+    Insert columnar data into a Milvus collection in batches sized by payload bytes.
+
+    The data is kept by columns and the rows of every batch are only built in the worker thread
+    that inserts it, so several inserts run concurrently and the client side overhead is overlapped
+    with the Milvus calls. Every row is inserted, the last batch may be smaller than the others.
+    """
+    def __init__(self, milvus_client, max_batch_bytes: int = 8 * 1024**2, max_batch_rows: int = 10000,
+                 max_workers: int = 4) -> None:
+        """
+        Initialize the instance with the Milvus client and the batching parameters.
+
+        Args:
+            milvus_client (MilvusClient): The Milvus client.
+            max_batch_bytes (int): Maximum estimated size in bytes of the payload of an insert.
+            max_batch_rows (int): Maximum number of rows of an insert.
+            max_workers (int): Maximum number of inserts running at the same time.
+        """
+        self.milvus_client= milvus_client
+        self.max_batch_bytes= max_batch_bytes
+        self.max_batch_rows= max_batch_rows
+        self.max_workers= max_workers
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats= {"rows": 0, "batches": 0, "seconds": 0.0, "latencies": []}
+
+    @staticmethod
+    def _column_bytes(values) -> np.ndarray:
+        """
+        Estimate the payload size of every value of a column.
+        """
+        if isinstance(values, np.ndarray) and values.ndim == 2:
+            return np.full(len(values), values.shape[1] * values.itemsize, dtype=np.int64)
+        first = values[0]
+        if isinstance(first, str):
+            return np.fromiter((len(value.encode('utf-8')) for value in values), dtype=np.int64, count=len(values))
+        if isinstance(first, (list, tuple, np.ndarray)):
+            # Float vectors are sent as float32
+            return np.fromiter((len(value) * 4 for value in values), dtype=np.int64, count=len(values))
+        return np.full(len(values), 8, dtype=np.int64)
+
+    def _make_batches(self, row_bytes: np.ndarray) -> list:
+        """
+        Split the rows into consecutive batches that fit the size budget.
+
+        Returns:
+            list: A list of (start, end) ranges over the rows.
+        """
+        batches = []
+        start = 0
+        batch_bytes = 0
+        for i, size in enumerate(row_bytes.tolist()):
+            if i > start and (batch_bytes + size > self.max_batch_bytes or i - start >= self.max_batch_rows):
+                batches.append((start, i))
+                start = i
+                batch_bytes = 0
+            batch_bytes += size
+        if start < len(row_bytes):
+            batches.append((start, len(row_bytes)))
+
+        return batches
+
+    def _insert_batch(self, collection_name: str, columns: dict, start: int, end: int) -> tuple:
+        names = list(columns)
+        rows = [dict(zip(names, values)) for values in zip(*(columns[name][start:end] for name in names))]
+        t0 = time.time()
+        self.milvus_client.insert(collection_name, rows)
+        return len(rows), time.time() - t0
+
+    def insert(self, collection_name: str, columns: dict) -> dict:
+        """
+        Insert the rows of some columns into the collection.
+
+        Args:
+            collection_name (str): The name of the collection.
+            columns (dict): The values of every field of the collection, all the columns have the same length.
+
+        Returns:
+            dict: The number of rows and batches, the total time in seconds, the rows per second and
+                  the latency in seconds of every batch.
+        """
+        num_rows = len(next(iter(columns.values())))
+        if num_rows == 0:
+            return {"rows": 0, "batches": 0, "seconds": 0.0, "rows_per_sec": 0.0, "latencies": []}
+
+        row_bytes = sum(self._column_bytes(values) for values in columns.values())
+        batches = self._make_batches(row_bytes)
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda batch: self._insert_batch(collection_name, columns, *batch), batches))
+        seconds = time.time() - t0
+
+        latencies = [latency for _, latency in results]
+        stats = {"rows": sum(rows for rows, _ in results), "batches": len(batches), "seconds": seconds,
+                 "rows_per_sec": num_rows / seconds if seconds else 0.0, "latencies": latencies}
+        self.stats["rows"] += stats["rows"]
+        self.stats["batches"] += stats["batches"]
+        self.stats["seconds"] += seconds
+        self.stats["latencies"] += latencies
+        print(f"Inserted {stats['rows']} rows in {stats['batches']} batches in {round(seconds,4)} seconds "
+              f"({round(stats['rows_per_sec'])} rows/sec), batch latency p50 {round(float(np.median(latencies)),4)} "
+              f"max {round(max(latencies),4)} seconds")
+
+        return stats
+
+    def summary(self) -> dict:
+        """
+        Return the totals of all the inserts since the last reset.
+        """
+        latencies = self.stats["latencies"]
+        return {"rows": self.stats["rows"], "batches": self.stats["batches"],
+                "seconds": round(self.stats["seconds"], 4),
+                "rows_per_sec": round(self.stats["rows"] / self.stats["seconds"]) if self.stats["seconds"] else 0,
+                "latency_p50": round(float(np.median(latencies)), 4) if latencies else 0.0,
+                "latency_p95": round(float(np.percentile(latencies, 95)), 4) if latencies else 0.0}
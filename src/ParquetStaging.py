@@ -0,0 +1,142 @@
+import os
+import re
+import pandas as pd
+
+from src.IngestManifest import IngestManifest
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+class ParquetStaging:
+    """
+    A columnar staging area of the source datafiles.
+
+    Every datafile is converted once into a Parquet file, keyed by the hash of its content, with UTF-8
+    text and the decimal separator already parsed. The SQL loader, the vector pipeline and any analytics
+    read the staged file instead of parsing the CSV again: the Parquet file is memory-mapped, read in
+    batches of rows and only the requested columns are decoded. A new version of a datafile gets a new
+    hash, so it is staged again and the old version is removed. Requires pyarrow.
+    """
+    def __init__(self, staging_dir: str, csv_sep: str, csv_codec: str, csv_decimal: str = ",",
+                 block_size: int = 64 * 1024**2, datafiles: list = None) -> None:
+        """
+        Initialize the instance with the staging directory and the format of the CSV files.
+
+        Args:
+            staging_dir (str): The directory of the staged Parquet files.
+            csv_sep (str): The separator of the CSV files.
+            csv_codec (str): The encoding of the CSV files.
+            csv_decimal (str): The decimal separator of the numbers in the CSV files without a `csv_decimal`.
+            block_size (int): Bytes of the CSV file parsed at a time, the column types are inferred from the
+                              first block.
+            datafiles (list): The datafiles configuration, used to get the `csv_decimal` separator of every file.
+        """
+        if pa is None:
+            raise ImportError("The Parquet staging requires pyarrow, install it with `pip install pyarrow`")
+        self.staging_dir= staging_dir
+        self.csv_sep= csv_sep
+        self.csv_codec= csv_codec
+        self.csv_decimal= csv_decimal
+        self.block_size= block_size
+        self.csv_decimals= {datafile["filename"]: datafile["csv_decimal"] for datafile in datafiles or []
+                            if datafile.get("csv_decimal")}
+        os.makedirs(staging_dir, exist_ok=True)
+
+    @staticmethod
+    def is_available() -> bool:
+        return pa is not None
+
+    def staged_path(self, file_path: str, file_hash: str = None) -> str:
+        # Hashing the datafile reads it whole, the callers that already have its hash pass it
+        file_name = os.path.splitext(os.path.basename(file_path))[0]
+        file_hash = file_hash or IngestManifest.file_fingerprint(file_path)
+        return os.path.join(self.staging_dir, f"{file_name}-{file_hash[:16]}.parquet")
+
+    def _decimal(self, file_path: str) -> str:
+        return self.csv_decimals.get(os.path.basename(file_path), self.csv_decimal)
+
+    def _convert(self, file_path: str, parquet_path: str):
+        tmp_path = parquet_path + ".tmp"
+        file_extension = os.path.splitext(file_path)[1]
+        if file_extension == ".csv":
+            # Stream the CSV file into the Parquet file, one block at a time
+            reader = pa_csv.open_csv(file_path,
+                                     read_options=pa_csv.ReadOptions(encoding=self.csv_codec, block_size=self.block_size),
+                                     parse_options=pa_csv.ParseOptions(delimiter=self.csv_sep),
+                                     convert_options=pa_csv.ConvertOptions(decimal_point=self._decimal(file_path)))
+            with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+        elif file_extension == ".xlsx":
+            pq.write_table(pa.Table.from_pandas(pd.read_excel(file_path), preserve_index=False), tmp_path)
+        else:
+            raise ValueError("The selected file type is not supported")
+        os.replace(tmp_path, parquet_path)
+
+    def stage(self, file_path: str, file_hash: str = None) -> str:
+        """
+        Convert a datafile into Parquet, unless the same version was already staged.
+
+        Args:
+            file_path (str): The path of the CSV or XLSX datafile.
+            file_hash (str): The hash of the datafile, if it was already computed.
+
+        Returns:
+            str: The path of the staged Parquet file.
+        """
+        parquet_path = self.staged_path(file_path, file_hash)
+        if os.path.exists(parquet_path):
+            return parquet_path
+
+        self._convert(file_path, parquet_path)
+        # Remove the previous versions of the datafile
+        file_name = os.path.splitext(os.path.basename(file_path))[0]
+        pattern = re.compile(re.escape(file_name) + r"-[0-9a-f]{16}\.parquet")
+        for old_name in os.listdir(self.staging_dir):
+            old_path = os.path.join(self.staging_dir, old_name)
+            if pattern.fullmatch(old_name) and old_path != parquet_path:
+                os.remove(old_path)
+        print(f"File {os.path.basename(file_path)} staged into {parquet_path}")
+
+        return parquet_path
+
+    def iter_chunks(self, file_path: str, chunk_size: int, limit: int = None, columns: list = None,
+                    file_hash: str = None):
+        """
+        Read a datafile from the staging area in DataFrame chunks.
+
+        Args:
+            file_path (str): The path of the CSV or XLSX datafile, it is staged if needed.
+            chunk_size (int): Number of rows per chunk.
+            limit (int): Maximum number of rows to read, 0 or None to read the whole file.
+            columns (list): The columns to read, None to read every column.
+            file_hash (str): The hash of the datafile, if it was already computed.
+
+        Yields:
+            DataFrame: The next chunk of rows.
+        """
+        parquet_file = pq.ParquetFile(self.stage(file_path, file_hash), memory_map=True)
+        rows = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            df = batch.to_pandas()
+            if limit:
+                df = df.iloc[:limit - rows]
+            if len(df):
+                df.index = pd.RangeIndex(rows, rows + len(df))
+                yield df
+            rows += len(df)
+            if limit and rows >= limit:
+                break
+
+    def read(self, file_path: str, columns: list = None, limit: int = None, file_hash: str = None) -> pd.DataFrame:
+        """
+        Read a datafile from the staging area into a single DataFrame.
+        """
+        table = pq.read_table(self.stage(file_path, file_hash), columns=columns, memory_map=True)
+        if limit:
+            table = table.slice(0, limit)
+        return table.to_pandas()
@@ -1,23 +1,281 @@
-import cohere
+import time
+import asyncio
 
-class RAGTabularDataAgent:
+from src.StreamingAgent import StreamingAgent
+
+class RAGTabularDataAgent(StreamingAgent):
     """
     A RAG Agent to query Tabular Data 
     """
-    def __init__(self,agent_system_role: str, collection_name:str, embedding_model, langchain_llm, vectordb) -> None:
+    def __init__(self,agent_system_role: str, collection_name:str, embedding_model, langchain_llm, vectordb,
+                 embeddings_cache= None, answer_cache= None, entity_extractor= None, rerank_candidates: int = 4,
+                 context_builder= None) -> None:
         """
-        Initialize an instance of PrepareSQLFromTabularData.
+        Initialize an instance of RAGTabularDataAgent.
 
         Args:
-            files_dir (str): The directory containing the CSV or XLSX files to be converted to SQL tables.
+            agent_system_role (str): The system prompt of the LLM.
+            collection_name (str): The name of the collection of the documents.
+            embedding_model (Embeddings): The embedding model of the queries.
+            langchain_llm (BaseChatModel): The LLM that writes the answers.
+            vectordb (VectorDB): The vector store, a VectorDB or a LocalVectorDB.
+            embeddings_cache (EmbeddingCache): An optional cache of embeddings for the user queries.
+            answer_cache (AnswerCache): An optional cache of answers, matched by text or by query embedding.
+            entity_extractor (EntityExtractor): If set, the search is filtered by the provinces, years and months
+                                                named in the question.
+            rerank_candidates (int): When the vector DB reranks, the search retrieves topk * rerank_candidates
+                                     documents and the reranker keeps the best topk.
+            context_builder (ContextBuilder): If set, the retrieved documents are deduplicated and written in
+                                              the prompt as compact tables within a token budget.
         """
         self.langchain_llm= langchain_llm
         self.embeddings_model= embedding_model
+        self.embeddings_cache= embeddings_cache
+        self.answer_cache= answer_cache
+        self.entity_extractor= entity_extractor
+        self.rerank_candidates= rerank_candidates
+        self.context_builder= context_builder
+        # Seconds spent in every stage of the last response of respond or stream, and to the first token of the
+        # last response of stream. The async methods return them per call, they answer many messages at once
+        self.stage_seconds= {}
+        self.stream_seconds= {}
         self.vectordb= vectordb
         self.agent_system_role= agent_system_role
         self.collection_name= collection_name
         self.chatbot= []
 
+    def _embed_query(self, message: str) -> list:
+        """
+        Embed the user query, looking it up in the embeddings cache first.
+        """
+        if self.embeddings_cache is not None:
+            query_embeddings = self.embeddings_cache.get(message)
+            if query_embeddings is not None:
+                return query_embeddings
+
+        query_embeddings = self.embeddings_model.embed_query(message)
+        if self.embeddings_cache is not None:
+            self.embeddings_cache.put(message, query_embeddings)
+
+        return query_embeddings
+
+    async def _aembed_query(self, message: str) -> list:
+        """
+        Embed the user query with the async embeddings client, looking it up in the embeddings cache first.
+        """
+        if self.embeddings_cache is not None:
+            query_embeddings = self.embeddings_cache.get(message)
+            if query_embeddings is not None:
+                return query_embeddings
+
+        query_embeddings = await self.embeddings_model.aembed_query(message)
+        if self.embeddings_cache is not None:
+            self.embeddings_cache.put(message, query_embeddings)
+
+        return query_embeddings
+
+    def _embed_queries(self, messages: list) -> list:
+        """
+        Embed several user queries with a single call, looking them up in the embeddings cache first.
+        """
+        if self.embeddings_cache is None:
+            return self.embeddings_model.embed_documents(messages)
+
+        query_embeddings = self.embeddings_cache.get_many(messages)
+        missing = list(dict.fromkeys(message for message, embedding in zip(messages, query_embeddings) if embedding is None))
+        if missing:
+            new_embeddings = self.embeddings_model.embed_documents(missing)
+            self.embeddings_cache.put_many(missing, new_embeddings)
+            new_embeddings = dict(zip(missing, new_embeddings))
+            query_embeddings = [new_embeddings[message] if embedding is None else embedding
+                                for message, embedding in zip(messages, query_embeddings)]
+
+        return query_embeddings
+
+    def retrieve(self, messages: list, search_params: dict, topk: int) -> list:
+        """
+        Retrieve the documents related to a list of user queries with a single embedding call and a single search.
+
+        Args:
+            messages (list): The user queries.
+            search_params (dict): The Milvus search parameters.
+            topk (int): Number of documents retrieved per query.
+
+        Returns:
+            list: For every query, the list of SearchHit sorted by score.
+        """
+        query_embeddings = self._embed_queries(messages)
+
+        return self._search(messages, query_embeddings, search_params, topk)
+
+    def _filter_groups(self, messages: list) -> tuple:
+        """
+        Build the filter of every query and group the queries with the same filter.
+
+        Returns:
+            list, dict: The filter of every query and, for every filter, the positions of its queries.
+        """
+        filters = [self.entity_extractor.question_filter(message) if self.entity_extractor is not None else ""
+                   for message in messages]
+        groups = {}
+        for i, query_filter in enumerate(filters):
+            groups.setdefault(query_filter, []).append(i)
+        for query_filter in groups:
+            if query_filter:
+                print(f"Search filter: {query_filter}")
+
+        return filters, groups
+
+    def _search(self, messages: list, query_embeddings: list, search_params: dict, topk: int) -> list:
+        """
+        Search the documents of several queries, filtered by the entities named in every query.
+
+        The queries with the same filter are searched together. A query whose filtered search finds
+        no document is searched again over the whole collection.
+        """
+        filters, groups = self._filter_groups(messages)
+        results = [None] * len(messages)
+        for filter, positions in groups.items():
+            hits = self.vectordb.search(self.collection_name, [query_embeddings[i] for i in positions], topk,
+                                        search_params, filter)
+            for i, query_hits in zip(positions, hits):
+                results[i] = query_hits
+
+        # Fall back to the unfiltered search
+        empty = [i for i, hits in enumerate(results) if filters[i] and not hits]
+        if empty:
+            print(f"No documents match the filter of {len(empty)} queries, searching the whole collection")
+            hits = self.vectordb.search(self.collection_name, [query_embeddings[i] for i in empty], topk, search_params)
+            for i, query_hits in zip(empty, hits):
+                results[i] = query_hits
+
+        return results
+
+    async def _asearch(self, messages: list, query_embeddings: list, search_params: dict, topk: int) -> list:
+        """
+        Search the documents of several queries with the async Milvus client, see _search.
+        The searches of the different filters run concurrently.
+        """
+        filters, groups = self._filter_groups(messages)
+        results = [None] * len(messages)
+        searches = [self.vectordb.asearch(self.collection_name, [query_embeddings[i] for i in positions], topk,
+                                          search_params, filter) for filter, positions in groups.items()]
+        for positions, hits in zip(groups.values(), await asyncio.gather(*searches)):
+            for i, query_hits in zip(positions, hits):
+                results[i] = query_hits
+
+        # Fall back to the unfiltered search
+        empty = [i for i, hits in enumerate(results) if filters[i] and not hits]
+        if empty:
+            print(f"No documents match the filter of {len(empty)} queries, searching the whole collection")
+            hits = await self.vectordb.asearch(self.collection_name, [query_embeddings[i] for i in empty], topk,
+                                               search_params)
+            for i, query_hits in zip(empty, hits):
+                results[i] = query_hits
+
+        return results
+
+    def _cached_response(self, message: str, query_embeddings: list = None):
+        """
+        Look up the answer in the answer cache, by the text of the message or, with the query embedding,
+        by similarity.
+        """
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.get(message, query_embeddings)
+
+    def _build_messages(self, message: str, docs_context: list) -> list:
+        if self.context_builder is not None:
+            search_results = self.context_builder.build(docs_context)
+            print(f"Context tokens: {self.context_builder.last_stats}")
+        else:
+            search_results = " ".join(docs_context)
+        prompt = f"User's question: {message} \n\n Search results:\n {search_results}"
+        
+        print(prompt)
+
+        return [
+                    {"role": "system", "content": str(
+                        self.agent_system_role
+                    )},
+                    {"role": "user", "content": prompt}
+        ]
+
+    def _save_response(self, message: str, query_embeddings: list, response: str, stage_seconds: dict, chat: list):
+        print("Stage seconds: ", {stage: round(seconds, 4) for stage, seconds in stage_seconds.items()})
+        if self.answer_cache is not None:
+            self.answer_cache.put(message, query_embeddings, response)
+
+        chat.append(
+                (message, response))
+
+    def _prepare(self, message: str, search_params: dict, topk: int, stage_seconds: dict) -> tuple:
+        """
+        Look up the answer caches, then retrieve the documents of the message and build the LLM messages.
+
+        Returns:
+            str, list, list: The cached response (None on a miss), the query embeddings and the LLM messages.
+        """
+        t0 = time.time()
+        # A repeated question is answered from the cache, without embedding it
+        response = self._cached_response(message)
+        if response is not None:
+            return response, None, None
+
+        query_embeddings  = self._embed_query(message)
+        stage_seconds["embed"] = time.time() - t0
+
+        # A near duplicate of a cached question reuses its answer
+        response = self._cached_response(message, query_embeddings)
+        if response is not None:
+            return response, query_embeddings, None
+
+        # The search returns the content of the documents, no second round trip is needed
+        t0 = time.time()
+        candidates = topk * self.rerank_candidates if self.vectordb.rerank else topk
+        hits = self._search([message], [query_embeddings], search_params, candidates)[0]
+        stage_seconds["search"] = time.time() - t0
+
+        docs_context= [hit.row for hit in hits]
+        if self.vectordb.rerank:
+            t0 = time.time()
+            docs_context= self.vectordb.rerank_docs(message, docs_context, topk)
+            stage_seconds["rerank"] = time.time() - t0
+
+        return None, query_embeddings, self._build_messages(message, docs_context)
+
+    async def _aprepare(self, message: str, search_params: dict, topk: int, stage_seconds: dict) -> tuple:
+        """
+        Look up the answer caches, retrieve the documents and build the LLM messages with the async clients,
+        see _prepare.
+        """
+        t0 = time.time()
+        # A repeated question is answered from the cache, without embedding it
+        response = self._cached_response(message)
+        if response is not None:
+            return response, None, None
+
+        query_embeddings = await self._aembed_query(message)
+        stage_seconds["embed"] = time.time() - t0
+
+        # A near duplicate of a cached question reuses its answer
+        response = self._cached_response(message, query_embeddings)
+        if response is not None:
+            return response, query_embeddings, None
+
+        t0 = time.time()
+        candidates = topk * self.rerank_candidates if self.vectordb.rerank else topk
+        hits = (await self._asearch([message], [query_embeddings], search_params, candidates))[0]
+        stage_seconds["search"] = time.time() - t0
+
+        docs_context= [hit.row for hit in hits]
+        if self.vectordb.rerank:
+            t0 = time.time()
+            docs_context= await self.vectordb.arerank_docs(message, docs_context, topk)
+            stage_seconds["rerank"] = time.time() - t0
+
+        return None, query_embeddings, self._build_messages(message, docs_context)
+
     def respond(self, message: str, search_params: dict, topk: int) -> tuple:
         """
         Respond to a message based on the given chat and application functionality types.
@@ -35,31 +293,116 @@ class RAGTabularDataAgent:
                                              Currently, the function primarily updates the chatbot conversation list.
         """
 
-        query_embeddings  = self.embeddings_model.embed_query(
-                    message,
-                )
+        stage_seconds= {}
+        self.stage_seconds= stage_seconds
+        response, query_embeddings, messages = self._prepare(message, search_params, topk, stage_seconds)
+        if response is not None:
+            self.chatbot.append((message, response))
+            return response, self.chatbot
 
-        results = self.vectordb.milvus_client.search(collection_name= self.collection_name, data=[query_embeddings], 
-                        limit=topk, search_params=search_params, anns_field="row_embedding")
-
-        docs_context= self.vectordb.get_docs_results(self.collection_name, results)
+        t0 = time.time()
+        llm_response= self.langchain_llm.invoke(messages)
+        stage_seconds["llm"] = time.time() - t0
 
-        prompt = f"User's question: {message} \n\n Search results:\n {" ".join(docs_context)}"
+        response = llm_response.content
+        self._save_response(message, query_embeddings, response, stage_seconds, self.chatbot)
         
-        print(prompt)
+        return response, self.chatbot
 
-        messages = [
-                    {"role": "system", "content": str(
-                        self.agent_system_role
-                    )},
-                    {"role": "user", "content": prompt}
-        ]
-        llm_response= self.langchain_llm.invoke(messages)
+    async def arespond(self, message: str, search_params: dict, topk: int, chat: list = None,
+                       stage_seconds: dict = None) -> tuple:
+        """
+        Respond to a message with the async embeddings, Milvus and LLM clients, see respond.
+
+        Many messages can be answered concurrently in the same event loop, so the state of a call is not
+        kept in the agent: the turn is added to the given chat history and the timings to the given dict.
+
+        Args:
+            chat (list): The chat history of the conversation, a new one by default.
+            stage_seconds (dict): If set, filled with the seconds spent in every stage of this response.
+
+        Returns:
+            Tuple[str, List]: The response and the updated chat history.
+        """
+        chat = [] if chat is None else chat
+        stage_seconds = {} if stage_seconds is None else stage_seconds
+        response, query_embeddings, messages = await self._aprepare(message, search_params, topk, stage_seconds)
+        if response is not None:
+            chat.append((message, response))
+            return response, chat
+
+        t0 = time.time()
+        llm_response= await self.langchain_llm.ainvoke(messages)
+        stage_seconds["llm"] = time.time() - t0
 
         response = llm_response.content
+        self._save_response(message, query_embeddings, response, stage_seconds, chat)
 
-        self.chatbot.append(
-                (message, response))
-        
-        return response, self.chatbot
+        return response, chat
+
+    def stream(self, message: str, search_params: dict, topk: int):
+        """
+        Respond to a message streaming the tokens of the answer as they arrive, see respond.
+
+        Yields:
+            dict: The events of the response: 'cache' when the answer is cached, 'retrieval' when the documents
+                  are retrieved, 'token' with every piece of the answer and 'done' with the whole response,
+                  the seconds to the first token and the total seconds.
+        """
+        stage_seconds= {}
+        self.stage_seconds= stage_seconds
+        t0 = time.time()
+        response, query_embeddings, messages = self._prepare(message, search_params, topk, stage_seconds)
+        if response is not None:
+            self.chatbot.append((message, response))
+            yield {"event": "cache"}
+            yield {"event": "token", "text": response}
+            yield self._done_event(response, t0, time.time() - t0)
+            return
+        yield {"event": "retrieval", "seconds": round(time.time() - t0, 4)}
+
+        t1 = time.time()
+        first_token = None
+        tokens = []
+        for chunk in self.langchain_llm.stream(messages):
+            if chunk.content:
+                first_token = first_token or time.time() - t0
+                tokens.append(chunk.content)
+                yield {"event": "token", "text": chunk.content}
+        stage_seconds["llm"] = time.time() - t1
+
+        response = "".join(tokens)
+        self._save_response(message, query_embeddings, response, stage_seconds, self.chatbot)
+        yield self._done_event(response, t0, first_token)
+
+    async def astream(self, message: str, search_params: dict, topk: int, chat: list = None,
+                      stage_seconds: dict = None):
+        """
+        Respond to a message streaming the tokens of the answer with the async clients, see stream.
+        Like arespond, the turn is added to the given chat history and the timings to the given dict.
+        """
+        chat = [] if chat is None else chat
+        stage_seconds = {} if stage_seconds is None else stage_seconds
+        t0 = time.time()
+        response, query_embeddings, messages = await self._aprepare(message, search_params, topk, stage_seconds)
+        if response is not None:
+            chat.append((message, response))
+            yield {"event": "cache"}
+            yield {"event": "token", "text": response}
+            yield self._done_event(response, t0, time.time() - t0, save=False)
+            return
+        yield {"event": "retrieval", "seconds": round(time.time() - t0, 4)}
+
+        t1 = time.time()
+        first_token = None
+        tokens = []
+        async for chunk in self.langchain_llm.astream(messages):
+            if chunk.content:
+                first_token = first_token or time.time() - t0
+                tokens.append(chunk.content)
+                yield {"event": "token", "text": chunk.content}
+        stage_seconds["llm"] = time.time() - t1
 
+        response = "".join(tokens)
+        self._save_response(message, query_embeddings, response, stage_seconds, chat)
+        yield self._done_event(response, t0, first_token, save=False)
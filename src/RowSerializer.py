@@ -0,0 +1,122 @@
+import json
+import numpy as np
+import pandas as pd
+
+class RowSerializer:
+    """
+    Serialize the rows of a DataFrame into text documents, working on whole columns at once.
+
+    Numeric columns are converted to text by NumPy, the other columns are factorized and only their
+    unique values are formatted, then the formatted values are taken back by their codes. Finally the
+    columns are concatenated as arrays. The same input always
+    produces the same output. Supported templates:
+        - json: every row is a JSON object, a chunk is {"description": ..., "rows": [...]}.
+        - kv: every row is a block of "column: value" lines.
+        - markdown: every row is a markdown table row, a chunk is a table with a single header.
+    """
+    TEMPLATES = ("json", "kv", "markdown")
+
+    def __init__(self, template: str = "json") -> None:
+        """
+        Initialize the instance with the serialization template.
+
+        Args:
+            template (str): One of 'json', 'kv' or 'markdown'.
+        """
+        if template not in self.TEMPLATES:
+            raise ValueError(f"The row template must be one of {self.TEMPLATES}")
+        self.template= template
+
+    def _format_values(self, values: list) -> list:
+        formatted = []
+        for value in values:
+            if isinstance(value, (np.integer, np.floating, np.bool_)):
+                value = value.item()
+            if self.template == "json":
+                formatted.append(json.dumps(value, ensure_ascii=False))
+            elif self.template == "markdown":
+                formatted.append("" if value is None else str(value).replace("|", "\\|"))
+            else:
+                formatted.append("" if value is None else str(value))
+        return formatted
+
+    def _format_column(self, column: pd.Series) -> np.ndarray:
+        missing = "null" if self.template == "json" else ""
+        # Numeric columns are converted by NumPy, they may have too many unique values to factorize
+        if pd.api.types.is_integer_dtype(column.dtype) and not pd.api.types.is_extension_array_dtype(column.dtype):
+            return column.values.astype(str).astype(object)
+        if pd.api.types.is_float_dtype(column.dtype) and np.isfinite(column.values[~column.isna().values]).all():
+            formatted = column.values.astype(str).astype(object)
+            formatted[column.isna().values] = missing
+            return formatted
+        codes, uniques = pd.factorize(column, use_na_sentinel=True)
+        # The last position holds the format of the missing values
+        formatted = np.array(self._format_values(list(uniques)) + [missing], dtype=object)
+        return formatted[codes]
+
+    def serialize_rows(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Serialize every row of the DataFrame.
+
+        Returns:
+            np.ndarray: An object array with the text of every row.
+        """
+        rows = np.full(len(df), "", dtype=object)
+        for i, col in enumerate(df.columns):
+            values = self._format_column(df[col])
+            if self.template == "json":
+                rows = rows + (("{" if i == 0 else ", ") + json.dumps(str(col), ensure_ascii=False) + ": ") + values
+            elif self.template == "kv":
+                rows = rows + (("" if i == 0 else "\n") + f"{col}: ") + values
+            else:
+                rows = rows + "| " + values + " "
+        if self.template == "json":
+            rows = rows + "}"
+        elif self.template == "markdown":
+            rows = rows + "|"
+
+        return rows
+
+    def header(self, columns: list, description: str) -> str:
+        """
+        Build the header of a chunk document.
+        """
+        if self.template == "json":
+            return '{"description": ' + json.dumps(description, ensure_ascii=False) + ', "rows": ['
+        elif self.template == "kv":
+            return f"Content Description: {description}\n\n"
+        return (f"Content Description: {description}\n\n| " + " | ".join(str(col) for col in columns) + " |\n"
+                + "|" + "---|" * len(columns) + "\n")
+
+    def footer(self) -> str:
+        return "]}" if self.template == "json" else ""
+
+    def separator(self) -> str:
+        return {"json": ", ", "kv": "\n\n", "markdown": "\n"}[self.template]
+
+    def serialize_chunks(self, df: pd.DataFrame, chunk_ids: np.ndarray, description: str) -> tuple:
+        """
+        Serialize the rows of the DataFrame and join them into chunk documents.
+
+        Args:
+            df (pd.DataFrame): The rows to serialize.
+            chunk_ids (np.ndarray): The chunk of every row, the chunks keep the order of their rows.
+            description (str): The description of the content, written in the header of every chunk.
+
+        Returns:
+            list, np.ndarray: The chunk documents and the chunk id of every document.
+        """
+        return self.join_chunks(self.serialize_rows(df), chunk_ids, list(df.columns), description)
+
+    def join_chunks(self, rows: np.ndarray, chunk_ids: np.ndarray, columns: list, description: str) -> tuple:
+        """
+        Join rows already serialized into chunk documents.
+
+        Returns:
+            list, np.ndarray: The chunk documents and the chunk id of every document.
+        """
+        chunks = pd.Series(rows, index=chunk_ids).groupby(level=0, sort=False).agg(self.separator().join)
+        header = self.header(columns, description)
+        footer = self.footer()
+
+        return [header + chunk + footer for chunk in chunks.values], chunks.index.values
@@ -1,7 +1,48 @@
+import time
+import queue
+import asyncio
+import threading
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import create_sql_agent
+from langchain_core.callbacks import BaseCallbackHandler
 
-class SQLAgent:
+from src.StreamingAgent import StreamingAgent
+
+class SQLAgentStreamHandler(BaseCallbackHandler):
+    """
+    Pass the events of a run of the SQL agent as they happen: the queries, their results and the tokens
+    written by the LLM. The synchronous and the asynchronous streams of SQLAgent both use it, so they
+    yield the same events.
+    """
+    # Called in the event loop by the async runs, so `put` does not need to be thread-safe there
+    run_inline = True
+
+    def __init__(self, put, t0: float) -> None:
+        """
+        Args:
+            put (Callable): Called with every event, e.g. the put method of a queue.
+            t0 (float): The time the run started.
+        """
+        self.put= put
+        self.t0= t0
+        self.query_runs= set()
+
+    def on_tool_start(self, serialized: dict, input_str: str, *, run_id, inputs: dict = None, **kwargs):
+        if (serialized or {}).get("name", kwargs.get("name")) == "sql_db_query":
+            self.query_runs.add(run_id)
+            self.put({"event": "sql_generated", "query": (inputs or {}).get("query", input_str),
+                      "seconds": round(time.time() - self.t0, 4)})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        if run_id in self.query_runs:
+            self.put({"event": "sql_executed", "result": str(getattr(output, "content", output)),
+                      "seconds": round(time.time() - self.t0, 4)})
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.put({"event": "token", "text": token})
+
+class SQLAgent(StreamingAgent):
     """
     Construct a SQL agent from an LLM and toolkit or database.
     """
@@ -21,6 +62,11 @@ class SQLAgent:
         self.agent_system_role= agent_system_role
         # Start the chat history
         self.chatbot= []
+        # Seconds to the first token and total seconds of the last streamed response
+        self.stream_seconds= {}
+        # Create the SQL Agent once, every question only runs it
+        self.agent_executor = create_sql_agent(
+                    self.langchain_llm, db=self.db, agent_type="openai-tools", verbose=True)
 
     def respond(self, message: str) -> tuple:
         """
@@ -38,11 +84,8 @@ class SQLAgent:
                                              values to match the required return type and may be updated for further functionality.
                                              Currently, the function primarily updates the chatbot conversation list.
         """
-        # Create the SQL Agent
-        agent_executor = create_sql_agent(
-                    self.langchain_llm, db=self.db, agent_type="openai-tools", verbose=True)
         # Invoke the agent to get the response
-        response = agent_executor.invoke({"input": message})
+        response = self.agent_executor.invoke({"input": message})
         # Extract the response
         response = response["output"]        
 
@@ -51,3 +94,115 @@ class SQLAgent:
                 (message, response))
 
         return response, self.chatbot
+
+    async def arespond(self, message: str, chat: list = None) -> tuple:
+        """
+        Respond to a message without blocking the event loop, see respond.
+
+        Many messages can be answered concurrently, so the turn is added to the given chat history instead
+        of the history of the agent.
+
+        Args:
+            chat (list): The chat history of the conversation, a new one by default.
+
+        Returns:
+            Tuple[str, List]: The response and the updated chat history.
+        """
+        chat = [] if chat is None else chat
+        response = await self.agent_executor.ainvoke({"input": message})
+        # Extract the response
+        response = response["output"]
+
+        chat.append(
+                (message, response))
+
+        return response, chat
+
+    def stream(self, message: str):
+        """
+        Respond to a message streaming the tokens of the answer as they arrive, see astream.
+
+        The agent executor runs, with the synchronous clients, in a worker thread and the callback handler
+        passes the events of the run through a queue.
+        """
+        t0 = time.time()
+        events = queue.Queue()
+        outputs = []
+
+        def run():
+            try:
+                outputs.append(self.agent_executor.invoke(
+                    {"input": message}, config={"callbacks": [SQLAgentStreamHandler(events.put, t0)]})["output"])
+            except Exception as error:
+                events.put(error)
+            finally:
+                events.put(None)
+
+        threading.Thread(target=run, daemon=True).start()
+        first_token = None
+        tokens = []
+        while (event := events.get()) is not None:
+            if isinstance(event, Exception):
+                raise event
+            if event["event"] == "token":
+                first_token = first_token or time.time() - t0
+                tokens.append(event["text"])
+            yield event
+        yield from self._finish_stream(message, outputs[-1] if outputs else None, tokens, t0, first_token,
+                                       self.chatbot, True)
+
+    async def astream(self, message: str, chat: list = None):
+        """
+        Respond to a message streaming the tokens of the answer as they arrive, see respond.
+        Like arespond, the turn is added to the given chat history, a new one by default.
+
+        Yields:
+            dict: The events of the response: 'sql_generated' with every query the agent runs, 'sql_executed'
+                  with its result, 'token' with every piece of text written by the LLM and 'done' with the whole
+                  response, the seconds to the first token and the total seconds. If the LLM does not stream,
+                  the whole response is a single 'token'.
+        """
+        chat = [] if chat is None else chat
+        t0 = time.time()
+        events = asyncio.Queue()
+
+        async def run():
+            try:
+                response = await self.agent_executor.ainvoke(
+                    {"input": message}, config={"callbacks": [SQLAgentStreamHandler(events.put_nowait, t0)]})
+                return response["output"]
+            finally:
+                events.put_nowait(None)
+
+        task = asyncio.create_task(run())
+        first_token = None
+        tokens = []
+        try:
+            while (event := await events.get()) is not None:
+                if event["event"] == "token":
+                    first_token = first_token or time.time() - t0
+                    tokens.append(event["text"])
+                yield event
+            response = await task
+        finally:
+            # The client stopped reading the stream
+            task.cancel()
+
+        for event in self._finish_stream(message, response, tokens, t0, first_token, chat, False):
+            yield event
+
+    def _finish_stream(self, message: str, response: str, tokens: list, t0: float, first_token: float,
+                       chat: list, save: bool):
+        """
+        Yield the last events of a streamed response, given the output of the agent and the streamed tokens,
+        and add the turn to the chat history.
+        """
+        # The output of the agent, or the streamed text if it did not finish
+        response = "".join(tokens) if response is None else response
+        if not tokens and response:
+            # The LLM did not stream, the answer is a single token
+            first_token = time.time() - t0
+            yield {"event": "token", "text": response}
+        chat.append(
+                (message, response))
+        yield self._done_event(response, t0, first_token, save)
@@ -1,19 +1,67 @@
 import os
+import sqlite3
+from sqlalchemy import create_engine, MetaData
 from langchain_community.utilities import SQLDatabase
 
+from src.SQLiteRollups import SQLiteRollups
+from src.GuardedSQLDatabase import GuardedSQLDatabase
+
 class SQLDB:
 
-    def __init__(self,sqldb_dir: str) -> None:
+    def __init__(self,sqldb_dir: str, sample_rows_in_table_info: int = 3, guarded: bool = False,
+                 max_rows: int = 1000, timeout: float = 10.0, max_scan_rows: int = 1000000) -> None:
         """
         Initialize an instance of PrepareSQLFromTabularData.
 
         Args:
             files_dir (str): The directory containing the CSV or XLSX files to be converted to SQL tables.
+            sample_rows_in_table_info (int): Number of sample rows of every table shown to the LLM.
+            guarded (bool): Run the SQL of the agents read-only and with the guardrails of GuardedSQLDatabase.
+            max_rows (int): With guarded, maximum number of rows returned by a query.
+            timeout (float): With guarded, maximum seconds a query runs before it is interrupted.
+            max_scan_rows (int): With guarded, tables with more rows can not be scanned as a whole.
         """
+        self.sqldb_dir= sqldb_dir
+        self.sample_rows_in_table_info= sample_rows_in_table_info
+        self.guarded= guarded
+        self.max_rows= max_rows
+        self.timeout= timeout
+        self.max_scan_rows= max_scan_rows
 
         # Set the DB
         if os.path.exists(sqldb_dir):
-            self.db = SQLDatabase.from_uri(
-                        f"sqlite:///{sqldb_dir}")
+            # The guarded database is opened read-only
+            self.engine = create_engine(f"sqlite:///file:{sqldb_dir}?mode=ro&uri=true" if guarded else f"sqlite:///{sqldb_dir}")
+            self.refresh()
 
-        self.sqldb_dir= sqldb_dir
+    def refresh(self):
+        """
+        Reflect the schema of the database and compute the table info (DDL and sample rows) of every table.
+
+        The table info is computed once and passed to the SQLDatabase as custom table info, so the agents
+        do not introspect the schema or query the sample rows on every question. Call this method again
+        after the tables are loaded or changed. The rollup tables are described in their table info, and
+        the catalog of the rollups is hidden from the agents.
+        """
+        metadata = MetaData()
+        metadata.reflect(bind=self.engine)
+        ignore_tables = [SQLiteRollups.CATALOG] if SQLiteRollups.CATALOG in metadata.tables else None
+        rollups = {}
+        if ignore_tables:
+            conn = sqlite3.connect(f"file:{self.sqldb_dir}?mode=ro", uri=True)
+            try:
+                rollups = SQLiteRollups.describe(conn)
+            finally:
+                conn.close()
+        db = SQLDatabase(self.engine, metadata=metadata, sample_rows_in_table_info=self.sample_rows_in_table_info,
+                         ignore_tables=ignore_tables)
+        self.table_info = {table: db.get_table_info([table]) + ("\n" + rollups[table] if table in rollups else "")
+                           for table in db.get_usable_table_names()}
+        if self.guarded:
+            self.db = GuardedSQLDatabase(self.engine, self.sqldb_dir, self.max_rows, self.timeout, self.max_scan_rows,
+                                         metadata=metadata, custom_table_info=self.table_info,
+                                         ignore_tables=ignore_tables)
+        else:
+            self.db = SQLDatabase(self.engine, metadata=metadata, custom_table_info=self.table_info,
+                                  ignore_tables=ignore_tables)
+        print(f"SQL DB loaded with tables: {list(self.table_info)}")
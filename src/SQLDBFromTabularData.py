@@ -1,26 +1,56 @@
 import os
+import time
 import pandas as pd
 from sqlalchemy import create_engine, inspect
 
+from src.IngestManifest import IngestManifest
+from src.SQLiteBulkLoader import SQLiteBulkLoader
+from src.IngestScheduler import IngestScheduler
+from src.ParquetStaging import ParquetStaging
+from src.SQLiteRollups import SQLiteRollups
+
 class PrepareSQLFromTabularData:
     """
     A class that prepares a SQL database from CSV or XLSX files within a specified directory.
 
-    This class reads each file, converts the data to a DataFrame, and then
-    stores it as a table in a SQLite database, which is specified by the application configuration.
+    This class reads each file in chunks, converts the data to DataFrames, and then
+    stores it as a typed and indexed table in a SQLite database, which is specified by the application configuration.
+    Only the CSV and XLSX files of the directory are loaded, the other files (e.g. the YAML configuration) are skipped.
     """
+    EXTENSIONS = (".csv", ".xlsx")
+
     def __init__(self, files_dir,db_path: str,  csv_codec: str, 
-                 csv_sep: str) -> None:
+                 csv_sep: str, datafiles: list = None, csv_decimal: str = ",", chunk_size: int = 100000,
+                 max_workers: int = 1, staging: ParquetStaging = None) -> None:
         """
         Initialize an instance of PrepareSQLFromTabularData.
 
         Args:
             files_dir (str): The directory containing the CSV or XLSX files to be converted to SQL tables.
+            datafiles (list): The datafiles configuration, used to get the `partition_by` columns, the
+                              `rollups` and the `csv_decimal` separator of every file.
+            csv_decimal (str): The decimal separator of the numbers in the CSV files without a `csv_decimal`.
+            chunk_size (int): The number of rows read from the CSV files at a time.
+            max_workers (int): Number of processes reading the files in parallel, 1 to read them one after another.
+            staging (ParquetStaging): If set, the files are read from their staged Parquet version.
         """
         self.files_directory = files_dir
-        self.file_dir_list = os.listdir(files_dir)
+        self.file_dir_list = sorted(file for file in os.listdir(files_dir)
+                                    if os.path.splitext(file)[1].lower() in self.EXTENSIONS)
         self.csv_codec= csv_codec
         self.csv_sep= csv_sep
+        self.csv_decimal= csv_decimal
+        self.csv_decimals= {datafile["filename"]: datafile["csv_decimal"] for datafile in datafiles or []
+                            if datafile.get("csv_decimal")}
+        self.chunk_size= chunk_size
+        self.partition_by= {datafile["filename"]: datafile.get("partition_by") for datafile in datafiles or []}
+        self.rollup_config= {datafile["filename"]: datafile.get("rollups") for datafile in datafiles or []}
+        self.rollups= SQLiteRollups({os.path.splitext(datafile["filename"])[0]: datafile.get("rollups")
+                                     for datafile in datafiles or []})
+        self.manifest= IngestManifest(f"{db_path}.manifest.json", "sqlite")
+        self.loader= SQLiteBulkLoader(db_path)
+        self.scheduler= IngestScheduler(max_workers)
+        self.staging= staging
         
         db_conection = f"sqlite:///{db_path}"
         self.engine = create_engine(db_conection)
@@ -32,20 +62,160 @@ class PrepareSQLFromTabularData:
 
         Each file's name (excluding the extension) is used as the table name.
         The data is saved into the SQLite database referenced by the engine attribute.
+
+        Args:
+            limit (int): Maximum number of rows loaded from every file, None or 0 to load every row.
+        """
+        # A full load is not tracked by the manifest, the next sync will reload every file
+        self.manifest.reset()
+        # The files are parsed in parallel processes and a single writer streams their chunks into SQL BD
+        tasks = [(file, (os.path.join(self.files_directory, file), self.csv_sep, self.csv_codec, self._decimal(file),
+                         self.chunk_size, limit, self.staging)) for file in self.file_dir_list]
+        # Insert data loaded to SQL BD, replacing the table if it already exists
+        self.scheduler.run(tasks, PrepareSQLFromTabularData._iter_chunks,
+                           lambda file, chunks: self.loader.load(os.path.splitext(file)[0], chunks, limit))
+        self._build_rollups()
+        print("==============================")
+        print("All csv files are saved into the sql database.")
+
+    @staticmethod
+    def _iter_chunks(full_file_path: str, csv_sep: str, csv_codec: str, csv_decimal: str, chunk_size: int,
+                     limit: int = None, staging: ParquetStaging = None, file_hash: str = None):
+        """
+        Read a file in DataFrame chunks of `chunk_size` rows, XLSX files are read as a single chunk.
+        With a staging area, the chunks are read from the staged Parquet file, found by the hash of the file
+        when it was already computed.
+        """
+        if staging is not None:
+            return staging.iter_chunks(full_file_path, chunk_size, limit, file_hash=file_hash)
+        file_extension = os.path.splitext(full_file_path)[1]
+        if file_extension == ".csv":
+            return pd.read_csv(full_file_path, sep= csv_sep, encoding= csv_codec, decimal= csv_decimal,
+                               chunksize= chunk_size, nrows= limit or None)
+        elif file_extension == ".xlsx":
+            return iter([pd.read_excel(full_file_path, nrows= limit or None)])
+        else:
+            raise ValueError("The selected file type is not supported")
+
+    def _decimal(self, file: str) -> str:
+        """
+        The decimal separator of a file, from its `csv_decimal` in the datafiles configuration.
+        """
+        return self.csv_decimals.get(os.path.basename(file), self.csv_decimal)
+
+    def _iter_file(self, full_file_path: str, file_hash: str = None):
+        return self._iter_chunks(full_file_path, self.csv_sep, self.csv_codec, self._decimal(full_file_path),
+                                 self.chunk_size, staging=self.staging, file_hash=file_hash)
+
+    def _scan_file(self, full_file_path: str, partition_by: list, file_hash: str = None) -> tuple:
+        """
+        Read a file chunk by chunk and compute the fingerprint of every partition and the column types.
+
+        Returns:
+            dict, dict: The partition fingerprints and the type of every column, widened across the chunks.
+        """
+        types = {}
+
+        def typed_chunks():
+            for df in self._iter_file(full_file_path, file_hash):
+                chunk_types = self.loader.infer_types(df)
+                types.update(self.loader.widen_types(types, chunk_types) if types else chunk_types)
+                yield df
+
+        partitions = IngestManifest.partition_fingerprints(typed_chunks(), partition_by)
+        return partitions, types
+
+    def _build_rollups(self):
+        """
+        Build the rollup tables of every loaded table in a single transaction.
+        """
+        t0 = time.time()
+        conn = self.loader.connect()
+        try:
+            conn.execute("BEGIN")
+            for file in self.file_dir_list:
+                self.rollups.build(conn, os.path.splitext(file)[0])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self.loader.optimize()
+        print(f"Rollups built in {round(time.time()-t0,4)} seconds")
+
+    def _sync_db(self):
+        """
+        Private method to incrementally sync the CSV/XLSX files with the SQL tables.
+
+        Unchanged files are skipped. For the other files, only the partitions of rows (as defined by the
+        `partition_by` columns of the file) that are new or changed are deleted and inserted again, in a 
+        single transaction per file. Files without partition columns are replaced as a whole.
+        New tables are created and indexed like in a full load. A file is read twice, chunk by chunk: to
+        fingerprint its partitions and infer its column types, and to insert the rows of the changed partitions.
         """
         for file in self.file_dir_list:
             full_file_path = os.path.join(self.files_directory, file)
-            file_name, file_extension = os.path.splitext(file)
-            if file_extension == ".csv":
-                df = pd.read_csv(full_file_path, sep= self.csv_sep, encoding= self.csv_codec)
-            elif file_extension == ".xlsx":
-                df = pd.read_excel(full_file_path, sep= self.csv_sep, encoding= self.csv_codec)
-            else:
-                raise ValueError("The selected file type is not supported")
-            # Insert data loaded to SQL BD
-            df.to_sql(file_name, self.engine, index=False)
+            file_name = os.path.splitext(file)[0]
+            t0 = time.time()
+            file_hash = IngestManifest.file_fingerprint(full_file_path)
+            partition_by = self.partition_by.get(file)
+            config = IngestManifest.config_fingerprint(partition_by=partition_by, rollups=self.rollup_config.get(file))
+            entry = self.manifest.get(file)
+            if entry and entry["file_hash"] == file_hash and entry["config"] == config:
+                print(f"File {file} is unchanged, skipped")
+                continue
+
+            # A first pass over the chunks finds the changed partitions, a second one inserts their rows
+            partitions, file_types = self._scan_file(full_file_path, partition_by, file_hash)
+            if not file_types:
+                print(f"File {file} has no rows, skipped")
+                continue
+            changed, deleted = self.manifest.diff(file, config, partitions)
+            print(f"File {file}: {len(changed)} partitions to load, {len(deleted)} partitions to delete")
+            table_exists = inspect(self.engine).has_table(file_name)
+            # New table, loaded without a manifest, with other partitions or not partitioned: replace it
+            replace = not table_exists or entry is None or entry["config"] != config or not partition_by
+            conn = self.loader.connect()
+            try:
+                conn.execute("BEGIN")
+                if replace:
+                    types = self.loader.create_table(conn, file_name, types=file_types)
+                else:
+                    if deleted:
+                        condition = " AND ".join(f'"{col}" = ?' for col in partition_by)
+                        conn.executemany(f'DELETE FROM "{file_name}" WHERE {condition}',
+                                         [entry["partitions"][key]["values"] for key in deleted])
+                    # The new rows may need wider column types than the existing table
+                    table_types = self.loader.table_types(conn, file_name)
+                    types = self.loader.widen_types(table_types, file_types)
+                    if types != table_types:
+                        self.loader.alter_types(conn, file_name, types)
+                # A replaced table is loaded with every partition
+                load_keys = set(partitions) if replace else set(changed)
+                if load_keys:
+                    for df in self._iter_file(full_file_path, file_hash):
+                        keys = IngestManifest.partition_keys(df, partition_by)
+                        self.loader.insert(conn, file_name, df[keys.isin(load_keys)], types)
+                if replace:
+                    self.loader.create_indexes(conn, file_name, list(types))
+                    self.rollups.build(conn, file_name)
+                else:
+                    # Only the groups of the changed partitions are recomputed
+                    self.rollups.refresh(conn, file_name, partition_by,
+                                         [partitions[key]["values"] for key in changed]
+                                         + [entry["partitions"][key]["values"] for key in deleted])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            self.manifest.update(file, file_hash, config, partitions, changed=bool(changed or deleted))
+            print(f"File {file} synced in {round(time.time()-t0,4)} seconds")
+        self.loader.optimize()
         print("==============================")
-        print("All csv files are saved into the sql database.")
+        print("All csv files are synced into the sql database.")
 
     def _validate_db(self):
         """
@@ -60,11 +230,16 @@ class PrepareSQLFromTabularData:
         print("Available table nasmes in created SQL DB:", table_names)
         print("==============================")
 
-    def run_pipeline(self, limit: int):
+    def run_pipeline(self, limit: int, sync: bool = False):
         """
         Public method to run the data import pipeline, which includes preparing the database
         and validating the created tables. It is the main entry point for converting files
         to SQL tables and confirming their creation.
+
+        With sync True, the tables are incrementally synced with the files instead of loaded from scratch.
         """
-        self._prepare_db(limit)
-        self._validate_db()
\ No newline at end of file
+        if sync:
+            self._sync_db()
+        else:
+            self._prepare_db(limit)
+        self._validate_db()
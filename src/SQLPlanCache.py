@@ -0,0 +1,217 @@
+import re
+import os
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from sqlalchemy import inspect, text
+from sqlalchemy.types import String
+
+from src.SQLiteRollups import SQLiteRollups
+
+class SQLPlanCache:
+    """
+    A cache of the SQL queries written by the TextToSQL agent, as templates of the shape of the questions.
+
+    The slots of a question are the values of the low cardinality text columns of the database (e.g. the
+    provinces or the origin types), the Spanish month names and the numbers (e.g. the years). The shape of
+    the question is its normalized text with every slot replaced by its kind, so "¿Cuantos turistas visitaron
+    A Coruña en 2019?" and "¿Cuantos turistas visitaron Albacete en 2021?" have the same shape. A query that
+    ran without error and returned rows is stored as a template, with the literals equal to the slots of the
+    question turned into bind parameters. A query is not cached when a slot is not used in the query, or
+    when two slots have the same value, because the new values could not be bound unambiguously.
+    """
+    MONTHS = {"enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7, "agosto": 8,
+              "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12}
+    # String literals, quoted identifiers (skipped) and integer literals of a SQL query
+    SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?<![\w.])\d+(?![\w.])")
+
+    def __init__(self, slot_values: dict, max_entries: int = 1000, path: str = None) -> None:
+        """
+        Initialize the instance with the dictionary of slot values.
+
+        Args:
+            slot_values (dict): The kind of every text value, e.g. {'A Coruña': 'PROVINCIA|PROVINCIA_DESTINO'}.
+            max_entries (int): Maximum number of cached templates, the least recently used are evicted.
+            path (str): Optional JSON file where the templates are saved, they are loaded if it exists.
+        """
+        self.slot_values= slot_values
+        self.max_entries= max_entries
+        self.path= path
+        self.entries= OrderedDict()
+        self.lock= threading.Lock()
+        self.stats= {"hits": 0, "misses": 0, "added": 0, "rejected": 0}
+        names = {}
+        for value in slot_values:
+            # The values with several names (e.g. 'Alicante/Alacant') are also matched by every name
+            for name in [value] + value.split("/"):
+                if self.normalize(name) and not self.normalize(name).isdigit():
+                    names[self.normalize(name)] = value
+        self.names= names
+        alternatives = [re.escape(name) for name in sorted(names, key=len, reverse=True)]
+        self.slot_pattern= re.compile(r"\b(?:(?P<text>" + "|".join(alternatives or ["(?!)"]) + r")|(?P<month>"
+                                      + "|".join(self.MONTHS) + r")|(?P<number>\d+))\b")
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries.update(json.load(f))
+            print(f"SQL plan cache loaded with {len(self.entries)} templates")
+
+    @classmethod
+    def from_engine(cls, engine, max_distinct: int = 200, max_entries: int = 1000, path: str = None):
+        """
+        Build the dictionary of slot values from the text columns of the database with at most
+        `max_distinct` values, the kind of a value is the list of the columns that contain it.
+        """
+        columns = {}
+        with engine.connect() as connection:
+            for table in inspect(engine).get_table_names():
+                if table == SQLiteRollups.CATALOG:
+                    continue
+                for column in inspect(engine).get_columns(table):
+                    if not isinstance(column["type"], String):
+                        continue
+                    values = connection.execute(text(f'SELECT DISTINCT "{column["name"]}" FROM "{table}" '
+                                                     f'WHERE "{column["name"]}" IS NOT NULL LIMIT {max_distinct + 1}')).scalars().all()
+                    if len(values) <= max_distinct:
+                        for value in values:
+                            columns.setdefault(value, set()).add(column["name"])
+        print(f"SQL plan cache dictionary: {len(columns)} values")
+
+        return cls({value: "|".join(sorted(names)) for value, names in columns.items()}, max_entries, path)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize('NFKD', text.lower())
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    def extract(self, question: str) -> tuple:
+        """
+        Find the slots of a question.
+
+        Returns:
+            str, list: The shape of the question and the (kind, value) of every slot, in order of appearance.
+        """
+        slots = []
+
+        def replace(match):
+            if match.group("text"):
+                value = self.names[match.group("text")]
+                slots.append((self.slot_values[value], value))
+            elif match.group("month"):
+                slots.append(("month", self.MONTHS[match.group("month")]))
+            else:
+                slots.append(("number", int(match.group("number"))))
+            return "{" + slots[-1][0] + "}"
+
+        return self.slot_pattern.sub(replace, self.normalize(question)), slots
+
+    def _template(self, query: str, slots: list):
+        """
+        Turn the literals of the query equal to the slots into bind parameters.
+
+        Returns:
+            str, list: The template and the parameters (name, slot, prefix, suffix, is_text), or None if the
+                       slots can not be bound unambiguously.
+        """
+        if len({str(value) for _, value in slots}) < len(slots):
+            return None
+        parameters = []
+        used = set()
+        parts = []
+        position = 0
+        for match in self.SQL_LITERAL.finditer(query):
+            literal = match.group()
+            if literal.startswith('"'):
+                continue
+            is_text = literal.startswith("'")
+            value = literal[1:-1].replace("''", "'") if is_text else literal
+            # A LIKE pattern keeps its wildcards around the value
+            core = value.strip("%")
+            prefix, suffix = value[:len(value) - len(value.lstrip("%"))], value[len(value.rstrip("%")):]
+            matches = [i for i, (kind, slot_value) in enumerate(slots)
+                       if (str(slot_value) == core if kind in ("month", "number") or not is_text
+                           else self.normalize(core) == self.normalize(str(slot_value)))]
+            if len(matches) != 1:
+                continue
+            name = f"p{len(parameters)}"
+            parameters.append((name, matches[0], prefix, suffix, is_text))
+            used.add(matches[0])
+            parts.append(query[position:match.start()] + ":" + name)
+            position = match.end()
+        # Every slot must be in the query, otherwise another value would give the same query
+        if len(used) < len(slots):
+            return None
+
+        return "".join(parts) + query[position:], parameters
+
+    def add(self, question: str, query: str) -> bool:
+        """
+        Store the query of a question as a template, the query must have run without error and returned rows.
+
+        Returns:
+            bool: True if the query was stored.
+        """
+        query = query.strip().rstrip(";").strip()
+        shape, slots = self.extract(question)
+        template = None
+        # Only single SELECT statements are cached
+        if re.match(r"(?is)^(with|select)\b", query) and ";" not in query:
+            template = self._template(query, slots)
+        if template is None:
+            self.stats["rejected"] += 1
+            return False
+        with self.lock:
+            self.entries[shape] = {"query": template[0], "parameters": template[1]}
+            self.entries.move_to_end(shape)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.stats["added"] += 1
+            self.save()
+
+        return True
+
+    def get(self, question: str):
+        """
+        Look up the template of the shape of a question and bind the slots of the question.
+
+        Returns:
+            str, dict: The template query and its bind parameters, or None if the shape is not cached.
+        """
+        shape, slots = self.extract(question)
+        with self.lock:
+            entry = self.entries.get(shape)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(shape)
+            self.stats["hits"] += 1
+        parameters = {name: f"{prefix}{slots[slot][1]}{suffix}" if is_text else slots[slot][1]
+                      for name, slot, prefix, suffix, is_text in entry["parameters"]}
+
+        return entry["query"], parameters
+
+    def save(self):
+        if self.path:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def format_result(columns: list, rows: list, truncated: bool = False) -> str:
+        """
+        Format the rows of a query, one line of `column: value` per row.
+
+        Args:
+            columns (list): The column names.
+            rows (list): The rows, as tuples of values in the order of the columns.
+            truncated (bool): Whether the rows are only the first rows of the result.
+        """
+        if not rows:
+            return "No results"
+        lines = [", ".join(f"{column}: {value}" for column, value in zip(columns, row)) for row in rows]
+        if truncated:
+            lines.append(f"(only the first {len(rows)} rows)")
+        return "\n".join(lines)
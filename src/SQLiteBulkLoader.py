@@ -0,0 +1,234 @@
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+
+class SQLiteBulkLoader:
+    """
+    Load DataFrame chunks into typed and indexed SQLite tables.
+
+    The rows are inserted with `executemany` inside a single transaction, with WAL journaling and
+    relaxed synchronization while loading. The column types are inferred from the data (INTEGER for
+    integer values, even when the column has missing values, REAL and TEXT) and widened as the chunks
+    arrive (INTEGER -> REAL -> TEXT), so a column with whole numbers in the first chunk and decimals in
+    a later one ends up as REAL. After loading the rows the common filter columns (AÑO, MES and
+    PROVINCIA*) are indexed, so the queries written by the agents filter by index instead of scanning
+    the whole table.
+    """
+    INDEX_COLUMNS = ("PROVINCIA", "AÑO", "MES")
+    TYPES = ("INTEGER", "REAL", "TEXT")
+
+    def __init__(self, db_path: str, index_columns: list = None) -> None:
+        """
+        Initialize the instance with the database path.
+
+        Args:
+            db_path (str): The path of the SQLite database file.
+            index_columns (list): The prefixes of the names of the columns to index, in the order of the
+                                  composite index. By default, PROVINCIA*, AÑO and MES.
+        """
+        self.db_path= db_path
+        self.index_columns= index_columns or list(self.INDEX_COLUMNS)
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a connection tuned for bulk loading, the transactions are handled explicitly.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-262144")
+        return conn
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    @staticmethod
+    def infer_types(df: pd.DataFrame) -> dict:
+        """
+        Infer the SQLite type of every column.
+
+        Returns:
+            dict: The type (INTEGER, REAL or TEXT) of every column.
+        """
+        types = {}
+        for col in df.columns:
+            column = df[col]
+            if pd.api.types.is_bool_dtype(column.dtype) or pd.api.types.is_integer_dtype(column.dtype):
+                types[col] = "INTEGER"
+            elif pd.api.types.is_float_dtype(column.dtype):
+                # Integer columns with missing values are read as floats, a column without values is
+                # given the narrowest type and widened by the next chunks
+                types[col] = "INTEGER" if SQLiteBulkLoader._is_whole(column) else "REAL"
+            else:
+                types[col] = "TEXT"
+        return types
+
+    @staticmethod
+    def _is_whole(column: pd.Series) -> bool:
+        values = column.dropna().values
+        return bool(np.isfinite(values).all() and np.array_equal(values, np.round(values)))
+
+    @classmethod
+    def widen_types(cls, types: dict, new_types: dict) -> dict:
+        """
+        Merge the types of the same columns inferred from different chunks, keeping the widest type
+        of every column (INTEGER -> REAL -> TEXT).
+
+        Returns:
+            dict: The widened type of every column.
+        """
+        # Other declared types, of tables not created by the loader, are never widened
+        rank = lambda col_type: cls.TYPES.index(col_type) if col_type in cls.TYPES else len(cls.TYPES)
+        widened = dict(types)
+        for col, col_type in new_types.items():
+            if col in widened and rank(col_type) > rank(widened[col]):
+                widened[col] = col_type
+        return widened
+
+    def table_types(self, conn: sqlite3.Connection, table_name: str) -> dict:
+        """
+        The declared type of every column of an existing table.
+        """
+        return {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({self._quote(table_name)})")}
+
+    def alter_types(self, conn: sqlite3.Connection, table_name: str, types: dict):
+        """
+        Rebuild a table with new column types, SQLite can not change the type of a column in place.
+        The values are converted by the affinity of the new types and the indexes are created again.
+        """
+        tmp_name = f"_{table_name}_widened"
+        columns = ", ".join(f"{self._quote(col)} {col_type}" for col, col_type in types.items())
+        names = ", ".join(self._quote(col) for col in types)
+        conn.execute(f"DROP TABLE IF EXISTS {self._quote(tmp_name)}")
+        conn.execute(f"CREATE TABLE {self._quote(tmp_name)} ({columns})")
+        conn.execute(f"INSERT INTO {self._quote(tmp_name)} ({names}) SELECT {names} FROM {self._quote(table_name)}")
+        conn.execute(f"DROP TABLE {self._quote(table_name)}")
+        conn.execute(f"ALTER TABLE {self._quote(tmp_name)} RENAME TO {self._quote(table_name)}")
+        self.create_indexes(conn, table_name, list(types))
+
+    def create_table(self, conn: sqlite3.Connection, table_name: str, df: pd.DataFrame = None,
+                     types: dict = None) -> dict:
+        """
+        Replace the table with a new empty one, with the columns and types of the DataFrame.
+
+        Args:
+            types (dict): The type of every column, e.g. inferred from every chunk of a file.
+                          By default, the types inferred from the DataFrame.
+
+        Returns:
+            dict: The type of every column.
+        """
+        types = types or self.infer_types(df)
+        columns = ", ".join(f"{self._quote(col)} {col_type}" for col, col_type in types.items())
+        conn.execute(f"DROP TABLE IF EXISTS {self._quote(table_name)}")
+        conn.execute(f"CREATE TABLE {self._quote(table_name)} ({columns})")
+        return types
+
+    def insert(self, conn: sqlite3.Connection, table_name: str, df: pd.DataFrame, types: dict = None) -> int:
+        """
+        Insert the rows of the DataFrame into an existing table.
+
+        The whole number float columns of INTEGER columns are inserted as integers. Any other value is
+        inserted as it is and stored with the type affinity of its column.
+
+        Returns:
+            int: The number of rows inserted.
+        """
+        if len(df) == 0:
+            return 0
+        types = types or {}
+        columns = {}
+        for col in df.columns:
+            column = df[col]
+            if (types.get(col) == "INTEGER" and pd.api.types.is_float_dtype(column.dtype)
+                    and self._is_whole(column)):
+                column = column.astype("Int64")
+            # Python objects, with None for the missing values
+            columns[col] = column.astype(object).where(column.notna(), None)
+        placeholders = ", ".join("?" * len(columns))
+        names = ", ".join(self._quote(col) for col in columns)
+        conn.executemany(f"INSERT INTO {self._quote(table_name)} ({names}) VALUES ({placeholders})",
+                         zip(*(values.tolist() for values in columns.values())))
+        return len(df)
+
+    def index_groups(self, columns: list) -> list:
+        """
+        Select the columns to index: a composite index over the filter columns and a single column index
+        over every other filter column, for the queries that do not filter by the first one.
+
+        Returns:
+            list: The list of columns of every index.
+        """
+        selected = [col for prefix in self.index_columns for col in columns if str(col).startswith(prefix)]
+        selected = list(dict.fromkeys(selected))
+        if not selected:
+            return []
+        return [selected] + [[col] for col in selected[1:]]
+
+    def create_indexes(self, conn: sqlite3.Connection, table_name: str, columns: list):
+        for index_columns in self.index_groups(columns):
+            index_name = f"idx_{table_name}_" + "_".join(str(col) for col in index_columns)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self._quote(index_name)} ON {self._quote(table_name)} "
+                         f"({', '.join(self._quote(col) for col in index_columns)})")
+
+    def load(self, table_name: str, chunks, limit: int = None) -> int:
+        """
+        Replace a table with the rows of some DataFrame chunks, in a single transaction.
+
+        The table is created with the types of the first chunk, the types are widened by the next chunks
+        and, if any of them changed, the table is rebuilt with the widened types before indexing it.
+
+        Args:
+            table_name (str): The name of the table.
+            chunks (iterable): The DataFrame chunks with the rows of the table.
+            limit (int): Maximum number of rows to load, None or 0 to load every row.
+
+        Returns:
+            int: The number of rows loaded.
+        """
+        t0 = time.time()
+        conn = self.connect()
+        rows = 0
+        types = None
+        try:
+            conn.execute("BEGIN")
+            for df in chunks:
+                if limit:
+                    df = df.iloc[:limit - rows]
+                if types is None:
+                    types = self.create_table(conn, table_name, df)
+                    created_types = types
+                else:
+                    types = self.widen_types(types, self.infer_types(df))
+                rows += self.insert(conn, table_name, df, types)
+                if limit and rows >= limit:
+                    break
+            if types is not None:
+                if types != created_types:
+                    print(f"Table {table_name}: column types widened to {types}")
+                    self.alter_types(conn, table_name, types)
+                else:
+                    self.create_indexes(conn, table_name, list(types))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self.optimize()
+        print(f"Table {table_name}: {rows} rows loaded in {round(time.time()-t0,4)} seconds")
+
+        return rows
+
+    def optimize(self):
+        """
+        Update the statistics used by the query planner to choose the indexes.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+
+class SQLiteRollups:
+    """
+    Materialized rollup tables of the SQLite tables, declared in the datafiles configuration.
+
+    A rollup precomputes some aggregates of a table grouped by some columns, e.g. the sum of GASTO by
+    PROVINCIA_DESTINO, AÑO and TIPO_ORIGEN, into a summary table with a unique index over the group
+    columns, so the totals asked to the agents are point lookups instead of aggregations over the
+    whole table. Every rollup is recorded in the `_rollups` catalog table, used to describe the rollups
+    in the table info of the agents. When some partitions of a table are synced, the rollups grouped by
+    the partition columns only recompute the groups of those partitions, the other rollups are rebuilt.
+    """
+    CATALOG = "_rollups"
+    AGGREGATES = ("sum", "avg", "min", "max", "count")
+
+    def __init__(self, rollups: dict) -> None:
+        """
+        Initialize the instance with the rollups of every table.
+
+        Args:
+            rollups (dict): The list of rollups of every table, every rollup has the `group_by` columns, the
+                            `measures` (the aggregate, or list of aggregates, of every column: sum, avg, min,
+                            max or count) and an optional `name`.
+        """
+        self.rollups= {table: [self._parse(table, rollup) for rollup in table_rollups or []]
+                       for table, table_rollups in rollups.items()}
+
+    @classmethod
+    def _parse(cls, table: str, rollup: dict) -> dict:
+        measures = []
+        for column, aggregates in rollup["measures"].items():
+            for aggregate in [aggregates] if isinstance(aggregates, str) else aggregates:
+                if aggregate.lower() not in cls.AGGREGATES:
+                    raise ValueError(f"Unknown aggregate {aggregate} of {column} in a rollup of {table}")
+                measures.append((column, aggregate.lower()))
+        name = rollup.get("name") or f"{table}_por_{'_'.join(rollup['group_by'])}".lower()
+        return {"name": name, "group_by": list(rollup["group_by"]), "measures": measures}
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _select(self, table: str, rollup: dict, where: str = "") -> str:
+        """
+        The query of the rows of a rollup, the column of every measure is named AGGREGATE_COLUMN.
+        """
+        group_by = ", ".join(self._quote(col) for col in rollup["group_by"])
+        measures = ", ".join(f"{aggregate.upper()}({self._quote(column)}) AS {self._quote(aggregate.upper() + '_' + column)}"
+                             for column, aggregate in rollup["measures"])
+        return (f"SELECT {group_by}, {measures}, COUNT(*) AS \"FILAS\" FROM {self._quote(table)} {where} "
+                f"GROUP BY {group_by}")
+
+    def _column_types(self, conn: sqlite3.Connection, table: str, rollup: dict) -> dict:
+        types = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({self._quote(table)})")}
+        columns = {col: types.get(col, "") for col in rollup["group_by"]}
+        for column, aggregate in rollup["measures"]:
+            columns[aggregate.upper() + "_" + column] = ("REAL" if aggregate == "avg" else
+                                                         "INTEGER" if aggregate == "count" else types.get(column, ""))
+        columns["FILAS"] = "INTEGER"
+        return columns
+
+    def _create_catalog(self, conn: sqlite3.Connection):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.CATALOG} (name TEXT PRIMARY KEY, source TEXT, "
+                     "group_by TEXT, measures TEXT)")
+
+    def build(self, conn: sqlite3.Connection, table: str):
+        """
+        Create or replace the rollups of a table, and drop its rollups no longer configured.
+        The caller handles the transaction.
+        """
+        self._create_catalog(conn)
+        rollups = self.rollups.get(table, [])
+        names = {rollup["name"] for rollup in rollups}
+        for (name,) in conn.execute(f"SELECT name FROM {self.CATALOG} WHERE source = ?", (table,)).fetchall():
+            if name not in names:
+                conn.execute(f"DROP TABLE IF EXISTS {self._quote(name)}")
+                conn.execute(f"DELETE FROM {self.CATALOG} WHERE name = ?", (name,))
+        for rollup in rollups:
+            self._build_rollup(conn, table, rollup)
+
+    def _build_rollup(self, conn: sqlite3.Connection, table: str, rollup: dict):
+        name = self._quote(rollup["name"])
+        columns = ", ".join(f"{self._quote(col)} {col_type}" for col, col_type in self._column_types(conn, table, rollup).items())
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.execute(f"CREATE TABLE {name} ({columns})")
+        conn.execute(f"INSERT INTO {name} {self._select(table, rollup)}")
+        conn.execute(f"CREATE UNIQUE INDEX {self._quote('idx_' + rollup['name'])} ON {name} "
+                     f"({', '.join(self._quote(col) for col in rollup['group_by'])})")
+        conn.execute(f"INSERT OR REPLACE INTO {self.CATALOG} VALUES (?, ?, ?, ?)",
+                     (rollup["name"], table, json.dumps(rollup["group_by"], ensure_ascii=False),
+                      json.dumps(rollup["measures"], ensure_ascii=False)))
+        print(f"Rollup {rollup['name']} built")
+
+    def refresh(self, conn: sqlite3.Connection, table: str, partition_by: list, partitions: list):
+        """
+        Recompute the groups of the rollups of a table that belong to some partitions.
+
+        Args:
+            conn (sqlite3.Connection): The connection, the caller handles the transaction.
+            table (str): The name of the table.
+            partition_by (list): The partition columns of the table.
+            partitions (list): The values of the partition columns of every changed or deleted partition.
+        """
+        if not self.rollups.get(table):
+            return
+        self._create_catalog(conn)
+        built = {name for (name,) in conn.execute(f"SELECT name FROM {self.CATALOG} WHERE source = ?", (table,))}
+        # A changed partition is also in the deleted ones
+        partitions = list(dict.fromkeys(tuple(values) for values in partitions))
+        condition = " AND ".join(f"{self._quote(col)} = ?" for col in partition_by or [])
+        for rollup in self.rollups[table]:
+            if rollup["name"] not in built or not partition_by or not set(partition_by) <= set(rollup["group_by"]):
+                # A rollup that is not grouped by the partition columns is rebuilt as a whole
+                self._build_rollup(conn, table, rollup)
+                continue
+            conn.executemany(f"DELETE FROM {self._quote(rollup['name'])} WHERE {condition}", partitions)
+            conn.executemany(f"INSERT INTO {self._quote(rollup['name'])} {self._select(table, rollup, 'WHERE ' + condition)}",
+                             partitions)
+            print(f"Rollup {rollup['name']} refreshed for {len(partitions)} partitions")
+
+    @classmethod
+    def describe(cls, conn: sqlite3.Connection) -> dict:
+        """
+        Describe the rollups recorded in the catalog of a database, for the table info of the agents.
+
+        Returns:
+            dict: The description of every rollup table.
+        """
+        descriptions = {}
+        for name, source, group_by, measures in conn.execute(
+                f"SELECT name, source, group_by, measures FROM {cls.CATALOG}").fetchall():
+            measures = ", ".join(f"{aggregate.upper()}_{column} = {aggregate.upper()}({column})"
+                                 for column, aggregate in json.loads(measures))
+            descriptions[name] = (f"/*\nPrecomputed rollup of {source} grouped by {', '.join(json.loads(group_by))}: "
+                                  f"{measures}, FILAS = number of rows of {source}. Query this table instead of "
+                                  f"aggregating {source} when the question only needs these columns.\n*/")
+
+        return descriptions
@@ -0,0 +1,25 @@
+import time
+
+class StreamingAgent:
+    """
+    The bookkeeping shared by the agents that stream their responses: the 'done' event that closes a stream
+    and the latency of the last response of the synchronous stream, in `stream_seconds`.
+    """
+    def _done_event(self, response: str, t0: float, first_token: float, save: bool = True) -> dict:
+        """
+        Build the 'done' event of a streamed response.
+
+        Args:
+            response (str): The whole response.
+            t0 (float): The time the response started.
+            first_token (float): The seconds to the first token, None if no token was streamed.
+            save (bool): Keep the seconds in `stream_seconds`, False for the async streams that run concurrently.
+
+        Returns:
+            dict: The event, with the response, the seconds to the first token and the total seconds.
+        """
+        stream_seconds = {"first_token": round(first_token or 0.0, 4), "total": round(time.time() - t0, 4)}
+        print("Stream seconds: ", stream_seconds)
+        if save:
+            self.stream_seconds= stream_seconds
+        return {"event": "done", "response": response, **stream_seconds}
@@ -0,0 +1,107 @@
+import time
+import queue
+import threading
+
+class StreamingPipeline:
+    """
+    Run a chain of stages over a stream of items.
+
+    Every stage runs in its own thread and the stages are connected by bounded queues, so a slow
+    stage blocks the previous ones (backpressure) and only a few items are held in memory at any time,
+    no matter how long the stream is. The stages overlap: while a stage processes an item, the
+    previous stage is already working on the next one.
+    """
+    _END = object()
+
+    def __init__(self, stages: list, queue_size: int = 2) -> None:
+        """
+        Initialize the pipeline with its stages.
+
+        Args:
+            stages (list): A list of (name, function) tuples. Every function receives the output of the
+                           previous stage, the output of the last stage is discarded.
+            queue_size (int): Maximum number of items waiting between two stages.
+        """
+        self.stages= stages
+        self.queue_size= queue_size
+        self.stats= {}
+
+    def _put(self, q: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q: queue.Queue, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return self._END
+
+    def _run_stage(self, name: str, function, input_q: queue.Queue, output_q: queue.Queue,
+                   stop: threading.Event, errors: list):
+        stats = self.stats[name]
+        try:
+            while True:
+                item = self._get(input_q, stop)
+                if item is self._END:
+                    break
+                t0 = time.time()
+                result = function(item)
+                stats["seconds"] += time.time() - t0
+                stats["items"] += 1
+                if output_q is not None and not self._put(output_q, result, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if output_q is not None:
+                self._put(output_q, self._END, stop)
+
+    def run(self, source) -> dict:
+        """
+        Feed the items of the source through the stages until the source is exhausted.
+
+        Args:
+            source (iterable): The stream of items, it is consumed in the calling thread.
+
+        Returns:
+            dict: Number of items processed and busy time in seconds per stage.
+
+        Raises:
+            Exception: The first error raised by any stage, once all the stages are stopped.
+        """
+        stop = threading.Event()
+        errors = []
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.stats = {name: {"items": 0, "seconds": 0.0} for name, _ in self.stages}
+        threads = []
+        for i, (name, function) in enumerate(self.stages):
+            output_q = queues[i+1] if i+1 < len(queues) else None
+            thread = threading.Thread(target=self._run_stage, name=name, daemon=True,
+                                      args=(name, function, queues[i], output_q, stop, errors))
+            thread.start()
+            threads.append(thread)
+
+        try:
+            for item in source:
+                if not self._put(queues[0], item, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            self._put(queues[0], self._END, stop)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return self.stats
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from src.RowSerializer import RowSerializer
+from src.TokenCounter import TokenCounter
+
+class TabularChunker:
+    """
+    Pack the rows of a table into chunk documents by a measured size budget.
+
+    The rows are grouped by a key (e.g. PROVINCIA_DESTINO + AÑO), so a chunk only holds rows of a
+    single group and answers a single kind of question. Inside every group, the rows are packed greedily
+    while the chunk fits the maximum size in UTF-8 bytes (the VARCHAR limit of the collection), the
+    maximum number of tokens of the embedding model and, optionally, a maximum number of rows.
+    A single row over the budget gets its longest text values shortened, so its document stays valid.
+    """
+    def __init__(self, serializer: RowSerializer, max_bytes: int = 16384, max_tokens: int = 8000,
+                 token_counter: TokenCounter = None) -> None:
+        """
+        Initialize the instance with the serializer and the size budget of a chunk.
+
+        Args:
+            serializer (RowSerializer): The serializer of the rows and chunk documents.
+            max_bytes (int): Maximum size of a chunk document in UTF-8 bytes.
+            max_tokens (int): Maximum number of tokens of a chunk document.
+            token_counter (TokenCounter): The counter of tokens of the embedding model.
+        """
+        self.serializer= serializer
+        self.max_bytes= max_bytes
+        self.max_tokens= max_tokens
+        self.token_counter= token_counter if token_counter is not None else TokenCounter()
+
+    def _assign_chunks(self, group_codes: np.ndarray, row_bytes: np.ndarray, row_tokens: np.ndarray,
+                       budget_bytes: int, budget_tokens: int, max_rows: int) -> np.ndarray:
+        """
+        Assign every row to a chunk, packing greedily the rows of every group in order.
+
+        Returns:
+            np.ndarray: The chunk id of every row, the chunk ids are numbered in order of appearance.
+        """
+        chunk_ids = np.empty(len(group_codes), dtype=np.int64)
+        open_chunks = {}
+        next_id = 0
+        for i, (group, size, tokens) in enumerate(zip(group_codes.tolist(), row_bytes.tolist(), row_tokens.tolist())):
+            chunk = open_chunks.get(group)
+            if (chunk is None or chunk[1] + size > budget_bytes or chunk[2] + tokens > budget_tokens
+                    or (max_rows and chunk[3] >= max_rows)):
+                chunk = [next_id, 0, 0, 0]
+                open_chunks[group] = chunk
+                next_id += 1
+            chunk[1] += size
+            chunk[2] += tokens
+            chunk[3] += 1
+            chunk_ids[i] = chunk[0]
+
+        return chunk_ids
+
+    def _shrink_row(self, row: pd.DataFrame, budget_bytes: int, budget_tokens: int) -> str:
+        """
+        Serialize a single row larger than the budget, shortening its longest text values until it fits,
+        so the document is still valid in its template.
+
+        Raises:
+            ValueError: If the row does not fit the budget even without its text values.
+        """
+        row = row.astype(object)
+        separator_bytes = len(self.serializer.separator().encode('utf-8'))
+        while True:
+            text = self.serializer.serialize_rows(row)[0]
+            size = len(text.encode('utf-8')) + separator_bytes
+            tokens = self.token_counter.count(text) + 1
+            if size <= budget_bytes and tokens <= budget_tokens:
+                return text
+            values = {col: value.encode('utf-8') for col, value in row.iloc[0].items() if isinstance(value, str) and value}
+            if not values:
+                raise ValueError(f"A row of {size} bytes and {tokens} tokens is over the chunk size")
+            col = max(values, key=lambda col: len(values[col]))
+            ratio = min(budget_bytes / size, budget_tokens / tokens)
+            keep = min(int(len(values[col]) * ratio), len(values[col]) - (size - budget_bytes)) - 3
+            shortened = values[col][:keep].decode('utf-8', errors='ignore') + "..." if keep > 0 else ""
+            row.iloc[0, row.columns.get_loc(col)] = shortened
+
+    def chunk(self, df: pd.DataFrame, group_keys: pd.Series, description: str, max_rows: int = None) -> tuple:
+        """
+        Split the rows of the DataFrame into chunk documents.
+
+        Args:
+            df (pd.DataFrame): The rows to chunk.
+            group_keys (pd.Series): The group of every row, a chunk never mixes groups.
+            description (str): The description of the content, written in the header of every chunk.
+            max_rows (int): Maximum number of rows per chunk, None to only limit by size.
+
+        Returns:
+            list, np.ndarray, np.ndarray: The chunk documents, the position of the first row of every chunk and 
+                                          the chunk document of every row.
+        """
+        if len(df) == 0:
+            return [], np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+        rows = self.serializer.serialize_rows(df)
+        separator = self.serializer.separator()
+        header = self.serializer.header(list(df.columns), description)
+        footer = self.serializer.footer()
+        # Size of every row, plus the separator that joins it to the next one
+        row_bytes = np.fromiter((len(row.encode('utf-8')) for row in rows), dtype=np.int64, count=len(rows))
+        row_bytes += len(separator.encode('utf-8'))
+        row_tokens = np.array(self.token_counter.count_many(rows.tolist()), dtype=np.int64) + 1
+        budget_bytes = self.max_bytes - len((header + footer).encode('utf-8'))
+        budget_tokens = self.max_tokens - self.token_counter.count(header + footer)
+
+        # A single row larger than the budget can not be split, its longest text values are shortened
+        for i in np.flatnonzero((row_bytes > budget_bytes) | (row_tokens > budget_tokens)).tolist():
+            print(f"Warning: a row of {row_bytes[i]} bytes is over the chunk size, its text values are shortened")
+            rows[i] = self._shrink_row(df.iloc[[i]], budget_bytes, budget_tokens)
+            row_bytes[i] = len(rows[i].encode('utf-8')) + len(separator.encode('utf-8'))
+            row_tokens[i] = self.token_counter.count(rows[i]) + 1
+
+        group_codes = pd.factorize(group_keys.values)[0]
+        chunk_ids = self._assign_chunks(group_codes, row_bytes, row_tokens, budget_bytes, budget_tokens, max_rows)
+        first_rows = np.unique(chunk_ids, return_index=True)[1]
+        docs, doc_chunks = self.serializer.join_chunks(rows, chunk_ids, list(df.columns), description)
+
+        # The chunk ids are numbered in order of appearance, as the documents
+        return docs, first_rows[doc_chunks], chunk_ids
@@ -1,32 +1,104 @@
 import os
+import time
+import asyncio
 from langchain_community.utilities import SQLDatabase
 from langchain.chains import create_sql_query_chain
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from operator import itemgetter
 
-class TextToSQLAgent:
+from src.SQLPlanCache import SQLPlanCache
+from src.GuardedSQLDatabase import GuardedSQLDatabase
+from src.StreamingAgent import StreamingAgent
+
+class TextToSQLAgent(StreamingAgent):
     """
     A TextToSQL Agent 
     """
-    def __init__(self,sql_db: SQLDatabase, agent_system_role: str, langchain_llm) -> None:
+    def __init__(self,sql_db: SQLDatabase, agent_system_role: str, langchain_llm, plan_cache: SQLPlanCache = None,
+                 plan_answer: str = "llm") -> None:
         """
         Initialize an instance of PrepareSQLFromTabularData.
 
         Args:
             files_dir (str): The directory containing the CSV or XLSX files to be converted to SQL tables.
+            plan_cache (SQLPlanCache): Optional cache of the SQL queries by question shape, a question with a
+                                       cached shape runs the cached query without asking the LLM to write it.
+            plan_answer (str): With a cached query, 'llm' to answer with the LLM from the result or 'result' to
+                               answer with the formatted result, without any LLM call.
         """
 
         # Set the DB
-        self.db= db
+        self.db= sql_db
         # Set the LLM
         self.langchain_llm= langchain_llm
         # Set the prompt for the system role
         self.agent_system_role= agent_system_role
         # Start the chat history
         self.chatbot= []
+        self.plan_cache= plan_cache
+        self.plan_answer= plan_answer
+        # Seconds to the first token and total seconds of the last streamed response
+        self.stream_seconds= {}
+        # Build the chains once, every question only runs them
+        self._build_chain()
+
+    def _build_chain(self):
+        """
+        Build the chains: write the SQL query and answer the question with the result of the query.
+        """
+        self.write_query = create_sql_query_chain(
+                        self.langchain_llm, self.db)
+
+        answer_prompt = PromptTemplate.from_template(
+                        self.agent_system_role)
+        self.answer = answer_prompt | self.langchain_llm | StrOutputParser()
+
+    def _fetch_rows(self, query: str, parameters: dict) -> tuple:
+        """
+        Run a query and return the column names, the rows and whether the rows were truncated.
+        """
+        if isinstance(self.db, GuardedSQLDatabase):
+            return self.db.fetch_rows(query, parameters)
+        cursor = self.db.run(query, fetch="cursor", parameters=parameters)
+        try:
+            return list(cursor.keys()), [tuple(row) for row in cursor.fetchall()], False
+        finally:
+            cursor.close()
+
+    def _cached_plan(self, message: str):
+        """
+        Run the cached query of the shape of the message, if any.
+
+        Returns:
+            dict: The inputs of the answer chain (question, query and result), or None if the shape is not cached
+                  or the query failed. With plan_answer='result', the result is the formatted rows.
+        """
+        if self.plan_cache is None:
+            return None
+        plan = self.plan_cache.get(message)
+        if plan is None:
+            return None
+        query, parameters = plan
+        t0 = time.time()
+        if self.plan_answer == "result":
+            # The rows are formatted as they come from the database, not parsed back from a string
+            try:
+                result = SQLPlanCache.format_result(*self._fetch_rows(query, parameters))
+            except Exception as error:
+                print(f"SQL plan cache query failed: {error}")
+                return None
+        else:
+            result = self.db.run_no_throw(query, parameters=parameters)
+            if result.startswith("Error"):
+                return None
+        print(f"SQL plan cache hit, query run in {round(time.time()-t0,4)} seconds: {query} {parameters}")
+
+        return {"question": message, "query": query, "result": result}
+
+    def _save_plan(self, message: str, query: str, result: str):
+        # Only the queries that ran and returned rows are cached
+        if self.plan_cache is not None and result and not result.startswith("Error"):
+            self.plan_cache.add(message, query)
 
     def respond(self, message: str) -> tuple:
         """
@@ -44,23 +116,126 @@ class TextToSQLAgent:
                                              values to match the required return type and may be updated for further functionality.
                                              Currently, the function primarily updates the chatbot conversation list.
         """
-        execute_query = QuerySQLDataBaseTool(db=self.db)
-
-        write_query = create_sql_query_chain(
-                        self.langchain_llm, self.db)
-
-        answer_prompt = PromptTemplate.from_template(
-                        self.agent_system_role)
-        answer = answer_prompt | self.langchain_llm | StrOutputParser()
-        chain = (
-                    RunnablePassthrough.assign(query=write_query).assign(
-                            result=itemgetter("query") | execute_query
-                    )
-                    | answer
-                )
-        response = chain.invoke({"question": message})
+        inputs = self._cached_plan(message)
+        if inputs is not None and self.plan_answer == "result":
+            response = inputs["result"]
+        elif inputs is not None:
+            response = self.answer.invoke(inputs)
+        else:
+            query = self.write_query.invoke({"question": message})
+            result = self.db.run_no_throw(query)
+            response = self.answer.invoke({"question": message, "query": query, "result": result})
+            self._save_plan(message, query, result)
 
         # Get the `response` variable from any of the selected scenarios and pass it to the user.
         self.chatbot.append(
                 (message, response))
         return response, self.chatbot
+
+    async def arespond(self, message: str, chat: list = None) -> tuple:
+        """
+        Respond to a message without blocking the event loop, see respond.
+
+        Many messages can be answered concurrently, so the turn is added to the given chat history instead
+        of the history of the agent.
+
+        Args:
+            chat (list): The chat history of the conversation, a new one by default.
+
+        Returns:
+            Tuple[str, List]: The response and the updated chat history.
+        """
+        chat = [] if chat is None else chat
+        inputs = await asyncio.to_thread(self._cached_plan, message)
+        if inputs is not None and self.plan_answer == "result":
+            response = inputs["result"]
+        elif inputs is not None:
+            response = await self.answer.ainvoke(inputs)
+        else:
+            query = await self.write_query.ainvoke({"question": message})
+            result = await asyncio.to_thread(self.db.run_no_throw, query)
+            response = await self.answer.ainvoke({"question": message, "query": query, "result": result})
+            self._save_plan(message, query, result)
+        chat.append(
+                (message, response))
+
+        return response, chat
+
+    def stream(self, message: str):
+        """
+        Respond to a message streaming the tokens of the answer as they arrive, see respond.
+
+        Yields:
+            dict: The events of the response: 'plan_cache' with the cached query or 'sql_generated' with the
+                  query written by the LLM, 'sql_executed' with its result, 'token' with every piece of the
+                  answer and 'done' with the whole response, the seconds to the first token and the total seconds.
+        """
+        t0 = time.time()
+        inputs = self._cached_plan(message)
+        if inputs is not None:
+            yield {"event": "plan_cache", "query": inputs["query"]}
+        if inputs is not None and self.plan_answer == "result":
+            chunks = [inputs["result"]]
+        else:
+            if inputs is None:
+                query = self.write_query.invoke({"question": message})
+                yield {"event": "sql_generated", "query": query, "seconds": round(time.time() - t0, 4)}
+                result = self.db.run_no_throw(query)
+                self._save_plan(message, query, result)
+                inputs = {"question": message, "query": query, "result": result}
+            chunks = self.answer.stream(inputs)
+        yield {"event": "sql_executed", "result": inputs["result"], "seconds": round(time.time() - t0, 4)}
+
+        first_token = None
+        tokens = []
+        for chunk in chunks:
+            if chunk:
+                first_token = first_token or time.time() - t0
+                tokens.append(chunk)
+                yield {"event": "token", "text": chunk}
+
+        response = "".join(tokens)
+        self.chatbot.append(
+                (message, response))
+        yield self._done_event(response, t0, first_token)
+
+    async def astream(self, message: str, chat: list = None):
+        """
+        Respond to a message streaming the tokens of the answer without blocking the event loop, see stream.
+        Like arespond, the turn is added to the given chat history, and the events are the same as the ones of stream.
+        """
+        chat = [] if chat is None else chat
+        t0 = time.time()
+        inputs = await asyncio.to_thread(self._cached_plan, message)
+        if inputs is not None:
+            yield {"event": "plan_cache", "query": inputs["query"]}
+        if inputs is not None and self.plan_answer == "result":
+            chunks = self._achunks([inputs["result"]])
+        else:
+            if inputs is None:
+                query = await self.write_query.ainvoke({"question": message})
+                yield {"event": "sql_generated", "query": query, "seconds": round(time.time() - t0, 4)}
+                result = await asyncio.to_thread(self.db.run_no_throw, query)
+                self._save_plan(message, query, result)
+                inputs = {"question": message, "query": query, "result": result}
+            chunks = self.answer.astream(inputs)
+        yield {"event": "sql_executed", "result": inputs["result"], "seconds": round(time.time() - t0, 4)}
+
+        first_token = None
+        tokens = []
+        async for chunk in chunks:
+            if chunk:
+                first_token = first_token or time.time() - t0
+                tokens.append(chunk)
+                yield {"event": "token", "text": chunk}
+
+        response = "".join(tokens)
+        chat.append(
+                (message, response))
+        yield self._done_event(response, t0, first_token, save=False)
+
+    @staticmethod
+    async def _achunks(chunks: list):
+        # The formatted result of a cached query, streamed as the chunks of the LLM
+        for chunk in chunks:
+            yield chunk
@@ -0,0 +1,59 @@
+import tiktoken
+
+class TokenCounter:
+    """
+    Count the tokens of a text for a given OpenAI model.
+
+    When the tiktoken encoding can not be loaded (e.g. the BPE file can not be downloaded in an
+    offline environment) the counter falls back to an estimate of 4 characters per token.
+    """
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, model_name: str = None) -> None:
+        """
+        Initialize the instance and load the tokenizer of the model.
+
+        Args:
+            model_name (str): The name of the model whose tokenizer is used. Defaults to cl100k_base.
+        """
+        self.model_name= model_name
+        self.encoding= None
+        try:
+            if model_name:
+                self.encoding= tiktoken.encoding_for_model(model_name)
+            else:
+                self.encoding= tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            # Unknown model name, use the encoding of the current OpenAI models
+            self.encoding= self._safe_get_encoding("cl100k_base")
+        except Exception:
+            self.encoding= None
+
+    def __getstate__(self):
+        # The encoding is loaded again when the counter is sent to another process
+        return {"model_name": self.model_name}
+
+    def __setstate__(self, state):
+        self.__init__(state["model_name"])
+
+    def _safe_get_encoding(self, name: str):
+        try:
+            return tiktoken.get_encoding(name)
+        except Exception:
+            return None
+
+    def count(self, text: str) -> int:
+        """
+        Count the tokens of a single text.
+        """
+        if self.encoding is None:
+            return len(text) // self.CHARS_PER_TOKEN + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_many(self, texts: list) -> list:
+        """
+        Count the tokens of a list of texts, encoding them in a single batch call.
+        """
+        if self.encoding is None:
+            return [len(text) // self.CHARS_PER_TOKEN + 1 for text in texts]
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())]
@@ -1,45 +1,144 @@
-from pymilvus import MilvusClient
+from pymilvus import MilvusClient, AsyncMilvusClient
 from pymilvus import DataType
 import cohere
+import json
 import os
+import time
+import asyncio
+import numpy as np
+from dataclasses import dataclass
+
+from src.MilvusBulkInserter import MilvusBulkInserter
+from src.LocalReranker import LocalReranker
+
+@dataclass
+class SearchHit:
+    """
+    A document returned by a vector search, with its similarity score.
+    """
+    row_id: int
+    score: float
+    row: str
+    source: str
+    description: str
+    batch: int
+    partition: str = ""
+    province: str = ""
+    year_min: int = 0
+    year_max: int = 0
+    month_min: int = 0
+    month_max: int = 0
 
 class VectorDB:
+    # Fields returned with every search hit
+    OUTPUT_FIELDS = ["row", "source", "description", "batch", "partition", "province", "year_min", "year_max",
+                     "month_min", "month_max"]
+    # Scalar fields with the provinces and the ranges of years and months of the rows of a document
+    RANGE_FIELDS = ["year_min", "year_max", "month_min", "month_max"]
+    # Maximum length of the VARCHAR fields of the collection schema
+    SOURCE_MAX_LENGTH = 100
+    ROW_MAX_LENGTH = 16384
+    DESCRIPTION_MAX_LENGTH = 256
+    PARTITION_MAX_LENGTH = 256
+    PROVINCE_MAX_LENGTH = 512
+    # The embeddings are stored as float32, the quantized search with exact re-scoring is only in LocalVectorDB
+    VECTOR_DTYPE = np.float32
 
-    def __init__(self, uri:str, token: str, rerank: bool = False) -> None:
+    def __init__(self, uri:str, token: str, rerank: bool = False, insert_workers: int = 4,
+                 insert_batch_bytes: int = 8 * 1024**2, reranker: str = "cohere") -> None:
         """
         Initialize the instance with the file directory and load the app config.
         
         Args:
             file_directory (str): The directory path of the file to be processed.
+            insert_workers (int): Maximum number of inserts running at the same time.
+            insert_batch_bytes (int): Maximum estimated size in bytes of the payload of an insert.
+            reranker (str): With rerank True, 'cohere' to rerank with the Cohere API or 'local' to rerank 
+                            in process with BM25 and numeric matching.
         """
         self.uri = uri
         self.token = token
-        if rerank:
+        self.insert_workers = insert_workers
+        self.insert_batch_bytes = insert_batch_bytes
+        self.rerank = rerank
+        self.async_milvus_client = None
+        self.rerank_stats = {"calls": 0, "seconds": 0.0}
+        if rerank and reranker == "local":
+            self.reranker = LocalReranker()
+        elif rerank:
             self.reranker = cohere.ClientV2(os.getenv("COHERE_API_KEY"))
 
+    @staticmethod
+    def truncate(text: str, max_length: int) -> str:
+        """
+        Truncate a text to a maximum length in UTF-8 bytes, without splitting a character.
+        """
+        encoded = text.encode('utf-8')
+        if len(encoded) <= max_length:
+            return text
+        return encoded[:max_length].decode('utf-8', errors='ignore')
+
     def load_milvus_client(self):
         self.milvus_client = MilvusClient(uri=self.uri, token=self.token)
+        self.inserter = MilvusBulkInserter(self.milvus_client, self.insert_batch_bytes, max_workers=self.insert_workers)
         print(f"Connected to DB: {self.uri}")
 
-    def prepare_vectordb(self, collection_name: str, dim: int):
+    def insert(self, collection_name: str, columns: dict) -> dict:
+        """
+        Insert columnar data into the collection with concurrent inserts sized by payload bytes.
+
+        Args:
+            collection_name (str): The name of the collection.
+            columns (dict): The values of every field of the collection, all the columns have the same length.
+
+        Returns:
+            dict: The insert statistics, see MilvusBulkInserter.insert.
+        """
+        columns = {**columns, "row_embedding": self._vectors(columns["row_embedding"])}
+        return self.inserter.insert(collection_name, columns)
+
+    def _vectors(self, vectors) -> np.ndarray:
+        """
+        Convert the embeddings to a NumPy array of the dtype of the stored vectors.
+        """
+        return np.asarray(vectors, dtype=self.VECTOR_DTYPE)
+
+    def reset_insert_stats(self):
+        self.inserter.reset_stats()
+
+    def insert_summary(self) -> dict:
+        return self.inserter.summary()
+
+    def flush(self, collection_name: str):
+        """
+        Persist the inserted and deleted documents of the collection, at the end of a load.
+        """
+        self.milvus_client.flush(collection_name)
+
+    def prepare_vectordb(self, collection_name: str, dim: int, drop_existing: bool = True):
+        """
+        Create the collection, dropping the existing one unless `drop_existing` is False.
+
+        With drop_existing False an existing collection is kept, so it can be synced incrementally.
+        """
         self.dim= dim
         self.collection_name= collection_name
 
         # Check if the collection exists
         check_collection = self.milvus_client.has_collection(collection_name)
 
+        if check_collection and not drop_existing:
+            self.check_schema(collection_name, dim)
+            print(f"Using the existing collection: {collection_name}")
+            self.milvus_client.load_collection(collection_name)
+            return
+
         if check_collection:
             self.milvus_client.drop_collection(collection_name)
             print("Success to drop the existing collection %s" % collection_name)
 
         print("Preparing schema")
-        self.schema = self.milvus_client.create_schema(auto_id= True)
-        self.schema.add_field("row_id", DataType.INT64, is_primary=True, description="Row id")
-        self.schema.add_field("batch", DataType.INT64, is_primary=False, description="Batch")
-        self.schema.add_field("source", DataType.VARCHAR, max_length=100, description="Source datafile name")
-        self.schema.add_field("row", DataType.VARCHAR, max_length= 16384, description="Row content")
-        self.schema.add_field("description", DataType.VARCHAR, max_length= 256, description="Data content description")
-        self.schema.add_field("row_embedding", DataType.FLOAT_VECTOR, dim=dim, description="Row embedding")
+        self.schema = self._schema(dim)
         print("Preparing index parameters")
         index_params = self.milvus_client.prepare_index_params()
         index_params.add_index("row_embedding", index_type="AUTOINDEX", metric_type="COSINE")
@@ -50,7 +149,45 @@ class VectorDB:
         collection_property = self.milvus_client.describe_collection(collection_name)
         print("Show collection details: %s" % collection_property)
 
+    def _schema(self, dim: int):
+        schema = self.milvus_client.create_schema(auto_id= True)
+        schema.add_field("row_id", DataType.INT64, is_primary=True, description="Row id")
+        schema.add_field("batch", DataType.INT64, is_primary=False, description="Batch")
+        schema.add_field("source", DataType.VARCHAR, max_length=self.SOURCE_MAX_LENGTH, description="Source datafile name")
+        schema.add_field("row", DataType.VARCHAR, max_length= self.ROW_MAX_LENGTH, description="Row content")
+        schema.add_field("description", DataType.VARCHAR, max_length= self.DESCRIPTION_MAX_LENGTH, description="Data content description")
+        schema.add_field("partition", DataType.VARCHAR, max_length= self.PARTITION_MAX_LENGTH, description="Partition of the source rows")
+        schema.add_field("province", DataType.VARCHAR, max_length= self.PROVINCE_MAX_LENGTH, description="Provinces of the rows, separated by '|'")
+        for field in self.RANGE_FIELDS:
+            schema.add_field(field, DataType.INT64, description=f"{field.replace('_', ' ').capitalize()} of the rows, 0 if unknown")
+        schema.add_field("row_embedding", DataType.FLOAT_VECTOR, dim=dim, description="Row embedding")
+
+        return schema
+
+    def check_schema(self, collection_name: str, dim: int = None):
+        """
+        Check that an existing collection has the fields of the current schema, e.g. before syncing it or
+        searching it with filters. The collections created before the partition, province and ranges
+        fields were added can not be migrated in place.
+
+        Raises:
+            ValueError: If a field is missing or has another type or dimension.
+        """
+        existing = {field["name"]: field for field in self.milvus_client.describe_collection(collection_name)["fields"]}
+        missing, changed = [], []
+        for field in self._schema(dim or 1).fields:
+            if field.name not in existing:
+                missing.append(field.name)
+            elif (existing[field.name]["type"] != field.dtype
+                  or (dim and field.params.get("dim") and existing[field.name]["params"].get("dim") != dim)):
+                changed.append(field.name)
+        if missing or changed:
+            raise ValueError(f"The collection {collection_name} has an older schema (missing fields {missing}, "
+                             f"changed fields {changed}). Load it again from scratch, without the incremental sync, "
+                             f"to recreate it")
+
     def load_milvus_collection(self, collection_name: str):
+        self.check_schema(collection_name)
         # 7. Load the collection
         self.milvus_client.load_collection(
             collection_name
@@ -63,6 +200,89 @@ class VectorDB:
         print(res)
         print(f"Loaded Vector DB: {self.uri}")
 
+    def delete_partitions(self, collection_name: str, source: str, partitions: list):
+        """
+        Delete the documents of some partitions of a source datafile.
+        """
+        # Delete in groups, to keep the filter expressions short
+        for i in range(0, len(partitions), 100):
+            keys = ", ".join(json.dumps(key, ensure_ascii=False) for key in partitions[i:i+100])
+            self.milvus_client.delete(collection_name, filter=f'source == {json.dumps(source, ensure_ascii=False)} and partition in [{keys}]')
+        print(f"Deleted {len(partitions)} partitions of {source} from {collection_name}")
+
+    def delete_source(self, collection_name: str, source: str):
+        """
+        Delete all the documents of a source datafile.
+        """
+        self.milvus_client.delete(collection_name, filter=f'source == {json.dumps(source, ensure_ascii=False)}')
+        print(f"Deleted {source} from {collection_name}")
+
+    def search(self, collection_name: str, query_vectors: list, topk: int, search_params: dict, 
+               filter: str = "") -> list:
+        """
+        Search the documents most similar to one or more query vectors, in a single call.
+
+        The content of the documents is returned with the hits, there is no need of a later get.
+
+        Args:
+            collection_name (str): The name of the collection.
+            query_vectors (list): The embeddings of the queries.
+            topk (int): Number of documents returned per query.
+            search_params (dict): The Milvus search parameters.
+            filter (str): An optional filter expression on the scalar fields.
+
+        Returns:
+            list: For every query, the list of SearchHit sorted by score.
+        """
+        results = self.milvus_client.search(collection_name= collection_name, data=list(self._vectors(query_vectors)), filter=filter,
+                                            limit=topk, search_params=search_params, anns_field="row_embedding",
+                                            output_fields=self.OUTPUT_FIELDS)
+
+        return self._to_hits(results)
+
+    async def asearch(self, collection_name: str, query_vectors: list, topk: int, search_params: dict,
+                      filter: str = "") -> list:
+        """
+        Search the documents most similar to one or more query vectors with the async Milvus client, see search.
+
+        The async client is created on the first call, in the running event loop. Milvus Lite (a local .db file)
+        has no async client, the search runs in a worker thread.
+        """
+        if self.uri.endswith(".db"):
+            return await asyncio.to_thread(self.search, collection_name, query_vectors, topk, search_params, filter)
+        if self.async_milvus_client is None:
+            self.async_milvus_client = AsyncMilvusClient(uri=self.uri, token=self.token)
+        results = await self.async_milvus_client.search(collection_name, data=list(self._vectors(query_vectors)), filter=filter,
+                                                        limit=topk, search_params=search_params, 
+                                                        anns_field="row_embedding", output_fields=self.OUTPUT_FIELDS)
+
+        return self._to_hits(results)
+
+    def _to_hits(self, results) -> list:
+        # The id of a hit is under the name of the primary key field
+        return [[SearchHit(row_id=hit["row_id"], score=hit["distance"], **{field: hit["entity"].get(field)
+                                                                           for field in self.OUTPUT_FIELDS})
+                 for hit in hits] for hits in results]
+
+    def iter_fields(self, collection_name: str, fields: list, batch_size: int = 1000):
+        """
+        Iterate over the values of some scalar fields of every document of the collection, 
+        reading them in pages of batch_size documents.
+
+        Yields:
+            dict: The values of the fields of the next document.
+        """
+        iterator = self.milvus_client.query_iterator(collection_name, batch_size=batch_size, filter="",
+                                                     output_fields=fields)
+        try:
+            while True:
+                page = iterator.next()
+                if not page:
+                    break
+                yield from page
+        finally:
+            iterator.close()
+
     def print_milvus_results(self, results: list):
         for hits in results:
             print("TopK results:")
@@ -70,6 +290,9 @@ class VectorDB:
                 print(hit) 
 
     def get_docs_results(self, collection_name: str, results: list):
+        # The hits returned by search already hold the content of the documents
+        if all(isinstance(hit, SearchHit) for hits in results for hit in hits):
+            return [hit.row for hits in results for hit in hits]
 
         res = self.milvus_client.get(
             collection_name=collection_name,
@@ -81,19 +304,33 @@ class VectorDB:
     
     def rerank_docs(self, query: str, documents: list, top_n: int = 2) -> list:
         """
-        Rerank the documents using Cohere's reranking model.
+        Rerank the documents using Cohere's reranking model, or the local reranker.
         Args:
             query (str): The user query.
             documents (list): List of documents to rerank.
         Returns:
             list: Reranked documents.
         """
-        # Rerank the documents
-        results = self.reranker.rerank(
-            model=os.getenv("RERANK_MODEL"), query=query, documents=documents, top_n=top_n)
-        # Extract the reranked documents
-        reranked_docs = [result.document for result in results.results]
+        t0 = time.time()
+        if isinstance(self.reranker, LocalReranker):
+            reranked_docs = self.reranker.rerank(query, documents, top_n)
+        else:
+            # Rerank the documents
+            results = self.reranker.rerank(
+                model=os.getenv("RERANK_MODEL"), query=query, documents=documents, top_n=top_n)
+            # Extract the reranked documents by their position in the input
+            reranked_docs = [documents[result.index] for result in results.results]
+        self.rerank_stats["calls"] += 1
+        self.rerank_stats["seconds"] += time.time() - t0
 
         #for result in results.results:
         #    print(result)
         return reranked_docs
+
+    async def arerank_docs(self, query: str, documents: list, top_n: int = 2) -> list:
+        """
+        Rerank the documents without blocking the event loop, see rerank_docs.
+        """
+        if isinstance(self.reranker, LocalReranker):
+            return self.rerank_docs(query, documents, top_n)
+        return await asyncio.to_thread(self.rerank_docs, query, documents, top_n)
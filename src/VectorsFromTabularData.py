@@ -1,23 +1,51 @@
 import os
 import pandas as pd
 import time
-import json
+
+from src.EmbeddingEngine import EmbeddingEngine
+from src.StreamingPipeline import StreamingPipeline
+from src.IngestManifest import IngestManifest
+from src.RowSerializer import RowSerializer
+from src.TabularChunker import TabularChunker
+from src.IngestScheduler import IngestScheduler
+from src.ParquetStaging import ParquetStaging
+from src.ChunkSorter import ChunkSorter
 
 class PrepareVectorDBFromTabularData:
     def __init__(self, file_directory:str, collection_name: str, csv_codec: str, 
-                 csv_sep: str, embedding_model, vectordb) -> None:
+                 csv_sep: str, embedding_model, vectordb, embedding_engine: EmbeddingEngine = None,
+                 manifest_path: str = "vectordb_manifest.json", row_template: str = "json",
+                 chunk_max_tokens: int = 8000, max_workers: int = 1, staging: ParquetStaging = None) -> None:
         """
         Initialize the instance with the file directory and load the app config.
         
         Args:
             file_directory (str): The directory path of the file to be processed.
+            embedding_engine (EmbeddingEngine): The engine used to batch the embedding requests. 
+                                                If None, an engine with the default parameters is created.
+            manifest_path (str): The path of the manifest of the datafiles loaded in the collection.
+            row_template (str): The template used to serialize the rows: 'json', 'kv' or 'markdown'.
+            chunk_max_tokens (int): Maximum number of tokens of a chunk document.
+            max_workers (int): Number of processes reading and serializing the datafiles in parallel, 
+                               1 to process them one after another.
+            staging (ParquetStaging): If set, the datafiles are read from their staged Parquet version.
         """
         self.file_directory= file_directory
         self.embeddings_model= embedding_model
+        if embedding_engine is None:
+            embedding_engine= EmbeddingEngine(embedding_model)
+        self.embedding_engine= embedding_engine
         self.vectordb= vectordb
         self.collection_name= collection_name
         self.csv_codec= csv_codec
         self.csv_sep= csv_sep
+        self.manifest= IngestManifest(manifest_path, collection_name)
+        self.serializer= RowSerializer(row_template)
+        # The chunks never exceed the size of the row field of the collection
+        self.chunker= TabularChunker(self.serializer, vectordb.ROW_MAX_LENGTH, chunk_max_tokens, 
+                                     self.embedding_engine.token_counter)
+        self.scheduler= IngestScheduler(max_workers)
+        self.staging= staging
         self.docs = None
         self.metadatas = None
         self.ids = None
@@ -42,8 +70,11 @@ class PrepareVectorDBFromTabularData:
                 file_names_with_extensions)
         print(file_name)
         print(file_extension)
+        # Staged datafile
+        if self.staging is not None:
+            df = self.staging.read(file_directory, limit=limit)
         # CSV datafile        
-        if file_extension == ".csv":
+        elif file_extension == ".csv":
             df = pd.read_csv(file_directory, sep= self.csv_sep, nrows=limit, encoding= self.csv_codec)
         # Excel datafile                    
         elif file_extension == ".xlsx":
@@ -56,7 +87,47 @@ class PrepareVectorDBFromTabularData:
 
         return df, file_name
 
-    
+    def _iter_dataframe(self, file_directory: str, limit: int, chunk_size: int, file_hash: str = None):
+        """
+        Read the specified CSV or Excel file in chunks of rows, without loading the whole file in memory.
+        
+        Args:
+            file_directory (str): The directory path of the file to be loaded.
+            limit (int): Maximum number of rows to read, 0 or None to read the whole file.
+            chunk_size (int): Number of rows per chunk.
+            file_hash (str): The hash of the file, if it was already computed, to find its staged version.
+            
+        Yields:
+            DataFrame: The next chunk of rows.
+            
+        Raises:
+            ValueError: If the file extension is neither CSV nor Excel.
+        """
+        return self._iter_chunks(file_directory, self.csv_sep, self.csv_codec, limit, chunk_size, self.staging,
+                                 file_hash)
+
+    @staticmethod
+    def _iter_chunks(file_directory: str, csv_sep: str, csv_codec: str, limit: int, chunk_size: int,
+                     staging: ParquetStaging = None, file_hash: str = None):
+        file_extension = os.path.splitext(file_directory)[1]
+        nrows = limit if limit and limit > 0 else None
+        # Staged datafile
+        if staging is not None:
+            yield from staging.iter_chunks(file_directory, chunk_size, nrows, file_hash=file_hash)
+        # CSV datafile
+        elif file_extension == ".csv":
+            with pd.read_csv(file_directory, sep= csv_sep, nrows=nrows, encoding= csv_codec, 
+                             chunksize=chunk_size) as reader:
+                for chunk in reader:
+                    yield chunk
+        # Excel datafile, it can not be read in chunks
+        elif file_extension == ".xlsx":
+            df = pd.read_excel(file_directory, nrows=nrows)
+            for i in range(0, len(df), chunk_size):
+                yield df.iloc[i:i+chunk_size]
+        else:
+            raise ValueError("The selected file type is not supported")
+
     def dataframe_to_json_batches(self, df, batch_size=50, limit=0):
         """
         Converts a pandas DataFrame to JSON format in batches of a given size.
@@ -76,138 +147,110 @@ class PrepareVectorDBFromTabularData:
 
         for i in range(0, num_rows, batch_size):
             batch = df.iloc[i:i+batch_size]
-            json_batches+=[eval(batch.to_json(orient='records'))]
+            json_batches.append(batch.to_dict(orient='records'))
         
         return json_batches
 
-    def _generate_embeddings_from_json(self, json_data:list, file_name:str, file_description: str):
+    def _dataframe_to_docs(self, df: pd.DataFrame, file_name: str, file_description: str, max_rows: int,
+                           keys: pd.Series, group_by: list = None, batch_offset: int = 0, metadata_columns: dict = None):
         """
-        Generate embeddings, one per json row, and prepare documents for data ingestion. 
+        Prepare the documents for data ingestion, packing the rows into chunks with the tabular chunker.
+
+        The chunks never mix rows of different partitions or groups, every document stores its partition key
+        and the provinces and the ranges of years and months of its rows.
         
         Args:
-            df (pd.DataFrame): The DataFrame containing the data to be processed.
+            df (pd.DataFrame): The rows to process.
             file_name (str): The base name of the file for use in metadata.
+            file_description (str): The description of the file content.
+            max_rows (int): Maximum number of rows per document, None to only limit by size.
+            keys (pd.Series): The partition key of every row.
+            group_by (list): The columns that group the rows of a chunk, e.g. ['PROVINCIA_DESTINO', 'AÑO'].
+            batch_offset (int): The number of the first batch, when the rows are a chunk of the file.
+            metadata_columns (dict): The columns of the 'province', 'year' and 'month' of the rows, 
+                                     e.g. {'province': 'PROVINCIA_DESTINO', 'year': 'AÑO', 'month': 'MES'}.
             
         Returns:
-            list, list, list, list: Lists containing documents, metadatas, ids, and embeddings respectively.
-        """
-        self.docs = []
-        self.metadatas = []
-        self.ids = []
-        self.embeddings = []
-
-        for i, batch in enumerate(json_data):
-            #output_str = ""
-            # Treat each row as a separate chunk
-            for j,row in enumerate(batch):
-                #output_str += f"{col}: {row[col]},\n"
-                # Add the file description as a new json value in the row
-                row["description"]= file_description
-
-                if j==0:
-                    print(row)
-
-                response = self.embeddings_model.embed_query(
-                    str(row),
-                )
-
-                self.embeddings.append(response)
-                self.docs.append(str(row))
-                self.metadatas.append({"source": file_name, "description": file_description, "batch": i})
-                self.ids.append(i*100+j)
-            
-        return self.docs, self.metadatas, self.ids, self.embeddings
+            list, list, list: Lists containing documents, metadatas and ids respectively.
+        """
+        return self._chunk_docs(self.chunker, df, file_name, file_description, max_rows, keys, group_by, batch_offset,
+                                metadata_columns)
+
+    @staticmethod
+    def _chunk_docs(chunker: TabularChunker, df: pd.DataFrame, file_name: str, file_description: str, max_rows: int,
+                    keys: pd.Series, group_by: list = None, batch_offset: int = 0, metadata_columns: dict = None):
+        group_keys = keys
+        if group_by:
+            group_keys = keys.str.cat(IngestManifest.partition_keys(df, group_by), sep='|')
+        docs, first_rows, row_docs = chunker.chunk(df, group_keys, file_description, max_rows)
+
+        batches = list(range(batch_offset, batch_offset + len(docs)))
+        metadatas = [{"source": file_name, "description": file_description, "batch": batch, "partition": key, **fields}
+                     for batch, key, fields in zip(batches, keys.values[first_rows], 
+                                                   PrepareVectorDBFromTabularData._chunk_metadata(df, row_docs, len(docs),
+                                                                                                  metadata_columns))]
 
-    def _generate_batches_embeddings_from_json(self, json_data:list, file_name:str, file_description: str):
+        return docs, metadatas, batches
+
+    @staticmethod
+    def _chunk_metadata(df: pd.DataFrame, row_docs, num_docs: int, metadata_columns: dict = None) -> list:
         """
-        Generate embeddings, one per batch of json rows, and prepare documents in batches for data ingestion.
-        
-        Args:
-            df (pd.DataFrame): The DataFrame containing the data to be processed.
-            file_name (str): The base name of the file for use in metadata.
-            
-        Returns:
-            list, list, list, list: Lists containing documents, metadatas, ids, and embeddings respectively.
-        """
-        self.docs = []
-        self.metadatas = []
-        self.ids = []
-        self.embeddings = []
-
-        for i, batch in enumerate(json_data):
-            #output_str = ""
-            # Create a single json string from a list of json objects
-            output_str = '"Content Description": "'+file_description+'",'+ ','.join([str(json.dumps(row, ensure_ascii=False).encode('latin-1')) for row in batch])
-            #output_str = ','.join([str(json.dumps(row, ensure_ascii=False).encode('latin-1')) for row in batch])
-            #print(type(output_str))
-
-            response = self.embeddings_model.embed_query(
-                    str(output_str),
-            )
-            #response= "Test"
-            self.embeddings.append(response)
-            self.docs.append(str(output_str))
-            self.metadatas.append({"source": file_name, "description": file_description, "batch": i})
-            self.ids.append(i)
-            
-        return self.docs, self.metadatas, self.ids, self.embeddings
+        Compute the scalar fields of every chunk document: its provinces, joined with '|', and the minimum 
+        and maximum year and month of its rows. The fields of the missing columns are left empty.
+        """
+        if num_docs == 0:
+            return []
+        metadata_columns = metadata_columns or {}
+        metadata = {}
+        province = metadata_columns.get("province")
+        if province in df.columns:
+            unique = pd.DataFrame({"doc": row_docs, "value": df[province].astype(str).values}).drop_duplicates()
+            metadata["province"] = unique.groupby("doc")["value"].agg("|".join).reindex(range(num_docs), fill_value="")
+        for name in ("year", "month"):
+            column = metadata_columns.get(name)
+            if column in df.columns:
+                ranges = pd.to_numeric(df[column], errors="coerce").groupby(row_docs).agg(["min", "max"])
+                ranges = ranges.reindex(range(num_docs)).fillna(0).astype("int64")
+                metadata[f"{name}_min"] = ranges["min"]
+                metadata[f"{name}_max"] = ranges["max"]
+        if not metadata:
+            return [{} for _ in range(num_docs)]
+
+        return pd.DataFrame(metadata, index=range(num_docs)).to_dict(orient="records")
 
-    def _generate_embeddings(self, df:pd.DataFrame, file_name:str):
+    @staticmethod
+    def _serialize_datafile(chunker: TabularChunker, file_path: str, file_name: str, file_description: str,
+                            csv_sep: str, csv_codec: str, limit: int, chunk_size: int, max_rows: int,
+                            group_by: list = None, staging: ParquetStaging = None, sort_by: list = None,
+                            metadata_columns: dict = None, partition_by: list = None):
         """
-        Generate embeddings from a pandas dataframe and prepare documents for data injection.
-        
-        Args:
-            df (pd.DataFrame): The DataFrame containing the data to be processed.
-            file_name (str): The base name of the file for use in metadata.
-            
-        Returns:
-            list, list, list, list: Lists containing documents, metadatas, ids, and embeddings respectively.
-        """
-        self.docs = []
-        self.metadatas = []
-        self.ids = []
-        self.embeddings = []
-        for index, row in df.iterrows():
-            output_str = ""
-            # Treat each row as a separate chunk
-            for col in df.columns:
-                output_str += f"{col}: {row[col]},\n"
-            response = self.embeddings_model.embed_query(
-                output_str,
-            )
-
-            self.embeddings.append(response)
-            self.docs.append(output_str)
-            self.metadatas.append({"source": file_name})
-            self.ids.append(f"id{index}")
-            
-        return self.docs, self.metadatas, self.ids, self.embeddings
+        Read a datafile in chunks and serialize its rows into chunk documents, the worker of the parallel load.
+
+        Yields:
+            dict: The documents, metadatas and ids of the next chunk of rows, and its number of rows.
+        """
+        batches = 0
+        source = PrepareVectorDBFromTabularData._iter_chunks(file_path, csv_sep, csv_codec, limit, chunk_size, staging)
+        if sort_by:
+            source = ChunkSorter(sort_by, chunk_size).sort(source)
+        for df in source:
+            keys = IngestManifest.partition_keys(df, partition_by)
+            docs, metadatas, ids = PrepareVectorDBFromTabularData._chunk_docs(chunker, df, file_name, file_description,
+                                                                              max_rows, keys, group_by, batches,
+                                                                              metadata_columns)
+            batches += len(docs)
+            yield {"docs": docs, "metadatas": metadatas, "ids": ids, "rows": len(df)}
 
-    def _load_data_into_vectordb(self, batch_size:int, collection_name:str):
+    def _load_data_into_vectordb(self, collection_name:str):
         """
         Inject the prepared data into the Vector DB.
         
-        Raises an error if the collection_name already exists in vector DB
+        Every document is inserted, in concurrent batches sized by payload bytes.
         The method prints a confirmation message upon successful data injection.
         """
-        # insert data with customized ids
-        batches = len(self.docs)//batch_size
-        print("Batches: ", batches)
-        start = 0           # first primary key id
-        total_rt = 0        # total response time for inert
-
-        print(f"inserting {batch_size*batches} entities into example collection: {collection_name}")
-        for _ in range(batches):
-            rows = [{"batch": self.metadatas[i]["batch"], "source": self.metadatas[i]["source"], 
-                     "description": self.metadatas[i]["description"], 
-                     "row": self.docs[i], "row_embedding": self.embeddings[i]} #"row_id": self.ids[i]} 
-                    for i in range(start, start+batch_size)]
-            t0 = time.time()
-            self.vectordb.milvus_client.insert(collection_name, rows)
-            ins_rt = time.time() - t0
-            start += batch_size
-            total_rt += ins_rt
-        print(f"Succeed in {round(total_rt,4)} seconds!")
+        print(f"inserting {len(self.docs)} entities into collection: {collection_name}")
+        self._insert_chunk_into_vectordb({"docs": self.docs, "metadatas": self.metadatas, "embeddings": self.embeddings},
+                                         collection_name)
         print("Data stored in Vector DB.")
 
     def _validate_db(self):
@@ -220,47 +263,232 @@ class PrepareVectorDBFromTabularData:
         print("Number of vectors in vectordb:", vectordb.count())
         print("==============================")
 
+    def _insert_chunk_into_vectordb(self, chunk: dict, collection_name: str):
+        """
+        Insert the documents and embeddings of a single chunk of the file into the Vector DB.
+        """
+        truncate = self.vectordb.truncate
+        metadatas = chunk["metadatas"]
+        columns = {"batch": [metadata["batch"] for metadata in metadatas],
+                   "source": [truncate(metadata["source"], self.vectordb.SOURCE_MAX_LENGTH) for metadata in metadatas],
+                   "description": [truncate(metadata["description"], self.vectordb.DESCRIPTION_MAX_LENGTH) 
+                                   for metadata in metadatas],
+                   "partition": [truncate(metadata.get("partition", ""), self.vectordb.PARTITION_MAX_LENGTH) 
+                                 for metadata in metadatas],
+                   "province": [truncate(metadata.get("province", ""), self.vectordb.PROVINCE_MAX_LENGTH)
+                                for metadata in metadatas],
+                   **{field: [metadata.get(field, 0) for metadata in metadatas] for field in self.vectordb.RANGE_FIELDS},
+                   "row": chunk["docs"],
+                   "row_embedding": chunk["embeddings"]}
+        self.vectordb.insert(collection_name, columns)
+
+        return len(chunk["docs"])
+
     def load_datafile(self, datafile_name: str, datafile_description:str, limit: int=100, batch_size: int=25,
-                      chunk_mode: str='batch'):
+                      chunk_mode: str='batch', chunk_size: int=5000, queue_size: int=2,
+                      partition_by: list=None, partitions: set=None, group_by: list=None, sort_by: list=None,
+                      metadata_columns: dict=None, file_hash: str=None):
+        """
+        Load a datafile into the Vector DB with a streaming pipeline: read chunk -> serialize -> embed -> insert.
+
+        Every stage runs in its own thread connected by bounded queues, so the memory stays flat no matter
+        the size of the file and the inserts into Milvus overlap with the embedding of the next chunks.
+        When partition_by is set, the batches never mix rows of different partitions and every document
+        stores the key of its partition, so a partition can be replaced without touching the others.
+        The rows are packed into chunks that never exceed the size of the row field and the token budget.
+        The rows of the whole file are sorted by the sort_by columns before they are packed, with an external
+        merge sort that spills sorted runs to disk, so the documents hold consecutive rows (e.g. the months of
+        a province), and every document stores its provinces and its ranges of years and months as scalar
+        fields that the searches can filter by.
 
-        df, file_name= self._load_dataframe(os.path.join(self.file_directory,datafile_name), limit)
-        print("File readed:", file_name)
+        Args:
+            datafile_name (str): The name of the file in the data directory.
+            datafile_description (str): The description of the file content.
+            limit (int): Maximum number of rows to load, 0 to load the whole file.
+            batch_size (int): Number of rows per document in batch mode.
+            chunk_mode (str): 'row' to create a document per row, 'batch' to create a document per batch of up to
+                              batch_size rows or 'adaptive' to pack as many rows as fit the size budget.
+            chunk_size (int): Number of rows read from the file at once, rounded to a multiple of batch_size.
+            queue_size (int): Maximum number of chunks waiting between two stages.
+            partition_by (list): The columns that define the partitions of rows, e.g. ['AÑO', 'MES'].
+            partitions (set): If set, only the rows of these partition keys are loaded.
+            group_by (list): The columns that group the rows of a chunk, e.g. ['PROVINCIA_DESTINO', 'AÑO'].
+            sort_by (list): The columns that sort the rows before chunking, e.g. ['PROVINCIA_DESTINO', 'AÑO', 'MES'].
+            metadata_columns (dict): The columns of the 'province', 'year' and 'month' of the rows.
+            file_hash (str): The hash of the file, if it was already computed.
+        """
+        file_name = os.path.splitext(os.path.basename(datafile_name))[0]
+        print("File reading:", file_name)
         print("File description:", datafile_description) 
-        json_data= self.dataframe_to_json_batches(df, batch_size, limit)
+        chunk_size, max_rows = self._chunk_params(batch_size, chunk_mode, chunk_size)
+        stats = {"rows": 0, "docs": 0, "batches": 0}
 
-        # Generate embeddings from the json data
-        if chunk_mode=='row':
-            docs, metadata, ids, embeddings= self._generate_embeddings_from_json(json_data, file_name, datafile_description)
-        else:
-            docs, metadata, ids, embeddings= self._generate_batches_embeddings_from_json(json_data, file_name, datafile_description)
+        def serialize(df):
+            keys = IngestManifest.partition_keys(df, partition_by)
+            if partitions is not None:
+                df, keys = df[keys.isin(partitions)], keys[keys.isin(partitions)]
+            docs, metadatas, ids = self._dataframe_to_docs(df, file_name, datafile_description, max_rows,
+                                                           keys, group_by, stats["batches"], metadata_columns)
+            stats["batches"] += len(docs)
+            stats["rows"] += len(df)
+            return {"docs": docs, "metadatas": metadatas, "ids": ids}
 
-        print("Docs readed: ",len(docs))
-        print("Metadata readed: ", len(metadata))
-        print("Embeddings created: ", len(embeddings))
-        print("Docs: ", docs[0])
-        #print("Metadata: ", metadata[0])
-        #print("Embeddings: ", embeddings[0])
-        #print(eval(json_data[0]))
-        #print(type(eval(json_data[0])))
-        #print(type(json_data[0]))
-        #print(len(json_data))
-        self._load_data_into_vectordb(5, self.collection_name)
-
-    def load_data(self, datafiles: list, limit: int, batch_size: int, chunk_mode: str='batch'):
+        source = self._iter_dataframe(os.path.join(self.file_directory,datafile_name), limit, chunk_size, file_hash)
+        if sort_by:
+            source = ChunkSorter(sort_by, chunk_size).sort(source)
+        self._embed_and_insert(source, stats, [("serialize", serialize)], queue_size)
+
+    @staticmethod
+    def _chunk_params(batch_size: int, chunk_mode: str, chunk_size: int) -> tuple:
+        """
+        Return the number of rows read at once, rounded to whole batches so the batches are not split
+        between chunks, and the maximum number of rows per document of the chunk mode.
+        """
+        chunk_size = max(batch_size, chunk_size - chunk_size % batch_size)
+        max_rows = {"row": 1, "adaptive": None}.get(chunk_mode, batch_size)
+        return chunk_size, max_rows
+
+    def _embed_and_insert(self, source, stats: dict, stages: list = None, queue_size: int = 2):
+        """
+        Run the streaming pipeline over the chunks of a file: the given stages (e.g. serialize), then embed and insert.
+        """
+        def embed(chunk):
+            chunk["embeddings"] = self.embedding_engine.embed_array(chunk["docs"])
+            return chunk
+
+        def insert(chunk):
+            stats["docs"] += self._insert_chunk_into_vectordb(chunk, self.collection_name)
+
+        pipeline = StreamingPipeline((stages or []) + [("embed", embed), ("insert", insert)], queue_size)
+        self.vectordb.reset_insert_stats()
+        t0 = time.time()
+        stages = pipeline.run(source)
+        self.vectordb.flush(self.collection_name)
+
+        print("Rows readed: ", stats["rows"])
+        print("Docs stored: ", stats["docs"])
+        for stage, stage_stats in stages.items():
+            print(f"Stage {stage}: {stage_stats['items']} chunks in {round(stage_stats['seconds'],4)} seconds")
+        print("Insert stats: ", self.vectordb.insert_summary())
+        if self.embedding_engine.cache is not None:
+            print("Embedding cache stats: ", self.embedding_engine.cache.stats())
+        print(f"File loaded in {round(time.time()-t0,4)} seconds")
+
+    def load_data(self, datafiles: list, limit: int, batch_size: int, chunk_mode: str='batch', chunk_size: int=5000):
+        """
+        Load the datafiles into the Vector DB. With several workers, the files are read and serialized in
+        parallel processes and the main process embeds and inserts the documents of every file as it is ready,
+        streaming them back from the spill file of the worker.
+        """
+        # A full load is not tracked by the manifest, the next sync will reload every file
+        self.manifest.reset()
+        if not self.scheduler.is_parallel(len(datafiles)):
+            for datafile in datafiles:
+                print(datafile)
+                self.load_datafile(datafile["filename"], datafile["description"], limit, batch_size, chunk_mode, 
+                                   chunk_size, partition_by=datafile.get("partition_by"),
+                                   group_by=datafile.get("group_by"), sort_by=datafile.get("sort_by"),
+                                   metadata_columns=datafile.get("metadata_columns"))
+            print("Data loaded into Vector DB.")
+            return
+
+        chunk_size, max_rows = self._chunk_params(batch_size, chunk_mode, chunk_size)
+        tasks = [(datafile["filename"], (self.chunker, os.path.join(self.file_directory, datafile["filename"]),
+                                         os.path.splitext(os.path.basename(datafile["filename"]))[0],
+                                         datafile["description"], self.csv_sep, self.csv_codec, limit, chunk_size,
+                                         max_rows, datafile.get("group_by"), self.staging, datafile.get("sort_by"),
+                                         datafile.get("metadata_columns"), datafile.get("partition_by")))
+                 for datafile in datafiles]
+
+        def write(datafile_name, chunks):
+            print("File writing:", datafile_name)
+            stats = {"rows": 0, "docs": 0}
+
+            def count(chunk):
+                stats["rows"] += chunk["rows"]
+                return chunk
+
+            self._embed_and_insert(chunks, stats, [("count", count)])
+
+        # A single writer embeds and inserts into the collection
+        self.scheduler.run(tasks, PrepareVectorDBFromTabularData._serialize_datafile, write)
+        print("Data loaded into Vector DB.")
+
+    def sync_datafile(self, datafile_name: str, datafile_description:str, batch_size: int=25,
+                      chunk_mode: str='batch', chunk_size: int=5000, partition_by: list=None, group_by: list=None,
+                      sort_by: list=None, metadata_columns: dict=None):
+        """
+        Incrementally sync a datafile with the Vector DB.
+
+        The file is compared with the manifest of the collection: an unchanged file is skipped and, 
+        otherwise, only the partitions of rows that are new or changed are deleted and loaded again.
+        The whole file is synced, there is no row limit.
+
+        Args:
+            datafile_name (str): The name of the file in the data directory.
+            datafile_description (str): The description of the file content.
+            batch_size (int): Number of rows per document in batch mode.
+            chunk_mode (str): 'row', 'batch' or 'adaptive', see load_datafile.
+            chunk_size (int): Number of rows read from the file at once.
+            partition_by (list): The columns that define the partitions of rows, e.g. ['AÑO', 'MES'].
+            group_by (list): The columns that group the rows of a chunk, e.g. ['PROVINCIA_DESTINO', 'AÑO'].
+            sort_by (list): The columns that sort the rows before chunking.
+            metadata_columns (dict): The columns of the 'province', 'year' and 'month' of the rows.
+        """
+        file_path = os.path.join(self.file_directory, datafile_name)
+        file_name = os.path.splitext(os.path.basename(datafile_name))[0]
+        t0 = time.time()
+        file_hash = IngestManifest.file_fingerprint(file_path)
+        config = IngestManifest.config_fingerprint(description=datafile_description, batch_size=batch_size, 
+                                                   chunk_mode=chunk_mode, partition_by=partition_by,
+                                                   row_template=self.serializer.template, group_by=group_by,
+                                                   max_bytes=self.chunker.max_bytes, max_tokens=self.chunker.max_tokens,
+                                                   sort_by=sort_by, metadata_columns=metadata_columns)
+        entry = self.manifest.get(datafile_name)
+        if entry and entry["file_hash"] == file_hash and entry["config"] == config:
+            print(f"File {datafile_name} is unchanged, skipped")
+            return
+
+        partitions = IngestManifest.partition_fingerprints(self._iter_dataframe(file_path, 0, chunk_size, file_hash),
+                                                           partition_by)
+        changed, deleted = self.manifest.diff(datafile_name, config, partitions)
+        print(f"File {datafile_name}: {len(changed)} partitions to load, {len(deleted)} partitions to delete")
+        if entry is None:
+            # Remove any document of the file loaded without a manifest
+            self.vectordb.delete_source(self.collection_name, file_name)
+        elif deleted:
+            self.vectordb.delete_partitions(self.collection_name, file_name, deleted)
+        if changed:
+            self.load_datafile(datafile_name, datafile_description, 0, batch_size, chunk_mode, chunk_size,
+                               partition_by=partition_by, partitions=set(changed), group_by=group_by, sort_by=sort_by,
+                               metadata_columns=metadata_columns, file_hash=file_hash)
+        elif deleted or entry is None:
+            self.vectordb.flush(self.collection_name)
+
+        self.manifest.update(datafile_name, file_hash, config, partitions, changed=bool(changed or deleted))
+        print(f"File {datafile_name} synced in {round(time.time()-t0,4)} seconds")
+
+    def sync_data(self, datafiles: list, batch_size: int, chunk_mode: str='batch', chunk_size: int=5000):
+        """
+        Incrementally sync the datafiles with the Vector DB, using the `partition_by`, `group_by`, `sort_by` and 
+        `metadata_columns` of every datafile.
+        """
         for datafile in datafiles:
             print(datafile)
-            self.load_datafile(datafile["filename"], datafile["description"], limit, batch_size, chunk_mode)
-            
-        print("Data loaded into Vector DB.")
+            self.sync_datafile(datafile["filename"], datafile["description"], batch_size, chunk_mode, chunk_size,
+                               datafile.get("partition_by"), datafile.get("group_by"), datafile.get("sort_by"),
+                               datafile.get("metadata_columns"))
+
+        print("Data synced into Vector DB.")
     
     def test_load(self,):
         df, file_name= self._load_dataframe(os.path.join('data','destino_prov_mes.csv'), 100)
-        json_data= self.dataframe_to_json_batches(df, 25, 100)
+        keys = IngestManifest.partition_keys(df, None)
 
-        docs, metadata, ids, embeddings= self._generate_batches_embeddings_from_json(json_data, file_name, 'gasto medio por visitante y tipo de origen')
+        docs, metadata, ids= self._dataframe_to_docs(df, file_name, 'gasto medio por visitante y tipo de origen', 25, keys,
+                                                     ['PROVINCIA_DESTINO', 'AÑO'])
         print("Docs readed: ",len(docs))
         print("Metadata readed: ", len(metadata))
         print("Docs: ", docs[0])
         print("Metadata: ", metadata[0])
         print("Ids: ", ids)
-        
\ No newline at end of file
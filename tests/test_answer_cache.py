@@ -0,0 +1,75 @@
+import numpy as np
+
+from src import AnswerCache as answer_cache_module
+from src.AnswerCache import AnswerCache
+from src.IngestManifest import IngestManifest
+
+def embedding(*values) -> np.ndarray:
+    return np.array(values, dtype=np.float32)
+
+def test_an_exact_hit_matches_the_normalized_question():
+    cache = AnswerCache()
+    cache.put("¿Cuántos turistas visitaron Cádiz?", embedding(1, 0, 0), "10")
+
+    assert cache.get("cuantos  turistas visitaron cadiz") == "10"
+    assert cache.get("cuantos turistas visitaron Soria") is None
+    assert cache.stats == {"exact_hits": 1, "semantic_hits": 0, "misses": 1}
+
+def test_a_semantic_hit_reuses_the_answer_of_a_similar_question():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.put("Turistas en Cádiz en 2019", embedding(1, 0, 0), "10")
+
+    assert cache.get("Numero de turistas en Cadiz el año 2019", embedding(0.99, 0.1, 0)) == "10"
+    assert cache.get("Viviendas turisticas en Soria 2019", embedding(0, 1, 0)) is None
+    assert cache.stats == {"exact_hits": 0, "semantic_hits": 1, "misses": 1}
+
+def test_a_similar_question_with_other_numbers_is_a_miss():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.put("Turistas en Cádiz en 2019", embedding(1, 0, 0), "10")
+
+    assert cache.get("Turistas en Cádiz en 2020", embedding(1, 0, 0)) is None
+    assert cache.get("Turistas en Cádiz", embedding(1, 0, 0)) is None
+
+def test_the_answers_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache_module.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    cache.put("Turistas en Cádiz", embedding(1, 0, 0), "10")
+
+    now[0] += 59
+    assert cache.get("Turistas en Cádiz") == "10"
+    now[0] += 2
+    assert cache.get("Turistas en Cádiz", embedding(1, 0, 0)) is None
+    assert not cache.entries
+
+def test_the_least_recently_used_answer_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put("Turistas en Cádiz", embedding(1, 0, 0), "1")
+    cache.put("Turistas en Soria", embedding(0, 1, 0), "2")
+    # Reading Cádiz makes Soria the least recently used
+    assert cache.get("Turistas en Cádiz") == "1"
+    cache.put("Turistas en Teruel", embedding(0, 0, 1), "3")
+
+    assert cache.get("Turistas en Soria") is None
+    assert cache.get("Turistas en Cádiz") == "1"
+    assert cache.get("Turistas en Teruel") == "3"
+
+def test_a_new_generation_clears_the_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestManifest(path, "turismo")
+    manifest.save()
+    reads = []
+    read_generation = IngestManifest.read_generation
+    monkeypatch.setattr(IngestManifest, "read_generation",
+                        staticmethod(lambda *args: reads.append(args) or read_generation(*args)))
+    cache = AnswerCache(generation=IngestManifest.generation_reader(path, "turismo"))
+    cache.put("Turistas en Cádiz", embedding(1, 0, 0), "10")
+
+    assert cache.get("Turistas en Cádiz") == "10"
+    assert cache.get("Turistas en Cádiz") == "10"
+    # The manifest is only read when it changes
+    assert len(reads) == 1
+
+    manifest.reset()
+    assert cache.get("Turistas en Cádiz") is None
+    assert len(reads) == 2
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ChunkSorter import ChunkSorter
+
+def chunks_of(df: pd.DataFrame, size: int):
+    for i in range(0, len(df), size):
+        yield df.iloc[i:i+size]
+
+@pytest.mark.parametrize("run_rows, block_size", [(1000, 100), (37, 5), (10, 3)])
+def test_the_whole_stream_is_sorted(tmp_path, run_rows, block_size):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"PROVINCIA": rng.choice(["Álava", "Cádiz", "Lugo", "Soria"], 500),
+                       "AÑO": rng.integers(2019, 2024, 500), "MES": rng.integers(1, 13, 500).astype(float),
+                       "VALOR": np.arange(500)})
+    df.loc[::50, "MES"] = np.nan
+    sorter = ChunkSorter(["PROVINCIA", "AÑO", "MES"], 40, run_rows, block_size, str(tmp_path))
+
+    chunks = list(sorter.sort(chunks_of(df, 25)))
+
+    assert [len(chunk) for chunk in chunks] == [40] * 12 + [20]
+    result = pd.concat(chunks)
+    expected = df.sort_values(["PROVINCIA", "AÑO", "MES"], kind="stable")
+    assert list(result.index) == list(range(500))
+    assert result[["PROVINCIA", "AÑO", "MES"]].reset_index(drop=True).equals(
+        expected[["PROVINCIA", "AÑO", "MES"]].reset_index(drop=True))
+    assert sorted(result["VALOR"]) == list(range(500))
+    assert os.listdir(tmp_path) == []
+
+def test_an_empty_stream_yields_nothing(tmp_path):
+    assert list(ChunkSorter(["AÑO"], 10, spill_dir=str(tmp_path)).sort(iter([]))) == []
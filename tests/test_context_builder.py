@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ContextBuilder import ContextBuilder
+from src.RowSerializer import RowSerializer
+
+class WordCounter:
+    """
+    Counts the words of a text, so the budgets of the tests do not depend on the tokenizer.
+    """
+    def count_many(self, texts: list) -> list:
+        return [len(text.split()) for text in texts]
+
+def builder(max_tokens: int) -> ContextBuilder:
+    context_builder = ContextBuilder(max_tokens)
+    context_builder.token_counter = WordCounter()
+    return context_builder
+
+def documents(template: str, provinces: list, description: str = "Gasto de los turistas") -> list:
+    df = pd.DataFrame({"AÑO": 2023, "PROVINCIA": provinces, "GASTO": np.arange(len(provinces)) * 100.5})
+    chunks, _ = RowSerializer(template).serialize_chunks(df, np.arange(len(df)), description)
+    return chunks
+
+@pytest.mark.parametrize("template", RowSerializer.TEMPLATES)
+def test_rows_are_written_as_a_single_table(template):
+    context = builder(1000).build(documents(template, ["Madrid", "Cádiz"]))
+
+    assert context == ("Content Description: Gasto de los turistas\nAÑO | PROVINCIA | GASTO\n"
+                       "2023 | Madrid | 0.0\n2023 | Cádiz | 100.5")
+
+def test_repeated_rows_are_kept_once():
+    context_builder = builder(1000)
+    context = context_builder.build(documents("json", ["Madrid", "Cádiz"]) + documents("kv", ["Madrid", "Cádiz", "Soria"]))
+
+    assert context.splitlines()[2:] == ["2023 | Madrid | 0.0", "2023 | Cádiz | 100.5", "2023 | Soria | 201.0"]
+    assert context_builder.last_stats["rows"] == 3
+    assert context_builder.last_stats["selected_rows"] == 3
+
+def test_tables_and_rows_keep_the_order_of_the_documents():
+    context = builder(1000).build(documents("json", ["Soria"], "Viajeros") + ["Texto libre"]
+                                  + documents("json", ["Cádiz", "Madrid"]) + documents("json", ["Teruel"], "Viajeros"))
+
+    assert context == ("Content Description: Viajeros\nAÑO | PROVINCIA | GASTO\n2023 | Soria | 0.0\n"
+                       "2023 | Teruel | 0.0\n\nTexto libre\n\n"
+                       "Content Description: Gasto de los turistas\nAÑO | PROVINCIA | GASTO\n"
+                       "2023 | Cádiz | 0.0\n2023 | Madrid | 100.5")
+
+def test_rows_beyond_the_token_budget_are_left_out():
+    # The header costs 11 words and every row 5, the best ranked rows are kept first
+    context_builder = builder(11 + 5 * 2 + 4)
+    context = context_builder.build(documents("markdown", ["Madrid", "Cádiz", "Soria", "Teruel"]))
+
+    assert context.splitlines()[2:] == ["2023 | Madrid | 0.0", "2023 | Cádiz | 100.5"]
+    assert context_builder.last_stats["context_tokens"] == 21
+    assert context_builder.last_stats["selected_rows"] == 2
+
+def test_a_smaller_row_can_fill_the_rest_of_the_budget():
+    context = builder(11 + 5 + 1).build(documents("json", ["Madrid", "Ciudad Real"]) + ["Otro"])
+
+    assert context.endswith("2023 | Madrid | 0.0\n\nOtro")
+
+def test_nothing_fits_a_budget_smaller_than_the_header():
+    assert builder(15).build(documents("json", ["Madrid"])) == ""
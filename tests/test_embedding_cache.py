@@ -0,0 +1,62 @@
+import sqlite3
+import numpy as np
+
+from src import EmbeddingCache as embedding_cache_module
+from src.EmbeddingCache import EmbeddingCache
+
+def test_hits_and_misses_return_float32_arrays(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), "model", 3)
+    cache.put_many(["Cádiz", "Soria"], [[0.1, 0.2, 0.3], np.array([1, 2, 3], dtype=np.float64)])
+
+    embeddings = cache.get_many(["Soria", "Teruel", "Cádiz"])
+
+    assert embeddings[1] is None
+    assert all(isinstance(embedding, np.ndarray) and embedding.dtype == np.float32
+               for embedding in (embeddings[0], embeddings[2]))
+    assert np.array_equal(embeddings[0], [1, 2, 3])
+    assert np.allclose(embeddings[2], [0.1, 0.2, 0.3])
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_rate": 0.6667, "entries": 2, "bytes": 24}
+
+def test_the_key_depends_on_the_model_and_the_dimension(tmp_path):
+    path = str(tmp_path / "cache.db")
+    EmbeddingCache(path, "model", 3).put("Cádiz", [0.1, 0.2, 0.3])
+
+    assert EmbeddingCache(path, "other", 3).get("Cádiz") is None
+    assert EmbeddingCache(path, "model", 4).get("Cádiz") is None
+
+def test_the_least_recently_accessed_embeddings_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache_module.time, "time", lambda: now[0])
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), "model", 2, max_entries=2)
+    cache.put("Cádiz", [1, 0])
+    now[0] += 1
+    cache.put("Soria", [0, 1])
+    now[0] += 1
+    # Reading Cádiz updates its last access, Soria is evicted
+    assert cache.get("Cádiz") is not None
+    now[0] += 1
+    cache.put("Teruel", [1, 1])
+
+    assert cache.get("Soria") is None
+    assert cache.get("Cádiz") is not None
+    assert cache.get("Teruel") is not None
+
+def test_the_byte_cap_limits_the_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), "model", 4, max_bytes=2 * 4 * 4)
+    cache.put_many(["a", "b", "c"], [[1, 0, 0, 0]] * 3)
+
+    assert cache.stats()["entries"] == 2
+
+def test_the_cache_is_reopened_in_wal_mode(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(path, "model", 2)
+    cache.put("Cádiz", [0.5, 0.25])
+    cache.conn.close()
+
+    reopened = EmbeddingCache(path, "model", 2)
+
+    assert reopened.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert np.array_equal(reopened.get("Cádiz"), [0.5, 0.25])
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,100 @@
+import pickle
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.EmbeddingCache import EmbeddingCache
+from src.EmbeddingEngine import EmbeddingEngine
+from src.TokenCounter import TokenCounter
+
+class WordCounter:
+    """
+    Counts the words of a text, so the budgets of the tests do not depend on the tokenizer.
+    """
+    def count_many(self, texts: list) -> list:
+        return [len(text.split()) for text in texts]
+
+class StubEmbeddings:
+    """
+    Embeds a text as [number of the text, words], the first batches are the slowest so they finish last.
+    """
+    def __init__(self, failures: int = 0) -> None:
+        self.batches = []
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts: list) -> list:
+        with self.lock:
+            self.batches.append(list(texts))
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("Rate limit")
+        time.sleep(0.05 / (int(texts[0].split()[0]) + 1))
+        return [[float(text.split()[0]), float(len(text.split()))] for text in texts]
+
+def engine(embeddings, **kwargs) -> EmbeddingEngine:
+    embedding_engine = EmbeddingEngine(embeddings, **kwargs)
+    embedding_engine.token_counter = WordCounter()
+    return embedding_engine
+
+TEXTS = [f"{i} " + "palabra " * (i % 4) for i in range(10)]
+
+def test_batches_fit_the_token_budget_and_the_batch_size():
+    embedding_engine = engine(StubEmbeddings(), max_batch_tokens=6, max_batch_size=3)
+
+    batches = embedding_engine._make_batches(TEXTS)
+
+    # Texts of 1, 2, 3, 4, 1, 2, 3, 4, 1 and 2 words
+    assert batches == [(0, 3), (3, 5), (5, 7), (7, 9), (9, 10)]
+    counts = WordCounter().count_many(TEXTS)
+    assert all(sum(counts[start:end]) <= 6 and end - start <= 3 for start, end in batches)
+
+def test_a_text_over_the_budget_is_sent_alone():
+    assert engine(StubEmbeddings(), max_batch_tokens=2)._make_batches(["a", "b c d e", "f"]) == [(0, 1), (1, 2), (2, 3)]
+
+def test_embeddings_keep_the_order_of_the_texts_across_concurrent_batches():
+    embeddings = StubEmbeddings()
+    embedding_engine = engine(embeddings, max_batch_tokens=6, max_batch_size=3, max_workers=4)
+
+    result = embedding_engine.embed(TEXTS)
+
+    assert result == [[float(i), float(1 + i % 4)] for i in range(10)]
+    assert sorted(len(batch) for batch in embeddings.batches) == [1, 2, 2, 2, 3]
+    assert embedding_engine.embed_array(TEXTS).dtype == np.float32
+
+def test_failed_batches_are_retried():
+    embeddings = StubEmbeddings(failures=2)
+
+    assert engine(embeddings, max_batch_tokens=100, backoff=0.0).embed(TEXTS[:3]) == [[0.0, 1.0], [1.0, 2.0], [2.0, 3.0]]
+    assert len(embeddings.batches) == 3
+    with pytest.raises(ConnectionError):
+        engine(StubEmbeddings(failures=3), max_retries=2, backoff=0.0).embed(TEXTS[:3])
+
+def test_only_the_texts_missing_in_the_cache_are_embedded(tmp_path):
+    embeddings = StubEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), "model", 2)
+    embedding_engine = engine(embeddings, cache=cache)
+    embedding_engine.embed(TEXTS[:2])
+
+    result = embedding_engine.embed([TEXTS[2], TEXTS[0], TEXTS[2]])
+
+    assert embeddings.batches == [TEXTS[:2], [TEXTS[2]]]
+    assert [list(embedding) for embedding in result] == [[2.0, 3.0], [0.0, 1.0], [2.0, 3.0]]
+
+def test_token_counter_counts_single_and_batched_texts():
+    counter = TokenCounter("an-unknown-model")
+    texts = ["Turistas en A Coruña en agosto de 2019", "", "GASTO: 1000.5"]
+
+    assert counter.count_many(texts) == [counter.count(text) for text in texts]
+    assert counter.count(texts[0]) > counter.count(texts[2]) > 0
+    # The counter is sent to the workers of a process pool
+    assert pickle.loads(pickle.dumps(counter)).count_many(texts) == counter.count_many(texts)
+
+def test_token_counter_estimates_without_the_tokenizer():
+    counter = TokenCounter()
+    counter.encoding = None
+
+    assert counter.count("a" * 10) == 10 // TokenCounter.CHARS_PER_TOKEN + 1
+    assert counter.count_many(["", "a" * 8]) == [1, 3]
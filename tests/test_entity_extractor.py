@@ -0,0 +1,28 @@
+import numpy as np
+
+from src.EntityExtractor import EntityExtractor
+from src.LocalVectorDB import LocalVectorDB
+
+def test_extract_and_filter_expression():
+    extractor = EntityExtractor(["A Coruña", "Alicante/Alacant", "Santa Cruz de Tenerife"], [2019, 2020])
+
+    entities = extractor.extract("¿Cuántos turistas visitaron la coruña y Alacant en agosto de 2019 y 2018?")
+
+    assert entities == {"provinces": ["A Coruña", "Alicante/Alacant"], "years": [2019], "months": [8]}
+    assert extractor.extract("Viviendas en Santa Cruz de Tenerife")["provinces"] == ["Santa Cruz de Tenerife"]
+    assert extractor.filter_expression({"provinces": [], "years": [2019], "months": []}) == \
+        "((year_min <= 2019 and year_max >= 2019) or year_min == 0)"
+
+def test_the_dictionary_is_built_from_every_document(tmp_path):
+    vectordb = LocalVectorDB(str(tmp_path))
+    vectordb.load_milvus_client()
+    vectordb.prepare_vectordb("turismo", 4)
+    rows = 2500
+    provinces = ["Cádiz"] * (rows - 1) + ["Soria|Teruel"]
+    vectordb.insert("turismo", {"row_embedding": np.ones((rows, 4), dtype=np.float32), "province": provinces,
+                                "year_min": [2019] * (rows - 1) + [2023], "year_max": [2019] * (rows - 1) + [2024]})
+
+    extractor = EntityExtractor.from_vectordb(vectordb, "turismo")
+
+    assert extractor.provinces == ["Cádiz", "Soria", "Teruel"]
+    assert extractor.years == {2019, 2023, 2024}
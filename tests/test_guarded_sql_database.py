@@ -0,0 +1,93 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import create_engine
+
+from src.GuardedSQLDatabase import GuardedSQLDatabase
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "turismo.db")
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE destino ("PROVINCIA" TEXT, "AÑO" INTEGER, "TURISTAS" INTEGER)')
+    conn.execute('CREATE INDEX destino_provincia ON destino ("PROVINCIA")')
+    conn.executemany("INSERT INTO destino VALUES (?, ?, ?)",
+                     [(f"Provincia {i % 50}", 2000 + i % 25, i) for i in range(5000)])
+    conn.commit()
+    conn.close()
+    return path
+
+def guarded(db_path, **kwargs):
+    return GuardedSQLDatabase(create_engine(f"sqlite:///{db_path}"), db_path, **kwargs)
+
+def test_a_scan_of_a_large_table_is_rejected(db_path):
+    db = guarded(db_path, max_scan_rows=1000)
+
+    result = db.run_no_throw('SELECT SUM(TURISTAS) FROM destino WHERE "AÑO" = 2019')
+
+    assert result.startswith("Error: The query scans the whole table destino (5000 rows)")
+    assert "['PROVINCIA']" in result
+    assert db.run_no_throw("SELECT SUM(TURISTAS) FROM destino d WHERE d.PROVINCIA = 'Provincia 1'") == "[(247600,)]"
+    assert db.stats["rejected"] == 1
+
+def test_only_a_single_select_is_allowed(db_path):
+    db = guarded(db_path)
+
+    assert db.run_no_throw("DELETE FROM destino") == "Error: Only a single SELECT statement is allowed"
+    assert db.run_no_throw("SELECT 1; SELECT 2") == "Error: Only a single SELECT statement is allowed"
+
+def test_the_rows_are_capped(db_path):
+    db = guarded(db_path, max_rows=3)
+
+    columns, rows, truncated = db.fetch_rows("SELECT PROVINCIA, TURISTAS FROM destino ORDER BY TURISTAS")
+
+    assert columns == ["PROVINCIA", "TURISTAS"]
+    assert rows == [("Provincia 0", 0), ("Provincia 1", 1), ("Provincia 2", 2)]
+    assert truncated
+    assert db.run("SELECT TURISTAS FROM destino ORDER BY TURISTAS") == "[(0,), (1,), (2,)] (only the first 3 rows)"
+    # A query with its own LIMIT is not truncated
+    assert db.run("SELECT TURISTAS FROM destino ORDER BY TURISTAS LIMIT 2") == "[(0,), (1,)]"
+
+def test_a_long_query_is_interrupted(db_path):
+    db = guarded(db_path, timeout=0.05)
+
+    result = db.run_no_throw("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+                             "SELECT COUNT(*) FROM (SELECT i FROM n LIMIT 100000000)")
+
+    assert result == "Error: The query was interrupted after 0.05 seconds, write a more selective query"
+    assert db.stats["timeouts"] == 1
+    # The connection is back in the pool and runs the next query
+    assert db.run_no_throw("SELECT 1") == "[(1,)]"
+
+def test_every_error_is_returned(db_path):
+    db = guarded(db_path)
+
+    assert db.run_no_throw("SELECT * FROM missing").startswith("Error: no such table: missing")
+    assert db.run_no_throw("SELECT :value", parameters={}).startswith("Error: ")
+
+def test_the_pool_does_not_open_more_connections_than_its_size(db_path):
+    db = guarded(db_path, pool_size=2)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: db.run_no_throw(f"SELECT {i}"), range(200)))
+
+    assert results == [f"[({i},)]" for i in range(200)]
+    assert db.open_connections <= 2
+    assert db.pool.qsize() == db.open_connections
+
+def test_a_semicolon_inside_a_literal_is_not_a_second_statement(db_path):
+    db = guarded(db_path)
+
+    assert db.run_no_throw("SELECT COUNT(*) FROM destino WHERE PROVINCIA = 'x;y';") == "[(0,)]"
+    assert db.run_no_throw('SELECT "AÑO" AS "a;b" FROM destino WHERE PROVINCIA = \'Provincia 1\' LIMIT 1') == \
+        "[(2001,)]"
+    assert db.run_no_throw("SELECT 1 /* ; */; DELETE FROM destino") == "Error: Only a single SELECT statement is allowed"
+
+def test_a_query_with_comments_is_limited(db_path):
+    db = guarded(db_path, max_rows=2)
+
+    result = db.run_no_throw("-- the tourists of a province\n"
+                             "SELECT TURISTAS FROM destino WHERE PROVINCIA = 'Provincia 1' -- LIMIT 10")
+    assert result == "[(1,), (51,)] (only the first 2 rows)"
+    assert db.run_no_throw("SELECT TURISTAS FROM destino WHERE PROVINCIA = 'Provincia 1' LIMIT 1 -- first") == "[(1,)]"
+    assert db.run_no_throw("SELECT TURISTAS FROM destino WHERE PROVINCIA = '--' /* no rows */") == ""
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from src.IngestManifest import IngestManifest
+
+DF = pd.DataFrame({"AÑO": [2019, 2019, 2020, 2021], "MES": [1, 2, 1, 1], "PLAZAS": [5.5, 3.0, 4.0, 1.0]})
+
+def test_the_partition_fingerprints_do_not_depend_on_the_chunks_or_the_row_order():
+    whole = IngestManifest.partition_fingerprints([DF], ["AÑO"])
+    chunked = IngestManifest.partition_fingerprints([DF.iloc[3:], DF.iloc[:1], DF.iloc[1:3]], ["AÑO"])
+
+    assert chunked == whole
+    assert list(whole) == ["2019", "2020", "2021"]
+    assert whole["2019"]["values"] == [2019]
+    assert whole["2019"]["fingerprint"].startswith("2-")
+
+def test_without_partition_columns_the_file_is_a_single_partition():
+    partitions = IngestManifest.partition_fingerprints([DF.iloc[:2], DF.iloc[2:]], None)
+
+    assert list(partitions) == [""]
+    assert partitions[""]["values"] == []
+    assert partitions[""]["fingerprint"].startswith("4-")
+
+def test_diff_finds_the_changed_and_removed_partitions(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"), "sqlite")
+    partitions = IngestManifest.partition_fingerprints([DF], ["AÑO"])
+    assert manifest.diff("vut_prov.csv", "config", partitions) == (["2019", "2020", "2021"], [])
+    manifest.update("vut_prov.csv", "hash", "config", partitions)
+
+    new_df = DF[DF["AÑO"] != 2021].copy()
+    new_df.loc[new_df["AÑO"] == 2020, "PLAZAS"] = 9.0
+    new_partitions = IngestManifest.partition_fingerprints([pd.concat([new_df, DF.iloc[:0]])], ["AÑO"])
+
+    assert manifest.diff("vut_prov.csv", "config", new_partitions) == (["2020"], ["2020", "2021"])
+    # With another loading configuration every partition is loaded again
+    assert manifest.diff("vut_prov.csv", "other", new_partitions) == (["2019", "2020"], ["2019", "2020", "2021"])
+
+def test_the_generation_is_saved_and_increased_by_every_change(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestManifest(path, "sqlite")
+    partitions = IngestManifest.partition_fingerprints([DF], ["AÑO"])
+
+    manifest.update("vut_prov.csv", "hash", "config", partitions)
+    manifest.update("vut_prov.csv", "hash", "config", partitions, changed=False)
+    assert IngestManifest.read_generation(path, "sqlite") == 1
+    assert IngestManifest.read_generation(path, "milvus") == 0
+
+    reloaded = IngestManifest(path, "sqlite")
+    assert reloaded.get("vut_prov.csv")["partitions"] == partitions
+    reloaded.reset()
+    assert reloaded.get("vut_prov.csv") is None
+    assert IngestManifest.read_generation(path, "sqlite") == 2
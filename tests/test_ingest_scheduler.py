@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+import pytest
+
+from src.IngestScheduler import IngestScheduler
+from src.SQLDBFromTabularData import PrepareSQLFromTabularData
+
+def write_csvs(tmp_path, rows: dict) -> list:
+    tasks = []
+    for name, num_rows in rows.items():
+        path = tmp_path / f"{name}.csv"
+        pd.DataFrame({"AÑO": [2019] * num_rows, "GASTO": [f"{i},5" for i in range(num_rows)]}).to_csv(
+            path, sep=";", index=False)
+        tasks.append((name, (str(path), ";", "utf-8", ",", 10, None, None)))
+    return tasks
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_the_chunks_of_every_task_are_streamed_to_the_writer(tmp_path, max_workers):
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    tasks = write_csvs(tmp_path, {"a": 25, "b": 7})
+    written = {}
+
+    def writer(label, chunks):
+        # The writer gets an iterator, not a list
+        assert not isinstance(chunks, list)
+        written[label] = [(len(df), df["GASTO"].sum()) for df in chunks]
+
+    stats = IngestScheduler(max_workers, str(spill_dir)).run(tasks, PrepareSQLFromTabularData._iter_chunks, writer)
+
+    assert [rows for rows, _ in written["a"]] == [10, 10, 5]
+    assert [rows for rows, _ in written["b"]] == [7]
+    assert sum(total for _, total in written["a"]) == sum(i + 0.5 for i in range(25))
+    assert set(stats) == {"a", "b"}
+    assert os.listdir(spill_dir) == []
+
+def test_a_writer_error_removes_the_spill_files(tmp_path):
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    tasks = write_csvs(tmp_path, {"a": 5, "b": 5, "c": 5})
+
+    def writer(label, chunks):
+        raise RuntimeError("sink down")
+
+    with pytest.raises(RuntimeError, match="sink down"):
+        IngestScheduler(2, str(spill_dir)).run(tasks, PrepareSQLFromTabularData._iter_chunks, writer)
+    assert os.listdir(spill_dir) == []
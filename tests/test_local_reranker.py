@@ -0,0 +1,56 @@
+import asyncio
+
+import numpy as np
+
+from src.LocalReranker import LocalReranker
+from src.VectorDB import VectorDB
+
+DOCUMENTS = ["AÑO: 2019, PROVINCIA: Cádiz, TURISTAS: 1200",
+             "AÑO: 2020, PROVINCIA: Soria, TURISTAS: 300",
+             "AÑO: 2020, PROVINCIA: Cádiz, MES: 8, TURISTAS: 900",
+             "AÑO: 2021, PROVINCIA: Teruel, TURISTAS: 450"]
+
+class StubScorer(LocalReranker):
+    """
+    Scores the documents with fixed scores, like a cross-encoder would.
+    """
+    def __init__(self, scores: list) -> None:
+        super().__init__()
+        self.scores = scores
+        self.calls = []
+
+    def score(self, query: str, documents: list) -> np.ndarray:
+        self.calls.append((query, documents))
+        return np.array(self.scores[:len(documents)], dtype=np.float64)
+
+def test_rerank_sorts_the_candidates_by_score():
+    reranker = StubScorer([0.1, 0.7, 0.3, 0.9])
+
+    assert reranker.rerank("turistas", DOCUMENTS, top_n=4) == [DOCUMENTS[3], DOCUMENTS[1], DOCUMENTS[2], DOCUMENTS[0]]
+    assert reranker.calls == [("turistas", DOCUMENTS)]
+
+def test_rerank_keeps_the_top_n():
+    assert StubScorer([0.1, 0.7, 0.3, 0.9]).rerank("turistas", DOCUMENTS, top_n=2) == [DOCUMENTS[3], DOCUMENTS[1]]
+    assert StubScorer([0.1, 0.7]).rerank("turistas", DOCUMENTS[:2], top_n=5) == [DOCUMENTS[1], DOCUMENTS[0]]
+
+def test_ties_keep_the_order_of_the_vector_search():
+    assert StubScorer([0.5, 0.5, 0.9, 0.5]).rerank("turistas", DOCUMENTS, top_n=4) == \
+        [DOCUMENTS[2], DOCUMENTS[0], DOCUMENTS[1], DOCUMENTS[3]]
+
+def test_score_matches_terms_without_accents_and_month_names():
+    scores = LocalReranker().score("Turistas en Cadiz en agosto de 2020", DOCUMENTS)
+
+    assert scores.argmax() == 2
+    assert scores[0] > scores[1]
+    assert LocalReranker().rerank("turistas en cadiz en agosto de 2020", DOCUMENTS, top_n=2) == [DOCUMENTS[2], DOCUMENTS[0]]
+
+def test_score_of_no_documents_is_empty():
+    assert LocalReranker().score("turistas", []).size == 0
+
+def test_vectordb_reranks_with_the_local_reranker():
+    vectordb = VectorDB("unused", "", rerank=True, reranker="local")
+    vectordb.reranker = StubScorer([0.1, 0.7, 0.3, 0.9])
+
+    assert vectordb.rerank_docs("turistas", DOCUMENTS, top_n=2) == [DOCUMENTS[3], DOCUMENTS[1]]
+    assert asyncio.run(vectordb.arerank_docs("turistas", DOCUMENTS, top_n=1)) == [DOCUMENTS[3]]
+    assert vectordb.rerank_stats["calls"] == 2
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from src.LocalVectorDB import LocalVectorDB
+
+FIELDS = {"source": np.array(["vut_prov", "vut_prov", "destino_prov_mes", "vut_prov"], dtype=object),
+          "province": np.array(["Cádiz", "Soria|Teruel", "", "A Coruña"], dtype=object),
+          "year_min": np.array([2019, 2020, 0, 2021]), "year_max": np.array([2019, 2022, 0, 2021]),
+          "batch": np.array([0, 1, 2, 3])}
+
+@pytest.fixture
+def vectordb(tmp_path):
+    vectordb = LocalVectorDB(str(tmp_path))
+    vectordb.load_milvus_client()
+    vectordb.prepare_vectordb("turismo", 3)
+    return vectordb
+
+def insert(vectordb, sources: list, partitions: list):
+    vectors = np.eye(3, dtype=np.float32)[np.arange(len(sources)) % 3]
+    vectordb.insert("turismo", {"row_embedding": vectors, "source": sources, "partition": partitions,
+                                "row": [f"{source}/{partition}" for source, partition in zip(sources, partitions)]})
+
+@pytest.mark.parametrize("expression, expected", [
+    ('source == "vut_prov"', [True, True, False, True]),
+    ('source != "vut_prov" or batch >= 3', [False, False, True, True]),
+    ('province like "%Teruel%"', [False, True, False, False]),
+    ('province like "C_diz"', [True, False, False, False]),
+    ('batch in [0, 2]', [True, False, True, False]),
+    ('not (year_min <= 2020 and year_max >= 2020) and year_min != 0', [True, False, False, True]),
+    ('((year_min <= 2021 and year_max >= 2021) or year_min == 0) and (province like "%Soria%" or province == "")',
+     [False, True, True, False]),
+])
+def test_filter_mask(expression, expected):
+    assert LocalVectorDB("unused")._filter_mask(FIELDS, expression).tolist() == expected
+
+@pytest.mark.parametrize("expression", ['source = "vut_prov"', 'source == "vut_prov" and', 'unknown == 1',
+                                        'batch in [1, 2', 'source == "vut_prov")'])
+def test_invalid_filter_expressions_raise(expression):
+    with pytest.raises(ValueError):
+        LocalVectorDB("unused")._filter_mask(FIELDS, expression)
+
+def test_insert_flush_search_and_reload(vectordb, tmp_path):
+    insert(vectordb, ["vut_prov", "vut_prov", "destino_prov_mes"], ["2019", "2020", "2019"])
+    vectordb.flush("turismo")
+
+    hits = vectordb.search("turismo", [[0, 1, 0]], 2, {})[0]
+    assert [hit.row for hit in hits][0] == "vut_prov/2020"
+    assert [hit.row_id for hit in hits][0] == 2
+    filtered = vectordb.search("turismo", [[0, 1, 0]], 3, {}, filter='source == "destino_prov_mes"')[0]
+    assert [hit.row for hit in filtered] == ["destino_prov_mes/2019"]
+
+    reloaded = LocalVectorDB(str(tmp_path))
+    reloaded.load_milvus_collection("turismo")
+    assert [hit.row for hit in reloaded.search("turismo", [[0, 1, 0]], 1, {})[0]] == ["vut_prov/2020"]
+
+def test_delete_includes_the_pending_inserts(vectordb):
+    insert(vectordb, ["vut_prov", "destino_prov_mes"], ["2019", "2019"])
+    vectordb.flush("turismo")
+    # Inserted but not flushed
+    insert(vectordb, ["vut_prov", "vut_prov", "destino_prov_mes"], ["2020", "2021", "2020"])
+
+    vectordb.delete_partitions("turismo", "vut_prov", ["2019", "2020"])
+
+    rows = [entity["source"] + "/" + entity["partition"]
+            for entity in vectordb.iter_fields("turismo", ["source", "partition"])]
+    assert rows == ["destino_prov_mes/2019", "vut_prov/2021", "destino_prov_mes/2020"]
+
+    insert(vectordb, ["vut_prov"], ["2022"])
+    vectordb.delete_source("turismo", "vut_prov")
+
+    rows = [entity["source"] for entity in vectordb.iter_fields("turismo", ["source"])]
+    assert rows == ["destino_prov_mes", "destino_prov_mes"]
+    assert len(vectordb.collections["turismo"]["vectors"]) == 2
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_the_quantized_search_is_rescored_exactly(tmp_path, quantization):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 32)).astype(np.float32)
+    queries = vectors[:20] + 0.05 * rng.normal(size=(20, 32)).astype(np.float32)
+    exact = LocalVectorDB(str(tmp_path / "exact"))
+    quantized = LocalVectorDB(str(tmp_path / "quantized"), quantization=quantization, rescore=4)
+    for vectordb in (exact, quantized):
+        vectordb.load_milvus_client()
+        vectordb.prepare_vectordb("turismo", 32)
+        vectordb.insert("turismo", {"row_embedding": vectors})
+
+    expected = exact.search("turismo", queries, 5, {})
+    results = quantized.search("turismo", queries, 5, {})
+
+    for expected_hits, hits in zip(expected, results):
+        assert [hit.row_id for hit in hits] == [hit.row_id for hit in expected_hits]
+        # The scores are the exact float32 scores
+        assert np.allclose([hit.score for hit in hits], [hit.score for hit in expected_hits], atol=1e-5)
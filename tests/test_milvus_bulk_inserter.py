@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.MilvusBulkInserter import MilvusBulkInserter
+from src.VectorDB import VectorDB
+
+class StubClient:
+    """
+    Records the rows of every insert and the flushes, and fails the inserts of the rows in `fail_rows`.
+    """
+    def __init__(self, fail_rows: set = ()) -> None:
+        self.inserts = []
+        self.flushes = []
+        self.fail_rows = set(fail_rows)
+        self.lock = threading.Lock()
+
+    def insert(self, collection_name: str, rows: list):
+        if any(row["row"] in self.fail_rows for row in rows):
+            raise ConnectionError("Milvus is not available")
+        with self.lock:
+            self.inserts.append((collection_name, rows))
+
+    def flush(self, collection_name: str):
+        self.flushes.append(collection_name)
+
+def columns(num_rows: int) -> dict:
+    # Every row takes 4 * 4 bytes of vector, 2 bytes of text and 8 bytes of batch
+    return {"row_embedding": np.ones((num_rows, 4), dtype=np.float32), "row": [f"{i:02d}" for i in range(num_rows)],
+            "batch": list(range(num_rows))}
+
+def test_batches_fit_the_payload_bytes_and_rows():
+    client = StubClient()
+    inserter = MilvusBulkInserter(client, max_batch_bytes=26 * 3, max_batch_rows=2, max_workers=3)
+
+    stats = inserter.insert("turismo", columns(7))
+
+    assert sorted(len(rows) for _, rows in client.inserts) == [1, 2, 2, 2]
+    assert stats["rows"] == 7 and stats["batches"] == 4 and len(stats["latencies"]) == 4
+    inserted = sorted((row for _, rows in client.inserts for row in rows), key=lambda row: row["batch"])
+    assert [row["row"] for row in inserted] == [f"{i:02d}" for i in range(7)]
+    assert set(inserted[0]) == {"row_embedding", "row", "batch"}
+
+def test_the_payload_budget_splits_the_batches():
+    inserter = MilvusBulkInserter(StubClient(), max_batch_bytes=26 * 3)
+
+    row_bytes = sum(inserter._column_bytes(values) for values in columns(7).values())
+
+    assert row_bytes.tolist() == [26] * 7
+    assert inserter._make_batches(row_bytes) == [(0, 3), (3, 6), (6, 7)]
+    # A row over the budget is inserted alone
+    assert inserter._make_batches(np.array([10, 100, 10])) == [(0, 1), (1, 2), (2, 3)]
+
+def test_the_stats_add_up_until_reset():
+    inserter = MilvusBulkInserter(StubClient(), max_batch_rows=2)
+    inserter.insert("turismo", columns(3))
+    inserter.insert("turismo", columns(2))
+
+    assert inserter.summary()["rows"] == 5 and inserter.summary()["batches"] == 3
+    assert inserter.insert("turismo", columns(0))["rows"] == 0
+    inserter.reset_stats()
+    assert inserter.summary() == {"rows": 0, "batches": 0, "seconds": 0.0, "rows_per_sec": 0, "latency_p50": 0.0,
+                                  "latency_p95": 0.0}
+
+def test_a_failed_insert_raises_and_is_not_counted():
+    inserter = MilvusBulkInserter(StubClient(fail_rows={"03"}), max_batch_rows=2)
+
+    with pytest.raises(ConnectionError):
+        inserter.insert("turismo", columns(6))
+    assert inserter.summary()["rows"] == 0
+
+def test_vectordb_inserts_float32_vectors_and_flushes():
+    vectordb = VectorDB("unused", "", insert_batch_bytes=1024)
+    client = StubClient()
+    vectordb.milvus_client = client
+    vectordb.inserter = MilvusBulkInserter(client, vectordb.insert_batch_bytes)
+
+    vectordb.insert("turismo", {**columns(3), "row_embedding": [[0.5] * 4] * 3})
+    vectordb.flush("turismo")
+
+    rows = [row for _, rows in client.inserts for row in rows]
+    assert all(row["row_embedding"].dtype == np.float32 for row in rows)
+    assert client.flushes == ["turismo"]
+    assert vectordb.insert_summary()["rows"] == 3
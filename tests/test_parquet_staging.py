@@ -0,0 +1,49 @@
+import os
+import pandas as pd
+
+from src.IngestManifest import IngestManifest
+from src.ParquetStaging import ParquetStaging
+
+def write_csv(path, rows: int):
+    pd.DataFrame({"AÑO": [2019 + i % 2 for i in range(rows)], "MEDIA": [f"{i},5" for i in range(rows)]}).to_csv(
+        path, sep=";", index=False)
+
+def test_a_file_is_staged_once_and_read_in_chunks(tmp_path):
+    csv_path = tmp_path / "vut_prov.csv"
+    write_csv(csv_path, 25)
+    staging = ParquetStaging(str(tmp_path / "staging"), ";", "utf-8", datafiles=[{"filename": "vut_prov.csv",
+                                                                                  "csv_decimal": ","}])
+
+    chunks = list(staging.iter_chunks(str(csv_path), 10))
+
+    assert [len(df) for df in chunks] == [10, 10, 5]
+    assert chunks[1]["MEDIA"].iloc[0] == 10.5
+    assert list(chunks[2].index) == list(range(20, 25))
+    assert len(os.listdir(tmp_path / "staging")) == 1
+
+def test_the_hash_passed_by_the_caller_is_not_computed_again(tmp_path, monkeypatch):
+    csv_path = tmp_path / "vut_prov.csv"
+    write_csv(csv_path, 5)
+    staging = ParquetStaging(str(tmp_path / "staging"), ";", "utf-8")
+    file_hash = IngestManifest.file_fingerprint(str(csv_path))
+
+    def fingerprint(file_path):
+        raise AssertionError("the file was hashed again")
+
+    monkeypatch.setattr(IngestManifest, "file_fingerprint", staticmethod(fingerprint))
+
+    assert len(staging.read(str(csv_path), file_hash=file_hash)) == 5
+    assert sum(len(df) for df in staging.iter_chunks(str(csv_path), 2, file_hash=file_hash)) == 5
+
+def test_a_new_version_replaces_the_staged_file(tmp_path):
+    csv_path = tmp_path / "vut_prov.csv"
+    staging = ParquetStaging(str(tmp_path / "staging"), ";", "utf-8")
+    write_csv(csv_path, 5)
+    first = staging.stage(str(csv_path))
+    write_csv(csv_path, 7)
+
+    second = staging.stage(str(csv_path))
+
+    assert first != second
+    assert os.listdir(tmp_path / "staging") == [os.path.basename(second)]
+    assert len(staging.read(str(csv_path))) == 7
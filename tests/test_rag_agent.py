@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import answer_many
+from src.AnswerCache import AnswerCache
+from src.RAGTabularDataAgent import RAGTabularDataAgent
+from src.VectorDB import SearchHit
+
+QUESTIONS = {"Turistas en Cádiz": 0.03, "Turistas en Soria": 0.01, "Turistas en Teruel": 0.02}
+
+class StubEmbeddings:
+    def embed_query(self, text: str) -> list:
+        return [1.0, float(len(text)), 0.0]
+
+    async def aembed_query(self, text: str) -> list:
+        return self.embed_query(text)
+
+class StubVectorDB:
+    rerank = False
+
+    def search(self, collection_name, query_vectors, topk, search_params, filter=""):
+        return [[SearchHit(row_id=i, score=1.0, row=f"row {vector[1]:.0f}", source="vut_prov.csv",
+                           description="", batch=0) for i in range(topk)] for vector in query_vectors]
+
+    async def asearch(self, collection_name, query_vectors, topk, search_params, filter=""):
+        return self.search(collection_name, query_vectors, topk, search_params, filter)
+
+class StubLLM:
+    """
+    Answers with the question of the prompt, after the delay of the question, so the answers finish out of order.
+    """
+    def invoke(self, messages):
+        return SimpleNamespace(content=self._question(messages))
+
+    async def ainvoke(self, messages):
+        question = self._question(messages)
+        await asyncio.sleep(QUESTIONS.get(question, 0))
+        return SimpleNamespace(content=question)
+
+    @staticmethod
+    def _question(messages) -> str:
+        return messages[-1]["content"].split("User's question: ")[1].split(" \n")[0]
+
+def create_agent(answer_cache=None) -> RAGTabularDataAgent:
+    return RAGTabularDataAgent("system", "turismo", StubEmbeddings(), StubLLM(), StubVectorDB(),
+                               answer_cache=answer_cache)
+
+def test_arespond_returns_its_own_history_and_timings():
+    agent = create_agent()
+    chat = [("hola", "hola")]
+    stage_seconds = {}
+
+    response, history = asyncio.run(agent.arespond("Turistas en Soria", {}, 2, chat=chat, stage_seconds=stage_seconds))
+
+    assert response == "Turistas en Soria"
+    assert history is chat
+    assert chat == [("hola", "hola"), ("Turistas en Soria", "Turistas en Soria")]
+    assert set(stage_seconds) == {"embed", "search", "llm"}
+    # The agent keeps no state of the async calls
+    assert agent.chatbot == []
+    assert agent.stage_seconds == {}
+
+def test_concurrent_answers_do_not_share_state():
+    agent = create_agent()
+    chats = {question: [] for question in QUESTIONS}
+    timings = {question: {} for question in QUESTIONS}
+
+    async def answer_all():
+        return await asyncio.gather(*(agent.arespond(question, {}, 1, chat=chats[question],
+                                                     stage_seconds=timings[question]) for question in QUESTIONS))
+
+    results = asyncio.run(answer_all())
+
+    assert [response for response, _ in results] == list(QUESTIONS)
+    for question, delay in QUESTIONS.items():
+        assert chats[question] == [(question, question)]
+        assert timings[question]["llm"] >= delay
+    assert agent.chatbot == []
+
+def test_a_cached_answer_is_added_to_the_given_history():
+    agent = create_agent(AnswerCache())
+    asyncio.run(agent.arespond("Turistas en Cádiz", {}, 1))
+    chat = []
+
+    response, _ = asyncio.run(agent.arespond("turistas en cadiz", {}, 1, chat=chat))
+
+    assert response == "Turistas en Cádiz"
+    assert chat == [("turistas en cadiz", "Turistas en Cádiz")]
+    assert agent.answer_cache.stats["exact_hits"] == 1
+
+def test_answer_many_keeps_the_order_of_the_questions():
+    agent = create_agent()
+    questions = list(QUESTIONS) * 3
+
+    responses = asyncio.run(answer_many(agent, questions, max_concurrency=2, search_params={}, topk=1))
+
+    assert responses == questions
+    assert agent.chatbot == []
+
+def test_respond_keeps_the_history_and_timings_of_the_agent():
+    agent = create_agent()
+
+    response, chat = agent.respond("Turistas en Soria", {}, 1)
+
+    assert chat is agent.chatbot
+    assert chat == [("Turistas en Soria", "Turistas en Soria")]
+    assert set(agent.stage_seconds) == {"embed", "search", "llm"}
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_serializer import baseline_docs
+from src.RowSerializer import RowSerializer
+
+DESCRIPTION = "Viviendas de uso turístico"
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"PROVINCIA": ["A Coruña", 'Valencia "capital"', None, "Alicante", "Cádiz"],
+                         "AÑO": [2019, 2019, 2020, 2021, 2021],
+                         "PLAZAS": [1000.5, 3.0, np.nan, 1e16, 0.125],
+                         "ABIERTO": [True, False, True, True, False]})
+
+def previous_rows(df: pd.DataFrame) -> list:
+    # The previous row to text: to_json, eval and json.dumps of every record
+    records = eval(df.to_json(orient='records').replace("null", "None").replace("true", "True")
+                   .replace("false", "False"))
+    return [json.dumps(record, ensure_ascii=False) for record in records]
+
+def test_json_rows_match_the_previous_serialization(df):
+    assert RowSerializer("json").serialize_rows(df).tolist() == previous_rows(df)
+
+def test_json_chunks_carry_the_text_of_the_previous_documents(df):
+    # The previous documents wrote every row as the repr of its latin-1 bytes, after the description.
+    # Their eval did not read the JSON booleans
+    df = df.drop(columns="ABIERTO")
+    rows = RowSerializer("json").serialize_rows(df)
+    previous = ['"Content Description": "' + DESCRIPTION + '",'
+                + ','.join(str(row.encode('latin-1', errors='replace')) for row in rows[i:i + 2])
+                for i in range(0, len(df), 2)]
+    assert previous == baseline_docs(df, 2, DESCRIPTION)
+
+    docs, chunk_ids = RowSerializer("json").serialize_chunks(df, np.arange(len(df)) // 2, DESCRIPTION)
+    assert chunk_ids.tolist() == [0, 1, 2]
+    assert [json.loads(doc) for doc in docs] == [{"description": DESCRIPTION, "rows": [json.loads(row) for row in rows[i:i + 2]]}
+                                                 for i in range(0, len(df), 2)]
+
+def test_slashes_are_no_longer_escaped():
+    # The previous to_json wrote "/" as "\/" and eval kept the backslash in the text
+    df = pd.DataFrame({"PROVINCIA": ["Alicante/Alacant"]})
+
+    assert previous_rows(df) == ['{"PROVINCIA": "Alicante\\\\/Alacant"}']
+    assert RowSerializer("json").serialize_rows(df).tolist() == ['{"PROVINCIA": "Alicante/Alacant"}']
+
+def test_kv_and_markdown_templates(df):
+    kv_docs, _ = RowSerializer("kv").serialize_chunks(df.iloc[:2], np.zeros(2, dtype=int), DESCRIPTION)
+    markdown_docs, _ = RowSerializer("markdown").serialize_chunks(df.iloc[:2], np.zeros(2, dtype=int), "a|b")
+
+    assert kv_docs == [f"Content Description: {DESCRIPTION}\n\n"
+                       "PROVINCIA: A Coruña\nAÑO: 2019\nPLAZAS: 1000.5\nABIERTO: True\n\n"
+                       'PROVINCIA: Valencia "capital"\nAÑO: 2019\nPLAZAS: 3.0\nABIERTO: False']
+    assert markdown_docs == ["Content Description: a|b\n\n| PROVINCIA | AÑO | PLAZAS | ABIERTO |\n|---|---|---|---|\n"
+                             "| A Coruña | 2019 | 1000.5 | True |\n| Valencia \"capital\" | 2019 | 3.0 | False |"]
+
+def test_missing_values_and_pipes(df):
+    df.loc[0, "PROVINCIA"] = "Soria|Teruel"
+
+    assert RowSerializer("markdown").serialize_rows(df.iloc[[0, 2]]).tolist() == \
+        ["| Soria\\|Teruel | 2019 | 1000.5 | True |", "|  | 2020 |  | True |"]
+    assert RowSerializer("kv").serialize_rows(df.iloc[[2]]).tolist() == ["PROVINCIA: \nAÑO: 2020\nPLAZAS: \nABIERTO: True"]
+
+@pytest.mark.parametrize("template", RowSerializer.TEMPLATES)
+def test_the_same_input_produces_the_same_output(df, template):
+    chunk_ids = np.array([0, 0, 1, 1, 2])
+
+    first, _ = RowSerializer(template).serialize_chunks(df, chunk_ids, DESCRIPTION)
+    second, _ = RowSerializer(template).serialize_chunks(df.copy(), chunk_ids, DESCRIPTION)
+
+    assert first == second
+
+def test_unknown_templates_raise():
+    with pytest.raises(ValueError):
+        RowSerializer("csv")
@@ -0,0 +1,117 @@
+import json
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+
+from server import create_app
+from src.EmbeddingBatcher import EmbeddingBatcher
+
+class StubAgent:
+    """
+    Answers with the question in upper case, as one token per word.
+    """
+    async def arespond(self, message: str, *args, chat: list = None, stage_seconds: dict = None, **kwargs):
+        await asyncio.sleep(0.01)
+        chat.append((message, message.upper()))
+        if stage_seconds is not None:
+            stage_seconds["llm"] = 0.01
+        return message.upper(), chat
+
+    async def astream(self, message: str, *args, chat: list = None, **kwargs):
+        for word in message.upper().split():
+            yield {"event": "token", "text": word}
+        chat.append((message, message.upper()))
+        yield {"event": "done", "response": message.upper()}
+
+class StubEmbeddings:
+    def __init__(self, fail: bool = False) -> None:
+        self.calls = []
+        self.fail = fail
+
+    async def aembed_documents(self, texts: list) -> list:
+        self.calls.append(texts)
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("rate limited")
+        return [[float(len(text))] for text in texts]
+
+def run(test, max_history: int = 100):
+    async def main():
+        app = create_app({"rag": StubAgent(), "sql": StubAgent()}, EmbeddingBatcher(StubEmbeddings()))
+        app["max_history"] = max_history
+        async with TestClient(TestServer(app)) as client:
+            await test(client, app)
+    asyncio.run(main())
+
+def test_health():
+    async def test(client, app):
+        response = await client.get("/health")
+        assert response.status == 200
+        assert await response.json() == {"status": "ok", "modes": ["rag", "sql"],
+                                         "embeddings": {"queries": 0, "batches": 0, "seconds": 0.0}}
+    run(test)
+
+def test_ask_answers_with_the_agent_of_the_mode():
+    async def test(client, app):
+        response = await client.post("/ask", json={"question": "turistas en soria", "mode": "rag"})
+        body = await response.json()
+        assert body["answer"] == "TURISTAS EN SORIA"
+        assert body["stage_seconds"] == {"llm": 0.01}
+
+        response = await client.post("/ask", json={"question": "plazas", "mode": "sql"})
+        assert (await response.json())["answer"] == "PLAZAS"
+    run(test)
+
+def test_ask_rejects_the_bad_requests():
+    async def test(client, app):
+        assert (await client.post("/ask", data="no json")).status == 400
+        assert (await client.post("/ask", json={"mode": "rag"})).status == 400
+        assert (await client.post("/ask", json={"question": "plazas", "mode": "other"})).status == 400
+        assert (await client.post("/ask", json={"question": "plazas", "mode": "text2sql"})).status == 503
+    run(test)
+
+def test_every_session_keeps_its_own_history():
+    async def test(client, app):
+        await asyncio.gather(*(client.post("/ask", json={"question": f"{session} {i}", "session": session})
+                               for i in range(3) for session in ("ana", "luis")))
+        await client.post("/ask", json={"question": "sin sesion"})
+
+        assert list(app["histories"]) == ["ana", "luis"]
+        for session in ("ana", "luis"):
+            # Only the last turns are kept
+            assert len(app["histories"][session]) == 2
+            assert {question.split()[0] for question, _ in app["histories"][session]} == {session}
+    run(test, max_history=2)
+
+def test_ask_stream_sends_the_events_as_ndjson():
+    async def test(client, app):
+        response = await client.post("/ask/stream", json={"question": "turistas en soria", "session": "ana"})
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+        events = [json.loads(line) for line in (await response.text()).splitlines()]
+        assert events == [{"event": "token", "text": "TURISTAS"}, {"event": "token", "text": "EN"},
+                          {"event": "token", "text": "SORIA"}, {"event": "done", "response": "TURISTAS EN SORIA"}]
+        assert app["histories"]["ana"] == [("turistas en soria", "TURISTAS EN SORIA")]
+    run(test)
+
+def test_the_batcher_coalesces_the_concurrent_queries():
+    model = StubEmbeddings()
+
+    async def main():
+        batcher = EmbeddingBatcher(model, max_batch_size=3, max_wait=0.01)
+        return batcher, await asyncio.gather(*(batcher.aembed_query(text) for text in ["a", "bb", "a", "ccc", "dddd"]))
+
+    batcher, embeddings = asyncio.run(main())
+
+    assert embeddings == [[1.0], [2.0], [1.0], [3.0], [4.0]]
+    # A full batch is sent at once, the rest after the wait, a repeated query is embedded once
+    assert model.calls == [["a", "bb"], ["ccc", "dddd"]]
+    assert batcher.stats["queries"] == 5
+    assert batcher.stats["batches"] == 2
+
+def test_a_failed_batch_fails_every_query():
+    async def main():
+        batcher = EmbeddingBatcher(StubEmbeddings(fail=True), max_wait=0.01)
+        return await asyncio.gather(batcher.aembed_query("a"), batcher.aembed_query("b"), return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert [str(result) for result in results] == ["rate limited", "rate limited"]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from langchain_core.caches import BaseCache  # noqa: F401, the tools of the SQL agent need it to be defined
+from langchain_core.callbacks import Callbacks  # noqa: F401
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_community.llms.fake import FakeStreamingListLLM
+from langchain_community.tools.sql_database.tool import QuerySQLCheckerTool
+from langchain_community.utilities import SQLDatabase
+
+from src.SQLAgent import SQLAgent
+from src.SQLPlanCache import SQLPlanCache
+from src.TextToSQLAgent import TextToSQLAgent
+
+# With pydantic >= 2.11 the tool is only fully defined once its annotations are imported
+QuerySQLCheckerTool.model_rebuild()
+
+QUERY = 'SELECT COUNT(*) FROM destino WHERE "PROVINCIA" = \'A Coruña\''
+
+@pytest.fixture
+def db(tmp_path):
+    db_path = str(tmp_path / "turismo.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE destino ("PROVINCIA" TEXT, "AÑO" INTEGER)')
+    conn.executemany("INSERT INTO destino VALUES (?, ?)", [("A Coruña", 2019), ("A Coruña", 2020), ("Soria", 2020)])
+    conn.commit()
+    conn.close()
+    return SQLDatabase(create_engine(f"sqlite:///{db_path}"))
+
+def without_timings(events: list) -> list:
+    return [{key: value for key, value in event.items() if key not in ("seconds", "first_token", "total")}
+            for event in events]
+
+def stream_both(new_agent, message: str) -> tuple:
+    """
+    Stream the response to a message with a new agent synchronously and asynchronously.
+    """
+    sync_agent = new_agent()
+    sync_events = list(sync_agent.stream(message))
+    async_agent = new_agent()
+    chat = []
+
+    async def collect():
+        return [event async for event in async_agent.astream(message, chat)]
+
+    async_events = asyncio.run(collect())
+    assert sync_agent.chatbot == chat == [(message, sync_events[-1]["response"])]
+    assert async_agent.chatbot == []
+    return without_timings(sync_events), without_timings(async_events)
+
+def test_text_to_sql_streams_the_same_events_sync_and_async(db):
+    def new_agent():
+        return TextToSQLAgent(db, "{question} {query} {result}", FakeStreamingListLLM(responses=[QUERY, "Hay 2"]))
+
+    sync_events, async_events = stream_both(new_agent, "¿Cuántas filas de A Coruña?")
+
+    assert sync_events == async_events == [{"event": "sql_generated", "query": QUERY},
+                                           {"event": "sql_executed", "result": "[(2,)]"},
+                                           {"event": "token", "text": "H"}, {"event": "token", "text": "a"},
+                                           {"event": "token", "text": "y"}, {"event": "token", "text": " "},
+                                           {"event": "token", "text": "2"}, {"event": "done", "response": "Hay 2"}]
+
+@pytest.mark.parametrize("plan_answer, response", [("result", "COUNT(*): 2"), ("llm", "Hay 2")])
+def test_text_to_sql_streams_the_same_events_with_a_cached_plan(db, plan_answer, response):
+    def new_agent():
+        cache = SQLPlanCache({"A Coruña": "PROVINCIA"})
+        cache.add("Filas de A Coruña", QUERY)
+        # The LLM only answers from the result, the query comes from the cache
+        return TextToSQLAgent(db, "{question} {query} {result}", FakeStreamingListLLM(responses=["Hay 2"]), cache,
+                              plan_answer=plan_answer)
+
+    sync_events, async_events = stream_both(new_agent, "Filas de A Coruña")
+
+    assert sync_events == async_events
+    assert [event["event"] for event in sync_events][:2] == ["plan_cache", "sql_executed"]
+    assert "".join(event["text"] for event in sync_events if event["event"] == "token") == response
+    assert sync_events[-1] == {"event": "done", "response": response}
+
+def sql_agent_messages(thought: str = "") -> list:
+    tool_call = {"id": "call_1", "type": "function",
+                 "function": {"name": "sql_db_query", "arguments": json.dumps({"query": QUERY})}}
+    return [AIMessage(content=thought, additional_kwargs={"tool_calls": [tool_call]}), AIMessage(content="Hay 2 filas")]
+
+def test_sql_agent_streams_the_same_events_sync_and_async(db):
+    def new_agent():
+        return SQLAgent(db, "", GenericFakeChatModel(messages=iter(sql_agent_messages())))
+
+    sync_events, async_events = stream_both(new_agent, "¿Cuántas filas de A Coruña?")
+
+    assert sync_events == async_events == [{"event": "sql_generated", "query": QUERY},
+                                           {"event": "sql_executed", "result": "[(2,)]"},
+                                           {"event": "token", "text": "Hay"}, {"event": "token", "text": " "},
+                                           {"event": "token", "text": "2"}, {"event": "token", "text": " "},
+                                           {"event": "token", "text": "filas"},
+                                           {"event": "done", "response": "Hay 2 filas"}]
+
+def test_sql_agent_streams_a_single_token_when_the_llm_does_not_stream(db):
+    def new_agent():
+        # The text written with the tool call is not part of the answer
+        return SQLAgent(db, "", FakeMessagesListChatModel(responses=sql_agent_messages("Consulto la tabla")))
+
+    sync_events, async_events = stream_both(new_agent, "¿Cuántas filas de A Coruña?")
+
+    assert sync_events == async_events
+    assert sync_events[2:] == [{"event": "token", "text": "Hay 2 filas"}, {"event": "done", "response": "Hay 2 filas"}]
@@ -0,0 +1,72 @@
+import sqlite3
+import pandas as pd
+
+from src.SQLDBFromTabularData import PrepareSQLFromTabularData
+
+DATAFILES = [{"filename": "vut_prov.csv", "csv_decimal": ",", "partition_by": ["AÑO"]}]
+
+def write_datafile(data_dir, rows: list):
+    pd.DataFrame(rows, columns=["PROVINCIA", "AÑO", "MES", "PLAZAS"]).to_csv(
+        data_dir / "vut_prov.csv", sep=";", decimal=",", index=False, encoding="latin_1")
+
+def table_rows(db_path: str, table: str) -> list:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f'SELECT * FROM "{table}" ORDER BY "AÑO", "MES", "PROVINCIA"').fetchall()
+    finally:
+        conn.close()
+
+def test_a_full_load_skips_the_files_that_are_not_data(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.5), ("Soria", 2020, 2, 3.0)])
+    (data_dir / "datafiles.yml").write_text("files: []\n")
+    db_path = str(tmp_path / "test.db")
+
+    prepdata = PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES, chunk_size=1)
+    prepdata.run_pipeline(None)
+
+    assert prepdata.file_dir_list == ["vut_prov.csv"]
+    assert table_rows(db_path, "vut_prov") == [("Cádiz", 2019, 1, 5.5), ("Soria", 2020, 2, 3.0)]
+
+def test_sync_replaces_only_the_changed_and_removed_partitions(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "others.yml").write_text("files: []\n")
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.0), ("Soria", 2019, 2, 3.0), ("Cádiz", 2020, 1, 4.0),
+                              ("Cádiz", 2021, 1, 1.0)])
+    db_path = str(tmp_path / "test.db")
+    prepdata = PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES, chunk_size=1)
+    prepdata.run_pipeline(None, sync=True)
+    assert len(table_rows(db_path, "vut_prov")) == 4
+    # A row of an unchanged partition edited in the table shows which partitions are loaded again
+    conn = sqlite3.connect(db_path)
+    conn.execute('UPDATE vut_prov SET "PLAZAS" = 0 WHERE "AÑO" = 2019 AND "MES" = 1')
+    conn.commit()
+    conn.close()
+
+    # 2020 changes, with decimals that widen the column, and 2021 is removed
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.0), ("Soria", 2019, 2, 3.0), ("Cádiz", 2020, 1, 4.5),
+                              ("Soria", 2020, 2, 2.0)])
+    prepdata = PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES, chunk_size=1)
+    prepdata.run_pipeline(None, sync=True)
+
+    assert table_rows(db_path, "vut_prov") == [("Cádiz", 2019, 1, 0.0), ("Soria", 2019, 2, 3.0),
+                                               ("Cádiz", 2020, 1, 4.5), ("Soria", 2020, 2, 2.0)]
+    assert prepdata.manifest.get("vut_prov.csv")["partitions"].keys() == {"2019", "2020"}
+
+def test_sync_reloads_every_partition_of_a_dropped_table(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.0), ("Cádiz", 2020, 1, 4.0)])
+    db_path = str(tmp_path / "test.db")
+    PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES).run_pipeline(None, sync=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE vut_prov")
+    conn.commit()
+    conn.close()
+
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.0), ("Cádiz", 2020, 1, 6.0)])
+    PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES).run_pipeline(None, sync=True)
+
+    assert table_rows(db_path, "vut_prov") == [("Cádiz", 2019, 1, 5.0), ("Cádiz", 2020, 1, 6.0)]
@@ -0,0 +1,76 @@
+import sqlite3
+from sqlalchemy import create_engine
+from langchain_community.utilities import SQLDatabase
+from langchain_community.llms.fake import FakeListLLM
+
+from src.SQLPlanCache import SQLPlanCache
+from src.GuardedSQLDatabase import GuardedSQLDatabase
+from src.TextToSQLAgent import TextToSQLAgent
+
+SLOTS = {"A Coruña": "PROVINCIA", "Alicante/Alacant": "PROVINCIA"}
+
+def test_the_query_is_cached_as_a_template_of_the_question_shape():
+    cache = SQLPlanCache(SLOTS)
+
+    assert cache.add("¿Cuántos turistas visitaron A Coruña en agosto de 2019?",
+                     "SELECT SUM(TURISTAS) FROM destino WHERE PROVINCIA = 'A Coruña' AND MES = 8 AND AÑO = 2019;")
+
+    query, parameters = cache.get("¿Cuantos turistas visitaron alacant en marzo de 2021?")
+    assert query == "SELECT SUM(TURISTAS) FROM destino WHERE PROVINCIA = :p0 AND MES = :p1 AND AÑO = :p2"
+    assert parameters == {"p0": "Alicante/Alacant", "p1": 3, "p2": 2021}
+    assert cache.get("¿Cuántos turistas visitaron A Coruña?") is None
+    assert cache.stats == {"hits": 1, "misses": 1, "added": 1, "rejected": 0}
+
+def test_a_query_that_does_not_use_every_slot_is_not_cached():
+    cache = SQLPlanCache(SLOTS)
+
+    assert not cache.add("¿Turistas en A Coruña en 2019?", "SELECT SUM(TURISTAS) FROM destino WHERE AÑO = 2019")
+    assert not cache.add("¿Turistas en 2019 y 2019?", "SELECT SUM(TURISTAS) FROM destino WHERE AÑO = 2019")
+    assert cache.stats["rejected"] == 2
+
+def test_a_like_pattern_keeps_its_wildcards():
+    cache = SQLPlanCache(SLOTS)
+    cache.add("Turistas de A Coruña", "SELECT * FROM destino WHERE PROVINCIA LIKE '%A Coruña%'")
+
+    assert cache.get("Turistas de Alicante") == ("SELECT * FROM destino WHERE PROVINCIA LIKE :p0",
+                                                 {"p0": "%Alicante/Alacant%"})
+
+def test_format_result():
+    assert SQLPlanCache.format_result(["AÑO", "TURISTAS"], [(2019, 10), (2020, 5)], truncated=True) == \
+        "AÑO: 2019, TURISTAS: 10\nAÑO: 2020, TURISTAS: 5\n(only the first 2 rows)"
+    assert SQLPlanCache.format_result(["AÑO"], []) == "No results"
+
+def test_a_truncated_cached_result_is_answered_without_the_llm(tmp_path):
+    db_path = str(tmp_path / "turismo.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE destino ("PROVINCIA" TEXT, "AÑO" INTEGER, "TURISTAS" REAL)')
+    conn.executemany("INSERT INTO destino VALUES (?, ?, ?)", [("A Coruña", 2019 + i, 1.5 * i) for i in range(5)])
+    conn.commit()
+    conn.close()
+    db = GuardedSQLDatabase(create_engine(f"sqlite:///{db_path}"), db_path, max_rows=2)
+    cache = SQLPlanCache(SLOTS)
+    cache.add("Turistas de A Coruña por año", "SELECT AÑO, TURISTAS FROM destino WHERE PROVINCIA = 'A Coruña'")
+    # The LLM has no responses, a call would fail
+    agent = TextToSQLAgent(db, "{question} {query} {result}", FakeListLLM(responses=[]), cache, plan_answer="result")
+
+    response, _ = agent.respond("Turistas de A Coruña por año")
+
+    assert response == "AÑO: 2019, TURISTAS: 0.0\nAÑO: 2020, TURISTAS: 1.5\n(only the first 2 rows)"
+    events = list(agent.stream("Turistas de A Coruña por año"))
+    assert events[-1]["response"] == response
+
+def test_a_cached_result_is_fetched_from_a_plain_sql_database(tmp_path):
+    db_path = str(tmp_path / "turismo.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE destino ("PROVINCIA" TEXT, "AÑO" INTEGER, "TURISTAS" REAL)')
+    conn.executemany("INSERT INTO destino VALUES (?, ?, ?)", [("A Coruña", 2019, 10.5), ("Alicante/Alacant", 2019, 3.0)])
+    conn.commit()
+    conn.close()
+    cache = SQLPlanCache(SLOTS)
+    cache.add("Turistas de A Coruña", "SELECT AÑO, TURISTAS FROM destino WHERE PROVINCIA = 'A Coruña'")
+    agent = TextToSQLAgent(SQLDatabase(create_engine(f"sqlite:///{db_path}")), "{question} {query} {result}",
+                           FakeListLLM(responses=[]), cache, plan_answer="result")
+
+    response, _ = agent.respond("Turistas de Alicante")
+
+    assert response == "AÑO: 2019, TURISTAS: 3.0"
@@ -0,0 +1,61 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from src.SQLiteBulkLoader import SQLiteBulkLoader
+
+def column_types(db_path: str, table: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        return {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+    finally:
+        conn.close()
+
+def test_infer_types():
+    df = pd.DataFrame({"AÑO": [2019, 2020], "PLAZAS": [3.0, np.nan], "MEDIA": [5.3, 6.0],
+                       "PROVINCIA": ["Cádiz", "Álava"], "VACIA": [np.nan, np.nan]})
+
+    assert SQLiteBulkLoader.infer_types(df) == {"AÑO": "INTEGER", "PLAZAS": "INTEGER", "MEDIA": "REAL",
+                                                "PROVINCIA": "TEXT", "VACIA": "INTEGER"}
+
+def test_widen_types_keeps_the_widest_type():
+    types = {"A": "INTEGER", "B": "REAL", "C": "INTEGER", "D": "BIGINT"}
+    new_types = {"A": "REAL", "B": "INTEGER", "C": "TEXT", "D": "TEXT"}
+
+    assert SQLiteBulkLoader.widen_types(types, new_types) == {"A": "REAL", "B": "REAL", "C": "TEXT", "D": "BIGINT"}
+
+def test_load_widens_a_column_with_decimals_in_a_later_chunk(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    chunks = [pd.DataFrame({"AÑO": [2020, 2020], "PROVINCIA": ["Cádiz", "Álava"],
+                            "PLAZAS_POR_VIVIENDA_TURISTICA": [5.0, np.nan]}),
+              pd.DataFrame({"AÑO": [2021, 2021], "PROVINCIA": ["Cádiz", "Álava"],
+                            "PLAZAS_POR_VIVIENDA_TURISTICA": [5.3, 6.23]})]
+
+    rows = SQLiteBulkLoader(db_path).load("vut_prov", iter(chunks))
+
+    assert rows == 4
+    assert column_types(db_path, "vut_prov") == {"AÑO": "INTEGER", "PROVINCIA": "TEXT",
+                                                 "PLAZAS_POR_VIVIENDA_TURISTICA": "REAL"}
+    conn = sqlite3.connect(db_path)
+    try:
+        values = conn.execute('SELECT "PLAZAS_POR_VIVIENDA_TURISTICA" FROM vut_prov ORDER BY rowid').fetchall()
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(vut_prov)")}
+    finally:
+        conn.close()
+    assert values == [(5.0,), (None,), (5.3,), (6.23,)]
+    assert indexes == {"idx_vut_prov_PROVINCIA_AÑO", "idx_vut_prov_AÑO"}
+
+def test_load_keeps_integer_columns_and_the_limit(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    chunks = [pd.DataFrame({"MES": [1.0, np.nan], "GASTO": [10, 20]}), pd.DataFrame({"MES": [3.0, 4.0], "GASTO": [30, 40]})]
+
+    rows = SQLiteBulkLoader(db_path).load("gasto", iter(chunks), limit=3)
+
+    assert rows == 3
+    assert column_types(db_path, "gasto") == {"MES": "INTEGER", "GASTO": "INTEGER"}
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT MES, typeof(MES) FROM gasto ORDER BY rowid").fetchall() == \
+            [(1, "integer"), (None, "null"), (3, "integer")]
+    finally:
+        conn.close()
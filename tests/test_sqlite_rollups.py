@@ -0,0 +1,83 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from src.SQLDBFromTabularData import PrepareSQLFromTabularData
+from src.SQLiteRollups import SQLiteRollups
+
+ROLLUPS = [{"group_by": ["AÑO", "PROVINCIA"], "measures": {"PLAZAS": ["sum", "avg"], "MES": "count"}},
+           {"name": "plazas_por_provincia", "group_by": ["PROVINCIA"], "measures": {"PLAZAS": ["min", "max"]}}]
+DATAFILES = [{"filename": "vut_prov.csv", "csv_decimal": ",", "partition_by": ["AÑO"], "rollups": ROLLUPS}]
+# The rows of every rollup computed with GROUP BY over the base table
+EXPECTED = {"vut_prov_por_año_provincia": 'SELECT "AÑO", "PROVINCIA", SUM("PLAZAS"), AVG("PLAZAS"), COUNT("MES"), '
+                                          'COUNT(*) FROM vut_prov GROUP BY "AÑO", "PROVINCIA"',
+            "plazas_por_provincia": 'SELECT "PROVINCIA", MIN("PLAZAS"), MAX("PLAZAS"), COUNT(*) FROM vut_prov '
+                                    'GROUP BY "PROVINCIA"'}
+
+def write_datafile(data_dir, rows: list):
+    pd.DataFrame(rows, columns=["PROVINCIA", "AÑO", "MES", "PLAZAS"]).to_csv(
+        data_dir / "vut_prov.csv", sep=";", decimal=",", index=False, encoding="latin_1")
+
+def assert_rollups_match_the_table(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, query in EXPECTED.items():
+            assert sorted(conn.execute(f'SELECT * FROM "{name}"').fetchall()) == sorted(conn.execute(query).fetchall())
+    finally:
+        conn.close()
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.0), ("Cádiz", 2019, 2, 7.0), ("Soria", 2019, 1, 3.0),
+                              ("Cádiz", 2020, 1, 4.0), ("Teruel", 2021, 3, 1.0)])
+    return data_dir
+
+def test_rollups_match_group_by_after_a_full_load(tmp_path, data_dir):
+    db_path = str(tmp_path / "test.db")
+
+    PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES).run_pipeline(None)
+
+    assert_rollups_match_the_table(db_path)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT "SUM_PLAZAS", "FILAS" FROM "vut_prov_por_año_provincia" '
+                        'WHERE "AÑO" = 2019 AND "PROVINCIA" = \'Cádiz\'').fetchone() == (12.0, 2)
+    assert set(SQLiteRollups.describe(conn)) == set(EXPECTED)
+    conn.close()
+
+def test_rollups_match_group_by_after_an_incremental_sync(tmp_path, data_dir):
+    db_path = str(tmp_path / "test.db")
+    PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES).run_pipeline(None, sync=True)
+    assert_rollups_match_the_table(db_path)
+
+    # 2020 changes, with a new province, 2021 is removed and 2022 is added
+    write_datafile(data_dir, [("Cádiz", 2019, 1, 5.0), ("Cádiz", 2019, 2, 7.0), ("Soria", 2019, 1, 3.0),
+                              ("Cádiz", 2020, 1, 6.5), ("Huesca", 2020, 2, 2.0), ("Soria", 2022, 4, 8.0)])
+    PrepareSQLFromTabularData(str(data_dir), db_path, "latin_1", ";", DATAFILES).run_pipeline(None, sync=True)
+
+    assert_rollups_match_the_table(db_path)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT DISTINCT "AÑO" FROM "vut_prov_por_año_provincia" ORDER BY 1').fetchall() == \
+        [(2019,), (2020,), (2022,)]
+    conn.close()
+
+def test_refresh_recomputes_only_the_groups_of_the_partitions():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE t ("AÑO" INTEGER, "PROVINCIA" TEXT, "MES" INTEGER, "PLAZAS" REAL)')
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?, ?)", [(2019, "Cádiz", 1, 5.0), (2020, "Cádiz", 1, 4.0)])
+    rollups = SQLiteRollups({"t": [{"name": "t_anual", "group_by": ["AÑO", "PROVINCIA"], "measures": {"PLAZAS": "sum"}}]})
+    rollups.build(conn, "t")
+    # A group of an unchanged partition edited in the rollup shows which groups are recomputed
+    conn.execute('UPDATE t_anual SET "SUM_PLAZAS" = 0 WHERE "AÑO" = 2019')
+    conn.execute('UPDATE t SET "PLAZAS" = 9.0 WHERE "AÑO" = 2020')
+
+    rollups.refresh(conn, "t", ["AÑO"], [[2020]])
+
+    assert conn.execute('SELECT * FROM t_anual ORDER BY "AÑO"').fetchall() == [(2019, "Cádiz", 0.0, 1),
+                                                                               (2020, "Cádiz", 9.0, 1)]
+
+def test_unknown_aggregates_raise():
+    with pytest.raises(ValueError, match="median"):
+        SQLiteRollups({"t": [{"group_by": ["AÑO"], "measures": {"PLAZAS": "median"}}]})
@@ -0,0 +1,44 @@
+import threading
+import pytest
+
+from src.StreamingPipeline import StreamingPipeline
+
+def test_items_flow_through_every_stage_in_order():
+    output = []
+    pipeline = StreamingPipeline([("double", lambda x: x * 2), ("add", lambda x: x + 1), ("sink", output.append)])
+
+    stats = pipeline.run(range(100))
+
+    assert output == [x * 2 + 1 for x in range(100)]
+    assert stats["double"]["items"] == stats["add"]["items"] == stats["sink"]["items"] == 100
+
+def test_the_source_is_read_lazily_with_bounded_queues():
+    read = []
+    in_flight = []
+    release = threading.Event()
+
+    def source():
+        for i in range(50):
+            read.append(i)
+            yield i
+
+    def sink(item):
+        # The first item blocks the sink until the source has been read as far as the queues allow
+        if item == 0:
+            release.wait(timeout=1)
+        in_flight.append(len(read) - item)
+
+    StreamingPipeline([("pass", lambda x: x), ("sink", sink)], queue_size=2).run(source())
+    release.set()
+
+    # Never more than the queued items plus one per stage are read ahead of the sink
+    assert max(in_flight) <= 2 * 2 + 3
+
+def test_a_stage_error_stops_the_pipeline_and_is_raised():
+    def fail(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    with pytest.raises(ValueError, match="bad item"):
+        StreamingPipeline([("fail", fail), ("sink", lambda x: None)]).run(range(1000000))
@@ -0,0 +1,69 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.RowSerializer import RowSerializer
+from src.TabularChunker import TabularChunker
+from src.TokenCounter import TokenCounter
+
+class CharCounter(TokenCounter):
+    # Count 4 characters per token, without loading a tokenizer
+    def __init__(self) -> None:
+        self.model_name= None
+        self.encoding= None
+
+def make_df(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"PROVINCIA": ["Álava" if i % 2 else "Cádiz" for i in range(rows)],
+                         "AÑO": [2019 + i % 3 for i in range(rows)],
+                         "GASTO": [i * 1.5 for i in range(rows)]})
+
+@pytest.mark.parametrize("max_bytes, max_tokens", [(300, 8000), (16384, 60), (200, 40)])
+def test_chunks_fit_the_byte_and_token_budgets(max_bytes, max_tokens):
+    counter = CharCounter()
+    chunker = TabularChunker(RowSerializer("json"), max_bytes, max_tokens, counter)
+    df = make_df(100)
+
+    docs, first_rows, row_docs = chunker.chunk(df, df["PROVINCIA"], "gasto")
+
+    assert len(docs) > 1
+    for doc in docs:
+        assert len(doc.encode("utf-8")) <= max_bytes
+        assert counter.count(doc) <= max_tokens
+        json.loads(doc)
+    # Every row is in a single chunk of its group
+    assert len(row_docs) == len(df)
+    assert sum(len(json.loads(doc)["rows"]) for doc in docs) == len(df)
+    for doc in docs:
+        assert len({row["PROVINCIA"] for row in json.loads(doc)["rows"]}) == 1
+    assert np.array_equal(row_docs[first_rows], np.arange(len(docs)))
+
+def test_max_rows_limits_the_rows_of_a_chunk():
+    chunker = TabularChunker(RowSerializer("json"), 16384, 8000, CharCounter())
+    df = make_df(60)
+
+    docs, _, _ = chunker.chunk(df, pd.Series(["all"] * len(df)), "gasto", max_rows=25)
+
+    assert [len(json.loads(doc)["rows"]) for doc in docs] == [25, 25, 10]
+
+@pytest.mark.parametrize("template", RowSerializer.TEMPLATES)
+def test_an_oversized_row_is_shortened_into_a_valid_document(template):
+    chunker = TabularChunker(RowSerializer(template), 400, 8000, CharCounter())
+    df = pd.DataFrame({"PROVINCIA": ["Cádiz", "Álava"], "NOTA": ["corta", "ñ" * 2000], "AÑO": [2019, 2020]})
+
+    docs, _, _ = chunker.chunk(df, df["PROVINCIA"], "notas")
+
+    assert len(docs) == 2
+    for doc in docs:
+        assert len(doc.encode("utf-8")) <= 400
+    if template == "json":
+        rows = json.loads(docs[1])["rows"]
+        assert rows[0]["AÑO"] == 2020
+        assert rows[0]["NOTA"].startswith("ñ") and rows[0]["NOTA"].endswith("...")
+
+def test_a_row_that_can_not_be_shortened_raises():
+    chunker = TabularChunker(RowSerializer("json"), 100, 8000, CharCounter())
+    df = pd.DataFrame({f"COLUMNA_{i}": [i] for i in range(20)})
+
+    with pytest.raises(ValueError):
+        chunker.chunk(df, pd.Series(["all"]), "numeros")
@@ -0,0 +1,102 @@
+import asyncio
+
+import numpy as np
+import pytest
+from pymilvus import DataType, MilvusClient
+
+from src.VectorDB import SearchHit, VectorDB
+
+ENTITY = {"row": '{"AÑO": 2019}', "source": "vut_prov", "description": "VUT", "batch": 3, "partition": "2019",
+          "province": "Cádiz|Soria", "year_min": 2019, "year_max": 2019, "month_min": 1, "month_max": 12}
+
+class StubClient:
+    """
+    Returns the search results in the format of the Milvus client, and records the calls.
+    """
+    def __init__(self) -> None:
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return [[{"row_id": 10 + i, "distance": 0.9 - i / 10, "entity": ENTITY} for i in range(kwargs["limit"])]
+                for _ in kwargs["data"]]
+
+@pytest.fixture
+def vectordb(tmp_path):
+    vectordb = VectorDB(str(tmp_path / "milvus.db"), "")
+    vectordb.load_milvus_client()
+    return vectordb
+
+def create_old_collection(client: MilvusClient, collection_name: str, dim: int):
+    # The schema before the partition, province and range fields were added
+    schema = client.create_schema(auto_id= True)
+    schema.add_field("row_id", DataType.INT64, is_primary=True)
+    schema.add_field("batch", DataType.INT64)
+    schema.add_field("source", DataType.VARCHAR, max_length=100)
+    schema.add_field("row", DataType.VARCHAR, max_length=16384)
+    schema.add_field("description", DataType.VARCHAR, max_length=256)
+    schema.add_field("row_embedding", DataType.FLOAT_VECTOR, dim=dim)
+    index_params = client.prepare_index_params()
+    index_params.add_index("row_embedding", index_type="AUTOINDEX", metric_type="COSINE")
+    client.create_collection(collection_name, dimension=dim, schema=schema, index_params=index_params)
+
+def test_existing_collection_with_the_current_schema_is_kept(vectordb):
+    vectordb.prepare_vectordb("turismo", 4)
+    vectordb.insert("turismo", {"row_embedding": [[1.0, 0.0, 0.0, 0.0]], "row": ["a"], "source": ["vut_prov"],
+                                "description": ["VUT"], "batch": [0], "partition": [""], "province": [""],
+                                "year_min": [0], "year_max": [0], "month_min": [0], "month_max": [0]})
+    vectordb.flush("turismo")
+
+    vectordb.prepare_vectordb("turismo", 4, drop_existing=False)
+
+    assert vectordb.milvus_client.get_collection_stats("turismo")["row_count"] == 1
+
+def test_existing_collection_with_an_old_schema_raises(vectordb):
+    create_old_collection(vectordb.milvus_client, "turismo", 4)
+
+    with pytest.raises(ValueError, match="missing fields.*partition.*province.*year_min"):
+        vectordb.prepare_vectordb("turismo", 4, drop_existing=False)
+    with pytest.raises(ValueError, match="missing fields"):
+        vectordb.load_milvus_collection("turismo")
+
+def test_existing_collection_with_another_dimension_raises(vectordb):
+    vectordb.prepare_vectordb("turismo", 4)
+
+    with pytest.raises(ValueError, match=r"changed fields \['row_embedding'\]"):
+        vectordb.prepare_vectordb("turismo", 8, drop_existing=False)
+
+def test_drop_existing_recreates_an_old_collection(vectordb):
+    create_old_collection(vectordb.milvus_client, "turismo", 4)
+
+    vectordb.prepare_vectordb("turismo", 4)
+
+    vectordb.check_schema("turismo", 4)
+
+def test_search_maps_the_results_to_hits():
+    vectordb = VectorDB("unused.db", "")
+    vectordb.milvus_client = StubClient()
+
+    results = vectordb.search("turismo", [[1, 0, 0, 0], [0, 1, 0, 0]], 2, {"metric_type": "COSINE"},
+                              filter='source == "vut_prov"')
+
+    assert len(results) == 2
+    assert results[0] == [SearchHit(row_id=10, score=0.9, **ENTITY), SearchHit(row_id=11, score=0.8, **ENTITY)]
+    call = vectordb.milvus_client.calls[0]
+    assert call["output_fields"] == VectorDB.OUTPUT_FIELDS and call["anns_field"] == "row_embedding"
+    assert call["filter"] == 'source == "vut_prov"' and call["limit"] == 2
+    assert all(vector.dtype == np.float32 for vector in call["data"])
+    assert vectordb.get_docs_results("turismo", results) == [ENTITY["row"]] * 4
+    # Milvus Lite has no async client, the search runs in a thread
+    assert asyncio.run(vectordb.asearch("turismo", [[1, 0, 0, 0]], 1, {})) == [[results[0][0]]]
+
+def test_search_returns_the_output_fields_and_the_distance(vectordb):
+    vectordb.prepare_vectordb("turismo", 4)
+    vectordb.insert("turismo", {"row_embedding": [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]],
+                                **{field: [value, value] for field, value in ENTITY.items()}})
+    vectordb.flush("turismo")
+
+    hits = vectordb.search("turismo", [[1.0, 0.1, 0.0, 0.0]], 2, {"metric_type": "COSINE"})[0]
+
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+    assert hits[0].score == pytest.approx(1 / np.sqrt(1.01), abs=1e-4)
+    assert {field: getattr(hits[0], field) for field in VectorDB.OUTPUT_FIELDS} == ENTITY